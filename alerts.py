@@ -0,0 +1,247 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import bisect
+import os
+import time
+from dataclasses import dataclass
+
+from circuit_breaker import stale_age
+from delivery import broadcast
+from prices import fetch_prices
+from rate_scheduler import PRIORITY_BACKGROUND
+from rsi_tracker import rsi_tracker
+from shared_state import connect, owns_chat
+
+
+ALERTS_DB = os.getenv("ALERTS_DB", os.path.join("data", "alerts.sqlite3"))
+ALERT_CHECK_SECONDS = int(os.getenv("ALERT_CHECK_SECONDS", "60"))
+MAX_ALERTS_PER_CHAT = int(os.getenv("MAX_ALERTS_PER_CHAT", "50"))
+ALERT_RSI_PERIOD = 14
+
+PRICE = "price"
+RSI = "rsi"
+ABOVE = ">"
+BELOW = "<"
+
+
+@dataclass(frozen=True)
+class Alert:
+    __slots__ = ("id", "chat_id", "coin_id", "symbol", "metric", "op", "threshold")
+    id: int
+    chat_id: int
+    coin_id: str
+    symbol: str
+    metric: str
+    op: str
+    threshold: float
+
+    def describe(self):
+        label = "RSI" if self.metric == RSI else "price"
+        return f"#{self.id} {self.symbol.upper()} {label} {self.op} {self.threshold:g}"
+
+
+class ThresholdBook:
+    # Alerts for one (coin, metric), split by direction and kept sorted by
+    # threshold. The ones a new value triggers are always a contiguous run
+    # at one end, found with a binary search.
+    def __init__(self):
+        self.above = ([], [])  # thresholds ascending, alerts
+        self.below = ([], [])
+
+    def __len__(self):
+        return len(self.above[0]) + len(self.below[0])
+
+    def add(self, alert):
+        thresholds, alerts = self.above if alert.op == ABOVE else self.below
+        position = bisect.bisect_right(thresholds, alert.threshold)
+        thresholds.insert(position, alert.threshold)
+        alerts.insert(position, alert)
+
+    def remove(self, alert):
+        thresholds, alerts = self.above if alert.op == ABOVE else self.below
+        start = bisect.bisect_left(thresholds, alert.threshold)
+        for position in range(start, len(alerts)):
+            if alerts[position].id == alert.id:
+                del thresholds[position]
+                del alerts[position]
+                return
+
+    def pop_triggered(self, value):
+        thresholds, alerts = self.above
+        end = bisect.bisect_left(thresholds, value)
+        triggered = alerts[:end]
+        del thresholds[:end], alerts[:end]
+
+        thresholds, alerts = self.below
+        start = bisect.bisect_right(thresholds, value)
+        triggered += alerts[start:]
+        del thresholds[start:], alerts[start:]
+        return triggered
+
+
+class AlertBook:
+    def __init__(self, path=ALERTS_DB):
+        self.path = path
+        self._db = None
+        self._books = {}
+        self._by_id = {}
+        self._by_chat = {}
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def load(self):
+        self._db = connect(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS alerts ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, chat_id INTEGER NOT NULL, coin_id TEXT NOT NULL, "
+            "symbol TEXT NOT NULL, metric TEXT NOT NULL, op TEXT NOT NULL, threshold REAL NOT NULL, "
+            "created_at REAL NOT NULL)"
+        )
+        rows = self._db.execute("SELECT id, chat_id, coin_id, symbol, metric, op, threshold FROM alerts")
+        for row in rows:
+            alert = Alert(*row)
+            if owns_chat(alert.chat_id):
+                self._index(alert)
+
+    def _index(self, alert):
+        self._books.setdefault((alert.coin_id, alert.metric), ThresholdBook()).add(alert)
+        self._by_id[alert.id] = alert
+        self._by_chat.setdefault(alert.chat_id, {})[alert.id] = alert
+
+    def _unindex(self, alert):
+        key = (alert.coin_id, alert.metric)
+        book = self._books.get(key)
+        if book is not None:
+            book.remove(alert)
+            if not len(book):
+                del self._books[key]
+        self._by_id.pop(alert.id, None)
+        chat_alerts = self._by_chat.get(alert.chat_id, {})
+        chat_alerts.pop(alert.id, None)
+        if not chat_alerts:
+            self._by_chat.pop(alert.chat_id, None)
+
+    def for_chat(self, chat_id):
+        return sorted(self._by_chat.get(chat_id, {}).values(), key=lambda alert: alert.id)
+
+    def add(self, chat_id, coin_id, symbol, metric, op, threshold):
+        if len(self._by_chat.get(chat_id, {})) >= MAX_ALERTS_PER_CHAT:
+            return None
+        cursor = self._db.execute(
+            "INSERT INTO alerts (chat_id, coin_id, symbol, metric, op, threshold, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (chat_id, coin_id, symbol, metric, op, threshold, time.time()),
+        )
+        alert = Alert(cursor.lastrowid, chat_id, coin_id, symbol, metric, op, threshold)
+        self._index(alert)
+        return alert
+
+    def remove(self, chat_id, alert_id):
+        alert = self._by_chat.get(chat_id, {}).get(alert_id)
+        if alert is None:
+            return None
+        self._db.execute("DELETE FROM alerts WHERE id = ?", (alert_id,))
+        self._unindex(alert)
+        return alert
+
+    def coins(self, metric=None):
+        return {coin_id for coin_id, book_metric in self._books if metric is None or book_metric == metric}
+
+    def pop_triggered(self, coin_id, metric, value):
+        book = self._books.get((coin_id, metric))
+        if book is None:
+            return []
+        triggered = book.pop_triggered(value)
+        if triggered:
+            if not len(book):
+                del self._books[(coin_id, metric)]
+            for alert in triggered:
+                self._by_id.pop(alert.id, None)
+                chat_alerts = self._by_chat.get(alert.chat_id, {})
+                chat_alerts.pop(alert.id, None)
+                if not chat_alerts:
+                    self._by_chat.pop(alert.chat_id, None)
+            self._db.executemany("DELETE FROM alerts WHERE id = ?", [(alert.id,) for alert in triggered])
+        return triggered
+
+
+alert_book = AlertBook()
+
+
+def _fresh_price(prices, coin_id):
+    # A stale fallback price is whatever the last good response said, so it
+    # must not fire (and consume) an alert; the next fresh pass will.
+    entry = prices.get(coin_id) or {}
+    if stale_age(entry) is not None:
+        return None
+    return entry.get("usd")
+
+
+async def evaluate_alerts():
+    # One pass costs a /simple/price call per PRICE_BATCH_MAX_IDS distinct
+    # coins plus an O(log n) lookup per (coin, metric), however many alerts
+    # are registered.
+    coin_ids = alert_book.coins()
+    if not coin_ids:
+        return []
+    prices = await fetch_prices(coin_ids, priority=PRIORITY_BACKGROUND)
+
+    fired = []
+    for coin_id in coin_ids:
+        price = _fresh_price(prices, coin_id)
+        if price is None:
+            continue
+        fired += [(alert, price) for alert in alert_book.pop_triggered(coin_id, PRICE, price)]
+
+    for coin_id in alert_book.coins(RSI):
+        price = _fresh_price(prices, coin_id)
+        if price is None:
+            continue
+        try:
+            value = await rsi_tracker.value_at(coin_id, ALERT_RSI_PERIOD, price)
+        except Exception as e:
+            print(f"Error computing RSI for alerts on {coin_id}: {e}")
+            continue
+        if value is not None:
+            fired += [(alert, value) for alert in alert_book.pop_triggered(coin_id, RSI, value)]
+    return fired
+
+
+def format_triggered(alert, value):
+    if alert.metric == RSI:
+        current = f"RSI is now `{value:.2f}`"
+    else:
+        current = f"price is now `${value:,.8g}`"
+    return (
+        f"🚨 **Alert triggered** 🚨\n\n"
+        f"`{alert.describe()}`\n"
+        f"{alert.symbol.upper()} {current}"
+    )
+
+
+async def send_alert(context) -> None:
+    with broadcast():
+        await context.bot.send_message(context.job.chat_id, context.job.data, parse_mode="Markdown")
+
+
+async def check_alerts(context) -> None:
+    try:
+        fired = await evaluate_alerts()
+    except Exception as e:
+        print(f"Error checking alerts: {e}")
+        return
+    for alert, value in fired:
+        context.job_queue.run_once(send_alert, 0, data=format_triggered(alert, value), chat_id=alert.chat_id)
@@ -0,0 +1,72 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+
+
+def _consume_exception(future):
+    # Keeps asyncio from logging "exception was never retrieved" when every
+    # caller waiting on a key was cancelled before the batch failed.
+    if not future.cancelled():
+        future.exception()
+
+
+class MicroBatcher:
+    # Collects single-key lookups for up to ``window`` seconds (or until
+    # ``max_batch`` distinct keys are waiting) and resolves them all with one
+    # call to ``fetch_batch(keys) -> {key: result}``.
+    def __init__(self, fetch_batch, window, max_batch):
+        self.fetch_batch = fetch_batch
+        self.window = window
+        self.max_batch = max_batch
+        self._pending = {}
+        self._timer = None
+        self.batches = 0
+        self.requests = 0
+
+    async def get(self, key):
+        self.requests += 1
+        future = self._pending.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = loop.create_future()
+            future.add_done_callback(_consume_exception)
+            self._pending[key] = future
+            if len(self._pending) >= self.max_batch:
+                self._flush_now()
+            elif self._timer is None:
+                self._timer = loop.call_later(self.window, self._flush_now)
+        return await asyncio.shield(future)
+
+    def _flush_now(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending, self._pending = self._pending, {}
+        if pending:
+            asyncio.ensure_future(self._resolve(pending))
+
+    async def _resolve(self, pending):
+        self.batches += 1
+        try:
+            results = await self.fetch_batch(list(pending))
+        except Exception as e:
+            for future in pending.values():
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for key, future in pending.items():
+            if not future.done():
+                future.set_result(results.get(key))
@@ -0,0 +1,590 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Load test for the bot's hot paths. Starts local stand-ins for the CoinGecko
+# and DexScreener endpoints the bot uses, builds the real application with a
+# fake Bot API transport and feeds it concurrent command updates from many
+# simulated users. Nothing leaves the machine.
+#
+#   python benchmark.py --users 2000 --per-user 2 --latency-ms 80 --throttle-rate 0.02
+#
+# Prints throughput, per-command latency percentiles and upstream call counts;
+# --json writes the same report to a file for comparing runs.
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import zlib
+from collections import Counter, defaultdict
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from telegram.request import BaseRequest
+
+
+MS_PER_DAY = 86_400_000
+
+HOT_COINS = [
+    ("bitcoin", "btc", "Bitcoin"),
+    ("ethereum", "eth", "Ethereum"),
+    ("solana", "sol", "Solana"),
+    ("dogecoin", "doge", "Dogecoin"),
+    ("ripple", "xrp", "XRP"),
+    ("cardano", "ada", "Cardano"),
+    ("chainlink", "link", "Chainlink"),
+    ("pepe", "pepe", "Pepe"),
+]
+
+# Command name -> builder for the message text, given a random source and
+# the benchmark universe.
+WORKLOADS = {
+    "search": lambda rnd, universe: f"/search {universe.pick_symbol(rnd)}",
+    "rsi": lambda rnd, universe: f"/rsi {universe.pick_symbol(rnd)} 14d",
+    "bop": lambda rnd, universe: f"/bop {universe.pick_symbol(rnd)} {rnd.choice(['1', '7', '14', '30'])}",
+    "trade_info": lambda rnd, universe: f"/trade_info {universe.pick_address(rnd)}",
+    "trade_info_multi": lambda rnd, universe: "/trade_info " + " ".join(universe.pick_address(rnd) for _ in range(15)),
+    "token_orders": lambda rnd, universe: f"/token_orders solana {universe.pick_address(rnd)}",
+    "coin_details_name": lambda rnd, universe: f"/coin_details_name {universe.pick_symbol(rnd)}",
+    "trending": lambda rnd, universe: "/trending",
+    "dominance": lambda rnd, universe: "/dominance",
+    "categories": lambda rnd, universe: "/categories",
+    "companies": lambda rnd, universe: f"/companies {rnd.choice(['bitcoin', 'ethereum'])}",
+    "top_boosted_tokens": lambda rnd, universe: "/top_boosted_tokens",
+}
+DEFAULT_WORKLOAD = "search,rsi,bop,trade_info,coin_details_name,trending,dominance,token_orders"
+
+
+def _seeded(*parts):
+    return zlib.crc32("/".join(map(str, parts)).encode())
+
+
+class Universe:
+    # Deterministic fake market: every coin and token gets stable prices and
+    # history derived from its id.
+    def __init__(self, coins, tokens, hot_share):
+        self.coins = [{"id": coin_id, "symbol": symbol, "name": name} for coin_id, symbol, name in HOT_COINS]
+        self.coins += [{"id": f"token-{i}", "symbol": f"tk{i}", "name": f"Token {i}"} for i in range(coins)]
+        self.by_id = {coin["id"]: coin for coin in self.coins}
+        self.rank = {coin["id"]: rank for rank, coin in enumerate(self.coins, start=1)}
+        self.addresses = [f"So1{_seeded('token', i):010d}{i:06d}pump" for i in range(tokens)]
+        self.hot_share = hot_share
+
+    def pick_symbol(self, rnd):
+        if rnd.random() < self.hot_share:
+            return rnd.choice(HOT_COINS)[1]
+        return rnd.choice(self.coins)["symbol"]
+
+    def pick_address(self, rnd):
+        # Skewed so a few tokens are hot, like real launches.
+        return self.addresses[min(int(rnd.paretovariate(1.2)) - 1, len(self.addresses) - 1)]
+
+    def price(self, coin_id, at_ms=None):
+        base = 0.0001 + (_seeded(coin_id) % 1_000_000) / 10.0 / (self.rank.get(coin_id, 1000) ** 0.5)
+        if at_ms is None:
+            return base
+        phase = at_ms / MS_PER_DAY / 3 + _seeded(coin_id) % 97
+        return base * (1 + 0.1 * math.sin(phase) + 0.02 * math.sin(phase * 7.3))
+
+    def search(self, query):
+        query = query.lower()
+        matches = [coin for coin in self.coins if coin["symbol"] == query or coin["id"] == query]
+        matches += [coin for coin in self.coins[:200] if query in coin["name"].lower() and coin not in matches]
+        return {"coins": [dict(coin, market_cap_rank=self.rank[coin["id"]]) for coin in matches[:10]]}
+
+    def quote(self, coin_id):
+        price = self.price(coin_id)
+        return {
+            "usd": price,
+            "usd_market_cap": price * 1e7,
+            "usd_24h_vol": price * 1e5,
+            "usd_24h_change": (_seeded(coin_id, "change") % 2000) / 100 - 10,
+        }
+
+    def markets(self, page, per_page):
+        start = (page - 1) * per_page
+        markets = []
+        for coin in self.coins[start:start + per_page]:
+            quote = self.quote(coin["id"])
+            markets.append(dict(
+                coin,
+                current_price=quote["usd"],
+                market_cap=quote["usd_market_cap"],
+                market_cap_rank=self.rank[coin["id"]],
+                total_volume=quote["usd_24h_vol"],
+                price_change_percentage_24h=quote["usd_24h_change"],
+            ))
+        return markets
+
+    def market_chart(self, coin_id, days):
+        now = int(time.time() * 1000)
+        today = now - now % MS_PER_DAY
+        points = [[today - day * MS_PER_DAY, self.price(coin_id, today - day * MS_PER_DAY)] for day in range(days, 0, -1)]
+        return {"prices": points + [[now, self.price(coin_id, now)]]}
+
+    def ohlc(self, coin_id, days):
+        step = 30 * 60_000 if days <= 2 else 4 * 3_600_000
+        now = int(time.time() * 1000)
+        end = now - now % step
+        candles = []
+        for timestamp in range(end - days * MS_PER_DAY + step, end + step, step):
+            open_ = self.price(coin_id, timestamp - step)
+            close = self.price(coin_id, timestamp)
+            candles.append([timestamp, open_, max(open_, close) * 1.01, min(open_, close) * 0.99, close])
+        return candles
+
+    def details(self, coin_id):
+        coin = self.by_id.get(coin_id) or {"id": coin_id, "symbol": coin_id[:4], "name": coin_id}
+        price = self.price(coin["id"])
+        return {
+            "id": coin["id"],
+            "symbol": coin["symbol"],
+            "name": coin["name"],
+            "asset_platform_id": None,
+            "sentiment_votes_up_percentage": 71.5,
+            "sentiment_votes_down_percentage": 28.5,
+            "watchlist_portfolio_users": 12345,
+            "description": {"en": f"{coin['name']} is a benchmark coin. " * 20},
+            "market_data": {
+                "current_price": {"usd": price},
+                "total_supply": 21_000_000,
+                "max_supply": 21_000_000,
+                "circulating_supply": 19_000_000,
+                "market_cap": {"usd": price * 1.9e7},
+                "ath": {"usd": price * 1.5},
+                "atl": {"usd": price * 0.01},
+                "price_change_percentage_24h": 1.2345,
+            },
+            "tickers": [{
+                "base": coin["symbol"].upper(),
+                "target": "USDT",
+                "market": {"name": "Benchmark Exchange"},
+                "converted_last": {"usd": price},
+                "converted_volume": {"usd": price * 1e5},
+                "trust_score": "green",
+                "trade_url": "https://example.com/trade",
+            }],
+        }
+
+    def pair(self, address):
+        price = (_seeded(address) % 100_000) / 1e6
+        return {
+            "chainId": "solana",
+            "dexId": "raydium",
+            "url": f"https://dexscreener.com/solana/{address.lower()}",
+            "pairAddress": f"pair{address[-12:]}",
+            "baseToken": {"address": address, "symbol": f"T{_seeded(address) % 1000}", "name": "Bench"},
+            "quoteToken": {"symbol": "SOL"},
+            "priceNative": f"{price / 150:.10f}",
+            "priceUsd": f"{price:.8f}",
+            "txns": {window: {"buys": 10, "sells": 7} for window in ("m5", "h1", "h6", "h24")},
+            "volume": {window: 1234.5 for window in ("m5", "h1", "h6", "h24")},
+            "priceChange": {window: 2.5 for window in ("m5", "h1", "h6", "h24")},
+            "liquidity": {"usd": 50_000.0},
+            "marketCap": 1_000_000,
+            "fdv": 1_200_000,
+            "boosts": {"active": 10},
+        }
+
+    def boosts(self, count=30):
+        return [
+            {
+                "url": f"https://dexscreener.com/solana/{address.lower()}",
+                "chainId": "solana",
+                "tokenAddress": address,
+                "description": "Benchmark token",
+                "links": [{"type": "twitter", "url": "https://x.com/example"}],
+                "totalAmount": 500,
+            }
+            for address in self.addresses[:count]
+        ]
+
+
+def coingecko_routes(universe):
+    def coins_list(match, params):
+        return universe.coins
+
+    def markets(match, params):
+        return universe.markets(int(params.get("page", 1)), int(params.get("per_page", 100)))
+
+    def simple_price(match, params):
+        return {coin_id: universe.quote(coin_id) for coin_id in params.get("ids", "").split(",") if coin_id in universe.by_id}
+
+    def trending(match, params):
+        return {"coins": [
+            {"item": {
+                "name": coin["name"], "symbol": coin["symbol"], "market_cap_rank": universe.rank[coin["id"]],
+                "data": {"price": universe.price(coin["id"]), "market_cap": "$1,000,000", "market_cap_btc": "10.5",
+                         "total_volume": "$50,000", "total_volume_btc": "0.5"},
+            }}
+            for coin in universe.coins[:7]
+        ]}
+
+    def global_data(match, params):
+        return {"data": {
+            "active_cryptocurrencies": len(universe.coins),
+            "market_cap_percentage": {"btc": 54.1, "eth": 17.3, "usdt": 4.2},
+            "market_cap_change_percentage_24h_usd": 1.7,
+        }}
+
+    def categories(match, params):
+        return [
+            {"name": f"Category {i}", "market_cap": 1e9 / (i + 1), "market_cap_change_24h": 10.0 - i,
+             "top_3_coins_id": [coin["id"] for coin in universe.coins[i:i + 3]]}
+            for i in range(20)
+        ]
+
+    def companies(match, params):
+        return {
+            "total_holdings": 250_000, "total_value_usd": 1.5e10, "market_cap_dominance": 1.2,
+            "companies": [
+                {"name": f"Company {i}", "symbol": f"C{i}", "country": "US", "total_holdings": 1000 * (10 - i),
+                 "total_current_value_usd": 6e7 * (10 - i), "percentage_of_total_supply": 0.05}
+                for i in range(10)
+            ],
+        }
+
+    return [
+        (r"/coins/list", coins_list),
+        (r"/coins/markets", markets),
+        (r"/coins/categories", categories),
+        (r"/simple/price", simple_price),
+        (r"/search/trending", trending),
+        (r"/search", lambda match, params: universe.search(params.get("query", ""))),
+        (r"/global", global_data),
+        (r"/companies/public_treasury/[^/]+", companies),
+        (r"/coins/([^/]+)/market_chart", lambda match, params: universe.market_chart(match[1], int(params.get("days", 1)))),
+        (r"/coins/([^/]+)/ohlc", lambda match, params: universe.ohlc(match[1], int(params.get("days", 1)))),
+        (r"/coins/[^/]+/contract/([^/]+)", lambda match, params: universe.details(match[1])),
+        (r"/coins/([^/]+)", lambda match, params: universe.details(match[1])),
+    ]
+
+
+def dexscreener_routes(universe):
+    def tokens(match, params):
+        return {"schemaVersion": "1.0.0", "pairs": [universe.pair(address) for address in match[1].split(",")]}
+
+    def orders(match, params):
+        return [
+            {"type": order_type, "status": "approved", "paymentTimestamp": int(time.time() * 1000) - i * 3_600_000}
+            for i, order_type in enumerate(("tokenProfile", "tokenAd"))
+        ]
+
+    return [
+        (r"/latest/dex/tokens/([^/]+)", tokens),
+        (r"/tokens/v1/[^/]+/([^/]+)", lambda match, params: tokens(match, params)["pairs"]),
+        (r"/token-boosts/(top|latest)/v1", lambda match, params: universe.boosts()),
+        (r"/orders/v1/[^/]+/[^/]+", orders),
+    ]
+
+
+class MockUpstream:
+    # Minimal HTTP/1.1 server (keep-alive, GET only) with injected latency
+    # and 429 responses.
+    def __init__(self, name, routes, latency, jitter, throttle_rate):
+        self.name = name
+        self.routes = [
+            (re.compile(pattern + r"$"), re.sub(r"\(?\[\^/\]\+\)?", "{}", pattern), handler) for pattern, handler in routes
+        ]
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_rate = throttle_rate
+        self.calls = Counter()
+        self.throttled = Counter()
+        self.url = None
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.url = f"http://127.0.0.1:{self._server.sockets[0].getsockname()[1]}"
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    def reset(self):
+        self.calls.clear()
+        self.throttled.clear()
+
+    def _route(self, path):
+        for pattern, route, handler in self.routes:
+            match = pattern.match(path)
+            if match:
+                return route, handler, match
+        return path, None, None
+
+    async def _handle(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                while (await reader.readline()).strip():
+                    pass
+                target = request_line.decode("latin-1").split()[1]
+                parts = urlsplit(target)
+                path = unquote(parts.path)
+                params = {key: values[0] for key, values in parse_qs(parts.query).items()}
+                route, handler, match = self._route(path)
+
+                await asyncio.sleep(max(0.0, random.gauss(self.latency, self.jitter)))
+                self.calls[route] += 1
+                extra = ""
+                if random.random() < self.throttle_rate:
+                    self.throttled[route] += 1
+                    status, body, extra = "429 Too Many Requests", b'{"status": {"error_code": 429}}', "Retry-After: 1\r\n"
+                elif handler is None:
+                    status, body = "404 Not Found", b'{"error": "not found"}'
+                else:
+                    status, body = "200 OK", json.dumps(handler(match, params)).encode()
+                writer.write(
+                    f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\n{extra}"
+                    f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+                )
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+class FakeTelegramRequest(BaseRequest):
+    # Answers Bot API calls locally and records what the bot sent.
+    def __init__(self):
+        self.calls = Counter()
+        self.replies = Counter()
+        self._message_id = 0
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    async def do_request(self, url, method, request_data=None, read_timeout=None, write_timeout=None,
+                         connect_timeout=None, pool_timeout=None):
+        api_method = url.rsplit("/", 1)[-1]
+        self.calls[api_method] += 1
+        parameters = request_data.parameters if request_data is not None else {}
+        if api_method == "getMe":
+            result = {"id": 1, "is_bot": True, "first_name": "Pumpies", "username": "pumpies_benchmark_bot"}
+        elif api_method == "sendMessage":
+            text = str(parameters.get("text", ""))
+            self.replies[_classify_reply(text)] += 1
+            self._message_id += 1
+            result = {
+                "message_id": self._message_id,
+                "date": int(time.time()),
+                "chat": {"id": int(parameters.get("chat_id", 0)), "type": "private"},
+                "text": text,
+            }
+        else:
+            result = True
+        return 200, json.dumps({"ok": True, "result": result}).encode()
+
+
+def _classify_reply(text):
+    if "too quickly" in text:
+        return "rate_limited"
+    if "busy with other" in text:
+        return "busy"
+    if "error" in text.lower() or "unavailable" in text.lower():
+        return "error"
+    return "ok"
+
+
+def command_update(bot, update_id, user_id, text):
+    from telegram import Update
+
+    command = text.split()[0]
+    return Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": int(time.time()),
+            "chat": {"id": user_id, "type": "private"},
+            "from": {"id": user_id, "is_bot": False, "first_name": f"user{user_id}"},
+            "text": text,
+            "entities": [{"type": "bot_command", "offset": 0, "length": len(command)}],
+        },
+    }, bot)
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(math.ceil(fraction * len(ordered))) - 1)]
+
+
+def _summary(latencies):
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "max_ms": max(latencies, default=0.0) * 1000,
+    }
+
+
+def _configure_environment(args, coingecko, dexscreener, workdir):
+    # Must run before any bot module is imported: they read configuration at
+    # import time.
+    os.environ.update({
+        "COINGECKO_API_URL": coingecko.url,
+        "DEXSCREENER_API_URL": dexscreener.url,
+        "TELEGRAM_API_KEY": "123456:BENCHMARK",
+        "METRICS_PORT": "0",
+        "BOT_WORKERS": "1",
+        "TIMESERIES_DIR": os.path.join(workdir, "timeseries"),
+        "ALERTS_DB": os.path.join(workdir, "alerts.sqlite3"),
+        "SHARED_STATE_DB": os.path.join(workdir, "shared.sqlite3"),
+        "COINGECKO_RATE_PER_MINUTE": str(args.coingecko_rate),
+        "COINGECKO_BURST": str(max(1, int(args.coingecko_rate / 60))),
+        "DEXSCREENER_RATE_PER_MINUTE": str(args.dexscreener_rate),
+        "DEXSCREENER_BURST": str(max(1, int(args.dexscreener_rate / 60))),
+        "COIN_INDEX_RANKED_PAGES": "1",
+        # The fake Telegram has no flood limits; keep the send queue out of
+        # the way so the numbers measure the bot itself.
+        "SEND_GLOBAL_PER_SECOND": "100000",
+        "SEND_CHAT_PER_SECOND": "1000",
+        "SEND_CHAT_BURST": "100",
+    })
+
+
+async def run_benchmark(args):
+    rnd = random.Random(args.seed)
+    random.seed(args.seed)
+    universe = Universe(args.coins, args.tokens, args.hot_share)
+    latency, jitter = args.latency_ms / 1000, args.jitter_ms / 1000
+    coingecko = MockUpstream("coingecko", coingecko_routes(universe), latency, jitter, args.throttle_rate)
+    dexscreener = MockUpstream("dexscreener", dexscreener_routes(universe), latency, jitter, args.throttle_rate)
+    await coingecko.start()
+    await dexscreener.start()
+
+    with tempfile.TemporaryDirectory(prefix="pumpies-bench-") as workdir:
+        _configure_environment(args, coingecko, dexscreener, workdir)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        import main_tg_bot
+        from coin_index import refresh_coin_index
+        from http_client import close_clients
+
+        telegram = FakeTelegramRequest()
+        application = main_tg_bot.build_application(with_updater=False, request=telegram)
+        await application.initialize()
+        await refresh_coin_index()
+        coingecko.reset()
+        dexscreener.reset()
+
+        commands = [command.strip() for command in args.commands.split(",") if command.strip()]
+        unknown = [command for command in commands if command not in WORKLOADS]
+        if unknown:
+            raise SystemExit(f"Unknown commands: {', '.join(unknown)}. Choose from: {', '.join(WORKLOADS)}")
+        updates = []
+        for user in range(args.users):
+            user_id = 10_000 + user
+            for _ in range(args.per_user):
+                command = rnd.choice(commands)
+                updates.append((command, user_id, WORKLOADS[command](rnd, universe)))
+        rnd.shuffle(updates)
+
+        latencies = defaultdict(list)
+        semaphore = asyncio.Semaphore(args.concurrency)
+
+        async def handle(update_id, command, user_id, text):
+            async with semaphore:
+                update = command_update(application.bot, update_id, user_id, text)
+                started = time.perf_counter()
+                await application.process_update(update)
+                latencies[command].append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(
+            handle(update_id, command, user_id, text)
+            for update_id, (command, user_id, text) in enumerate(updates, start=1)
+        ))
+        elapsed = time.perf_counter() - started
+
+        await application.shutdown()
+        await close_clients()
+        await coingecko.stop()
+        await dexscreener.stop()
+
+    everything = [value for values in latencies.values() for value in values]
+    return {
+        "config": vars(args),
+        "updates": len(updates),
+        "elapsed_s": elapsed,
+        "throughput_per_s": len(updates) / elapsed if elapsed else 0.0,
+        "latency": _summary(everything),
+        "commands": {command: _summary(values) for command, values in sorted(latencies.items())},
+        "replies": dict(telegram.replies),
+        "upstream_calls": {
+            upstream.name: dict(upstream.calls.most_common()) for upstream in (coingecko, dexscreener)
+        },
+        "upstream_throttled": {
+            upstream.name: sum(upstream.throttled.values()) for upstream in (coingecko, dexscreener)
+        },
+    }
+
+
+def print_report(report):
+    print(f"\n{report['updates']} updates in {report['elapsed_s']:.2f}s "
+          f"-> {report['throughput_per_s']:.1f} updates/s")
+    print(f"replies: {report['replies']}")
+    print(f"\n{'command':<22}{'count':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for command, summary in list(report["commands"].items()) + [("ALL", report["latency"])]:
+        print(f"{command:<22}{summary['count']:>8}{summary['p50_ms']:>10.1f}{summary['p95_ms']:>10.1f}"
+              f"{summary['p99_ms']:>10.1f}{summary['max_ms']:>10.1f}")
+    for name, calls in report["upstream_calls"].items():
+        print(f"\n{name}: {sum(calls.values())} calls, {report['upstream_throttled'][name]} throttled (429)")
+        for route, count in calls.items():
+            print(f"  {route:<40}{count:>8}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test the bot against local mock upstreams.")
+    parser.add_argument("--users", type=int, default=2000, help="simulated Telegram users")
+    parser.add_argument("--per-user", type=int, default=2, help="commands sent by each user")
+    parser.add_argument("--concurrency", type=int, default=64, help="updates processed at once")
+    parser.add_argument("--commands", default=DEFAULT_WORKLOAD, help=f"comma-separated mix from: {', '.join(WORKLOADS)}")
+    parser.add_argument("--coins", type=int, default=5000, help="coins in the fake CoinGecko universe")
+    parser.add_argument("--tokens", type=int, default=2000, help="token addresses in the fake DexScreener universe")
+    parser.add_argument("--hot-share", type=float, default=0.8, help="share of coin lookups hitting the popular coins")
+    parser.add_argument("--latency-ms", type=float, default=50.0, help="mean upstream response latency")
+    parser.add_argument("--jitter-ms", type=float, default=15.0, help="standard deviation of upstream latency")
+    parser.add_argument("--throttle-rate", type=float, default=0.0, help="fraction of upstream calls answered with 429")
+    parser.add_argument("--coingecko-rate", type=float, default=6000.0, help="CoinGecko calls per minute the bot may make")
+    parser.add_argument("--dexscreener-rate", type=float, default=6000.0, help="DexScreener calls per minute the bot may make")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="also write the report to this file")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    report = asyncio.run(run_benchmark(args))
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as report_file:
+            json.dump(report, report_file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Background poller for DexScreener's latest-boosts feed. Each poll is
+# diffed against the (chain, token address) keys seen recently and only the
+# new boosts are pushed to the chats that subscribed with /subscribe_boosts.
+# The poll also keeps /latest_boosted_tokens served from memory.
+
+import os
+import time
+from collections import deque
+
+from telegram.error import Forbidden
+
+from circuit_breaker import stale_age
+from delivery import broadcast
+from http_client import DEXSCREENER, fetch_cached_json
+from prefetch import prefetcher
+from rate_scheduler import PRIORITY_BACKGROUND
+from rendering import BOOSTED_TOKENS, boosted_token_items, render, split_message
+from shared_state import SHARED_STATE, connect, owns_chat
+
+
+BOOSTS_DB = os.getenv("BOOSTS_DB", os.path.join("data", "boosts.sqlite3"))
+BOOST_POLL_SECONDS = int(os.getenv("BOOST_POLL_SECONDS", "30"))
+# Keys remembered for the diff; must comfortably exceed the feed's length
+# so a boost sliding back into the response isn't announced twice.
+BOOST_SEEN_KEYS = int(os.getenv("BOOST_SEEN_KEYS", "4096"))
+# New boosts listed in one push message.
+BOOST_PUSH_MAX = int(os.getenv("BOOST_PUSH_MAX", "5"))
+LATEST_BOOSTS_PATH = "/token-boosts/latest/v1"
+# With several workers each one polls; the shared cache turns that into one
+# upstream call per interval.
+_POLL_CACHE_TTL = BOOST_POLL_SECONDS / 2 if SHARED_STATE else 0
+
+
+class SeenKeys:
+    # Bounded set: a ring buffer of the last ``size`` keys plus a set for
+    # O(1) membership. The oldest key is forgotten first.
+    def __init__(self, size=BOOST_SEEN_KEYS):
+        self.size = size
+        self._order = deque()
+        self._keys = set()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def add(self, key):
+        if key in self._keys:
+            return False
+        self._keys.add(key)
+        self._order.append(key)
+        if len(self._order) > self.size:
+            self._keys.discard(self._order.popleft())
+        return True
+
+
+def boost_key(boost):
+    return (boost.get("chainId"), (boost.get("tokenAddress") or "").lower())
+
+
+class BoostFeed:
+    def __init__(self, path=BOOSTS_DB):
+        self.path = path
+        self.subscribers = set()
+        self.seen = SeenKeys()
+        self.primed = False
+        self._db = None
+
+    def load(self):
+        self._db = connect(self.path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS boost_subscriptions (chat_id INTEGER PRIMARY KEY, created_at REAL NOT NULL)"
+        )
+        for (chat_id,) in self._db.execute("SELECT chat_id FROM boost_subscriptions"):
+            if owns_chat(chat_id):
+                self.subscribers.add(chat_id)
+
+    def subscribe(self, chat_id):
+        if chat_id in self.subscribers:
+            return False
+        self._db.execute(
+            "INSERT OR IGNORE INTO boost_subscriptions (chat_id, created_at) VALUES (?, ?)", (chat_id, time.time())
+        )
+        self.subscribers.add(chat_id)
+        return True
+
+    def unsubscribe(self, chat_id):
+        if chat_id not in self.subscribers:
+            return False
+        self._db.execute("DELETE FROM boost_subscriptions WHERE chat_id = ?", (chat_id,))
+        self.subscribers.discard(chat_id)
+        return True
+
+    def diff(self, boosts):
+        # The feed lists the newest boost first. The first poll after
+        # start-up only fills ``seen``, so a restart doesn't re-announce the
+        # whole feed.
+        new = [boost for boost in reversed(boosts) if self.seen.add(boost_key(boost))]
+        if not self.primed:
+            self.primed = True
+            return []
+        return new[::-1]
+
+
+boost_feed = BoostFeed()
+
+
+async def send_boosts(context) -> None:
+    try:
+        with broadcast():
+            for chunk in split_message(context.job.data):
+                await context.bot.send_message(context.job.chat_id, chunk, parse_mode="Markdown")
+    except Forbidden:
+        # The bot was blocked or removed from the chat.
+        boost_feed.unsubscribe(context.job.chat_id)
+
+
+async def poll_boosts(context) -> None:
+    try:
+        data = await fetch_cached_json(DEXSCREENER, LATEST_BOOSTS_PATH, ttl=_POLL_CACHE_TTL, priority=PRIORITY_BACKGROUND)
+    except Exception as e:
+        print(f"Error polling boosts: {e}")
+        return
+    await prefetcher.put("latest_boosts", data)
+    if stale_age(data) is not None or not isinstance(data, list):
+        return
+
+    new = boost_feed.diff(data)
+    if not new or not boost_feed.subscribers:
+        return
+    message = render(BOOSTED_TOKENS, {"title": "New Boosted Tokens"}, boosted_token_items(new[:BOOST_PUSH_MAX]))
+    if len(new) > BOOST_PUSH_MAX:
+        message += f"\n…and {len(new) - BOOST_PUSH_MAX} more.\n"
+    for chat_id in boost_feed.subscribers:
+        context.job_queue.run_once(send_boosts, 0, data=message, chat_id=chat_id)
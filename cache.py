@@ -0,0 +1,221 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from circuit_breaker import stale_age
+from metrics import cache_requests
+from shared_state import connect
+
+
+# How long a worker holding the fetch lease for a key may take before the
+# other workers stop waiting for it and fetch themselves.
+LEASE_SECONDS = 10.0
+LEASE_POLL_SECONDS = 0.1
+
+
+def _resolve_ttl(ttl):
+    return ttl() if callable(ttl) else ttl
+
+
+class SQLiteCacheTier:
+    # Second cache level on disk: it survives restarts and is shared by all
+    # worker processes. Expiry uses the wall clock since entries outlive any
+    # single process. ``leases`` is only needed when several processes may
+    # fetch the same key at once.
+    #
+    # Every method is a coroutine: the queries, and the JSON encoding of
+    # payloads as large as /coins/list, run on one dedicated thread that owns
+    # the connection, so the event loop never waits on SQLite and statements
+    # from different callers never end up in each other's transactions.
+    PRUNE_EVERY = 500
+
+    def __init__(self, path, leases=True):
+        self.path = path
+        self.leases = leases
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cache-tier")
+        self._db = None
+        self._writes = 0
+
+    def _connection(self):
+        if self._db is None:
+            self._db = connect(self.path)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE TABLE IF NOT EXISTS leases (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        return self._db
+
+    async def _run(self, function, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, function, *args)
+
+    @staticmethod
+    def _key(key):
+        return json.dumps(key, default=str)
+
+    async def get(self, key):
+        return await self._run(self._get, key)
+
+    async def set(self, key, value, ttl):
+        await self._run(self._set_many, [(key, value)], ttl)
+
+    async def set_many(self, entries, ttl):
+        # One transaction for a batch of (key, value) pairs.
+        await self._run(self._set_many, entries, ttl)
+
+    async def try_lease(self, key, seconds=LEASE_SECONDS):
+        if not self.leases:
+            return True
+        return await self._run(self._try_lease, key, seconds)
+
+    async def release_lease(self, key):
+        if self.leases:
+            await self._run(self._release_lease, key)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    def _get(self, key):
+        row = self._connection().execute(
+            "SELECT expires_at, payload FROM responses WHERE key = ? AND expires_at > ?",
+            (self._key(key), time.time()),
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[1]), row[0] - time.time()
+
+    def _set_many(self, entries, ttl):
+        db = self._connection()
+        expires_at = time.time() + ttl
+        rows = [(self._key(key), expires_at, json.dumps(value)) for key, value in entries]
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany("INSERT OR REPLACE INTO responses (key, expires_at, payload) VALUES (?, ?, ?)", rows)
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        previous, self._writes = self._writes, self._writes + len(rows)
+        if previous // self.PRUNE_EVERY != self._writes // self.PRUNE_EVERY:
+            db.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),))
+
+    def _try_lease(self, key, seconds):
+        now = time.time()
+        cursor = self._connection().execute(
+            "INSERT INTO leases (key, expires_at) VALUES (?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at WHERE leases.expires_at <= ?",
+            (self._key(key), now + seconds, now),
+        )
+        return cursor.rowcount == 1
+
+    def _release_lease(self, key):
+        self._connection().execute("DELETE FROM leases WHERE key = ?", (self._key(key),))
+
+
+class ResponseCache:
+    def __init__(self, max_entries=512, shared=None, name="response"):
+        self.name = name
+        self.max_entries = max_entries
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._inflight = {}
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            cache_requests.inc(self.name, "miss")
+            return None
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._entries[key]
+            cache_requests.inc(self.name, "miss")
+            return None
+        self._entries.move_to_end(key)
+        cache_requests.inc(self.name, "hit")
+        return value
+
+    def peek(self, key):
+        # Like get(), without counting a lookup or refreshing the LRU order.
+        entry = self._entries.get(key)
+        return entry[1] if entry is not None and entry[0] > time.monotonic() else None
+
+    def set(self, key, value, ttl):
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, key):
+        self._entries.pop(key, None)
+
+    async def get_or_fetch(self, key, ttl, fetcher):
+        # ``ttl`` may be a callable, evaluated once the fetch has finished
+        # (for freshness that depends on the response).
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        if self.shared is not None:
+            entry = await self.shared.get(key)
+            cache_requests.inc("shared", "miss" if entry is None else "hit")
+            if entry is not None:
+                value, remaining_ttl = entry
+                self.set(key, value, remaining_ttl)
+                return value
+            fetcher = self._shared_fetcher(key, ttl, fetcher)
+
+        # Concurrent callers for the same key share one upstream fetch. The
+        # fetch runs as its own task so a cancelled caller doesn't abort it
+        # for everyone else waiting on the result.
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fetcher())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, ttl, done))
+        return await asyncio.shield(task)
+
+    def _shared_fetcher(self, key, ttl, fetcher):
+        # Across processes only the worker holding the lease goes upstream;
+        # the others poll the shared tier for its result.
+        async def fetch():
+            leased = await self.shared.try_lease(key)
+            if not leased:
+                deadline = time.monotonic() + LEASE_SECONDS
+                while time.monotonic() < deadline:
+                    await asyncio.sleep(LEASE_POLL_SECONDS)
+                    entry = await self.shared.get(key)
+                    if entry is not None:
+                        return entry[0]
+            try:
+                value = await fetcher()
+                if stale_age(value) is None:
+                    await self.shared.set(key, value, _resolve_ttl(ttl))
+                return value
+            finally:
+                if leased:
+                    await self.shared.release_lease(key)
+
+        return fetch
+
+    def _finish(self, key, ttl, task):
+        # Stale fallbacks are returned to the waiting callers but never
+        # cached, so the next request after the outage fetches fresh data.
+        self._inflight.pop(key, None)
+        if not task.cancelled() and task.exception() is None and stale_age(task.result()) is None:
+            self.set(key, task.result(), _resolve_ttl(ttl))
@@ -0,0 +1,190 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import os
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+
+import httpx
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# A breaker opens once at least BREAKER_MIN_CALLS of the last BREAKER_WINDOW
+# calls were made and BREAKER_FAILURE_RATIO of them failed. Calls slower than
+# BREAKER_SLOW_CALL_SECONDS count as failures even when they succeed.
+BREAKER_WINDOW = int(os.getenv("BREAKER_WINDOW", "20"))
+BREAKER_MIN_CALLS = int(os.getenv("BREAKER_MIN_CALLS", "5"))
+BREAKER_FAILURE_RATIO = float(os.getenv("BREAKER_FAILURE_RATIO", "0.5"))
+BREAKER_SLOW_CALL_SECONDS = float(os.getenv("BREAKER_SLOW_CALL_SECONDS", "5"))
+# How long an open breaker waits before probing; doubled after every failed
+# probe up to the maximum.
+BREAKER_OPEN_SECONDS = float(os.getenv("BREAKER_OPEN_SECONDS", "30"))
+BREAKER_MAX_OPEN_SECONDS = float(os.getenv("BREAKER_MAX_OPEN_SECONDS", "600"))
+
+
+class CircuitOpenError(httpx.HTTPError):
+    def __init__(self, name, retry_in):
+        super().__init__(f"{name} is temporarily unavailable, retrying in {int(retry_in) + 1}s")
+        self.retry_in = retry_in
+
+
+class StaleDict(dict):
+    stale_age = None
+
+
+class StaleList(list):
+    stale_age = None
+
+
+def mark_stale(value, age):
+    if isinstance(value, dict):
+        value = StaleDict(value)
+    elif isinstance(value, list):
+        value = StaleList(value)
+    else:
+        return value
+    value.stale_age = age
+    return value
+
+
+def stale_age(value):
+    # Seconds since a fallback response was last fetched successfully, or
+    # None for a fresh one.
+    return getattr(value, "stale_age", None)
+
+
+def is_unavailable(error):
+    # Errors a stale fallback may stand in for.
+    return isinstance(error, CircuitOpenError) or is_upstream_failure(error)
+
+
+def is_upstream_failure(error):
+    # Only rate limiting, server errors and transport problems say anything
+    # about the upstream's health; a 404 for an unknown coin doesn't.
+    if isinstance(error, httpx.HTTPStatusError):
+        status = error.response.status_code
+        return status == 429 or status >= 500
+    return isinstance(error, httpx.TransportError)
+
+
+def retry_after(error):
+    # Retry-After is either a number of seconds or an HTTP date.
+    if not isinstance(error, httpx.HTTPStatusError):
+        return None
+    value = error.response.headers.get("retry-after", "").strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    def __init__(self, name):
+        self.name = name
+        self.state = CLOSED
+        self.opened_until = 0.0
+        self.times_opened = 0
+        self._outcomes = deque(maxlen=BREAKER_WINDOW)
+        self._open_seconds = BREAKER_OPEN_SECONDS
+        self._probe = None
+        self._probe_timer = None
+        self._probe_task = None
+
+    @property
+    def retry_in(self):
+        return max(0.0, self.opened_until - time.monotonic())
+
+    def allow(self):
+        return self.state == CLOSED
+
+    def record_success(self, elapsed):
+        self._record(elapsed >= BREAKER_SLOW_CALL_SECONDS)
+
+    def record_failure(self, probe):
+        # ``probe`` re-issues the failed request; it runs in the background
+        # once the breaker has been open long enough.
+        self._probe = probe
+        self._record(True)
+
+    def trip(self, probe, hold=None):
+        self._probe = probe
+        if self.state == CLOSED:
+            self._open(hold)
+
+    def _record(self, failed):
+        # Calls that started before the breaker opened may still finish
+        # afterwards; only the probe decides when it closes again.
+        if self.state != CLOSED:
+            return
+        self._outcomes.append(failed)
+        if len(self._outcomes) >= BREAKER_MIN_CALLS and sum(self._outcomes) >= BREAKER_FAILURE_RATIO * len(self._outcomes):
+            self._open()
+
+    def _open(self, hold=None):
+        hold = self._open_seconds if hold is None else hold
+        self.state = OPEN
+        self.times_opened += 1
+        self.opened_until = time.monotonic() + hold
+        self._probe_timer = asyncio.get_running_loop().call_later(hold, self._start_probe)
+        print(f"Circuit {self.name} opened for {hold:.0f}s")
+
+    def _close(self):
+        self.state = CLOSED
+        self._outcomes.clear()
+        self._open_seconds = BREAKER_OPEN_SECONDS
+        print(f"Circuit {self.name} closed")
+
+    def _start_probe(self):
+        self._probe_timer = None
+        self._probe_task = asyncio.ensure_future(self._run_probe())
+
+    async def _run_probe(self):
+        self.state = HALF_OPEN
+        try:
+            if self._probe is not None:
+                await self._probe()
+        except Exception as e:
+            if isinstance(e, httpx.HTTPError) and not is_upstream_failure(e):
+                self._close()
+                return
+            self._open_seconds = min(self._open_seconds * 2, BREAKER_MAX_OPEN_SECONDS)
+            hold = retry_after(e) if isinstance(e, httpx.HTTPError) else None
+            self._open(hold)
+            return
+        self._close()
+
+    def cancel(self):
+        if self._probe_timer is not None:
+            self._probe_timer.cancel()
+            self._probe_timer = None
+        if self._probe_task is not None:
+            self._probe_task.cancel()
+            self._probe_task = None
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "failures": sum(self._outcomes),
+            "calls": len(self._outcomes),
+            "times_opened": self.times_opened,
+            "retry_in": self.retry_in,
+        }
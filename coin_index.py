@@ -0,0 +1,276 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import bisect
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Optional
+
+import http_client
+from http_client import COINGECKO, fetch_cached_json, fetch_json
+from metrics import cache_requests
+from rate_scheduler import PRIORITY_BACKGROUND
+from tracing import span
+
+
+COIN_INDEX_REFRESH_SECONDS = int(os.getenv("COIN_INDEX_REFRESH_SECONDS", "3600"))
+COIN_INDEX_RANKED_PAGES = int(os.getenv("COIN_INDEX_RANKED_PAGES", "4"))
+# Prices of the top coins by market cap, used for inline-query answers, are
+# refreshed this often from the first /coins/markets page.
+COIN_QUOTES_REFRESH_SECONDS = int(os.getenv("COIN_QUOTES_REFRESH_SECONDS", "300"))
+PREFIX_CACHE_MAX_ENTRIES = int(os.getenv("PREFIX_CACHE_MAX_ENTRIES", "4096"))
+# The index is snapshotted to the on-disk cache tier after every refresh and
+# restored from it at start-up; a snapshot older than this is ignored.
+COIN_INDEX_SNAPSHOT_MAX_AGE_SECONDS = int(os.getenv("COIN_INDEX_SNAPSHOT_MAX_AGE_SECONDS", "604800"))
+_SNAPSHOT_KEY = ("snapshot", "coin_index")
+_QUOTE_FIELDS = ("id", "current_price", "market_cap", "total_volume", "price_change_percentage_24h")
+
+_UNRANKED = float("inf")
+# Prefixes up to this length match a large share of the index, so their best
+# results are computed once per load instead of on every keystroke.
+_SHORT_PREFIX = 2
+_SHORT_PREFIX_RESULTS = 50
+
+
+@dataclass(frozen=True)
+class CoinEntry:
+    id: str
+    symbol: str
+    name: str
+    market_cap_rank: Optional[int] = None
+
+    @property
+    def sort_key(self):
+        rank = self.market_cap_rank if self.market_cap_rank is not None else _UNRANKED
+        return (rank, len(self.name), self.id)
+
+
+class CoinIndex:
+    def __init__(self):
+        self._by_id = {}
+        self._by_key = {}
+        self._sorted_keys = []
+        self._short_prefixes = {}
+        self._quotes = {}
+        self._prefix_cache = OrderedDict()
+
+    def __len__(self):
+        return len(self._by_id)
+
+    @property
+    def ready(self):
+        return bool(self._by_id)
+
+    def load(self, coins, ranks=None):
+        ranks = ranks or {}
+        by_id = {}
+        by_key = {}
+        for coin in coins:
+            coin_id = coin.get("id")
+            if not coin_id:
+                continue
+            entry = CoinEntry(
+                id=coin_id,
+                symbol=(coin.get("symbol") or "").lower(),
+                name=coin.get("name") or coin_id,
+                market_cap_rank=ranks.get(coin_id, coin.get("market_cap_rank")),
+            )
+            by_id[coin_id] = entry
+            for key in {coin_id, entry.symbol, entry.name.lower()}:
+                if key:
+                    by_key.setdefault(key, []).append(entry)
+
+        for entries in by_key.values():
+            entries.sort(key=lambda entry: entry.sort_key)
+
+        short_prefixes = {}
+        for entry in sorted(by_id.values(), key=lambda entry: entry.sort_key):
+            prefixes = {
+                key[:length]
+                for key in (entry.id, entry.symbol, entry.name.lower()) if key
+                for length in range(1, _SHORT_PREFIX + 1)
+            }
+            for prefix in prefixes:
+                bucket = short_prefixes.setdefault(prefix, [])
+                if len(bucket) < _SHORT_PREFIX_RESULTS:
+                    bucket.append(entry)
+
+        # Swap everything in at once so lookups never see a half-built index.
+        self._by_id, self._by_key, self._sorted_keys = by_id, by_key, sorted(by_key)
+        self._short_prefixes = short_prefixes
+        self._prefix_cache = OrderedDict()
+
+    def set_quotes(self, markets):
+        # Same shape as a /simple/price entry, so callers can use either.
+        for market in markets:
+            self._quotes[market["id"]] = {
+                "usd": market.get("current_price"),
+                "usd_market_cap": market.get("market_cap"),
+                "usd_24h_vol": market.get("total_volume"),
+                "usd_24h_change": market.get("price_change_percentage_24h"),
+            }
+
+    def quote(self, coin_id):
+        return self._quotes.get(coin_id)
+
+    def get(self, coin_id):
+        return self._by_id.get(coin_id)
+
+    def exact(self, query):
+        entries = self._by_key.get(query.strip().lower())
+        return entries[0] if entries else None
+
+    def prefix(self, query, limit=10):
+        prefix = query.strip().lower()
+        if not prefix:
+            return []
+        if len(prefix) <= _SHORT_PREFIX and limit <= _SHORT_PREFIX_RESULTS:
+            return self._short_prefixes.get(prefix, [])[:limit]
+        # Inline queries repeat the same few prefixes as users type.
+        cache_key = (prefix, limit)
+        cached = self._prefix_cache.get(cache_key)
+        if cached is not None:
+            self._prefix_cache.move_to_end(cache_key)
+            cache_requests.inc("coin_prefix", "hit")
+            return cached
+        cache_requests.inc("coin_prefix", "miss")
+
+        start = bisect.bisect_left(self._sorted_keys, prefix)
+        end = bisect.bisect_left(self._sorted_keys, prefix + "\uffff", lo=start)
+        seen = {}
+        for key in self._sorted_keys[start:end]:
+            for entry in self._by_key[key]:
+                seen[entry.id] = entry
+        entries = sorted(seen.values(), key=lambda entry: entry.sort_key)[:limit]
+        self._prefix_cache[cache_key] = entries
+        if len(self._prefix_cache) > PREFIX_CACHE_MAX_ENTRIES:
+            self._prefix_cache.popitem(last=False)
+        return entries
+
+    def search(self, query, limit=10):
+        key = query.strip().lower()
+        exact = list(self._by_key.get(key, []))
+        exact_ids = {entry.id for entry in exact}
+        ranked = [entry for entry in self.prefix(key, limit + len(exact)) if entry.id not in exact_ids]
+        return (exact + ranked)[:limit]
+
+    def lookup(self, query):
+        return self.exact(query) or next(iter(self.prefix(query, 1)), None)
+
+
+coin_index = CoinIndex()
+
+
+def _shared_ttl(interval):
+    # Lets restarts and other worker processes reuse a refresh through the
+    # on-disk cache tier; without it a refresh always fetches fresh.
+    return interval / 2 if http_client.cache_tier is not None else 0
+
+
+async def fetch_ranked_markets(pages=COIN_INDEX_RANKED_PAGES, ttl=None):
+    if ttl is None:
+        ttl = _shared_ttl(COIN_INDEX_REFRESH_SECONDS)
+    ranked = []
+    for page in range(1, pages + 1):
+        markets = await fetch_cached_json(COINGECKO, "/coins/markets", params={
+            "vs_currency": "usd",
+            "order": "market_cap_desc",
+            "per_page": 250,
+            "page": page,
+        }, ttl=ttl, priority=PRIORITY_BACKGROUND)
+        ranked += markets
+        if len(markets) < 250:
+            break
+    return ranked
+
+
+async def save_snapshot(coins, ranks, markets):
+    cache_tier = http_client.cache_tier
+    if cache_tier is None:
+        return
+    snapshot = {
+        "fetched_at": time.time(),
+        "coins": [{"id": coin.get("id"), "symbol": coin.get("symbol"), "name": coin.get("name")} for coin in coins],
+        "ranks": ranks,
+        "markets": [{field: market.get(field) for field in _QUOTE_FIELDS} for market in markets],
+    }
+    await cache_tier.set(_SNAPSHOT_KEY, snapshot, COIN_INDEX_SNAPSHOT_MAX_AGE_SECONDS)
+
+
+async def restore_snapshot():
+    # Returns the snapshot's age in seconds, or None when there is none.
+    cache_tier = http_client.cache_tier
+    entry = await cache_tier.get(_SNAPSHOT_KEY) if cache_tier is not None else None
+    if entry is None:
+        return None
+    snapshot = entry[0]
+    coin_index.load(snapshot["coins"], snapshot["ranks"])
+    coin_index.set_quotes(snapshot["markets"])
+    return time.time() - snapshot["fetched_at"]
+
+
+async def refresh_coin_index(context=None) -> None:
+    if not coin_index.ready:
+        # First run after start-up: serve from the last snapshot right away
+        # and only go upstream if it is due for a refresh anyway.
+        try:
+            age = await restore_snapshot()
+        except Exception as e:
+            print(f"Error restoring coin index snapshot: {e}")
+            age = None
+        if age is not None and age < COIN_INDEX_REFRESH_SECONDS:
+            return
+
+    try:
+        coins = await fetch_cached_json(COINGECKO, "/coins/list", ttl=_shared_ttl(COIN_INDEX_REFRESH_SECONDS), priority=PRIORITY_BACKGROUND)
+        markets = await fetch_ranked_markets()
+    except Exception as e:
+        print(f"Error refreshing coin index: {e}")
+        return
+    ranks = {market["id"]: market["market_cap_rank"] for market in markets if market.get("market_cap_rank") is not None}
+    coin_index.load(coins, ranks)
+    coin_index.set_quotes(markets)
+    await save_snapshot(coins, ranks, markets)
+
+
+async def refresh_coin_quotes(context=None) -> None:
+    try:
+        markets = await fetch_ranked_markets(pages=1, ttl=_shared_ttl(COIN_QUOTES_REFRESH_SECONDS))
+    except Exception as e:
+        print(f"Error refreshing coin quotes: {e}")
+        return
+    coin_index.set_quotes(markets)
+
+
+async def resolve_coin(query):
+    if coin_index.ready:
+        with span("coin_index.lookup"):
+            return coin_index.lookup(query)
+
+    # The index is still loading (first seconds after start-up), so fall back
+    # to CoinGecko's search endpoint for this one request.
+    search_data = await fetch_json(COINGECKO, "/search", params={"query": query})
+    coins_list = search_data.get("coins", [])
+    if not coins_list:
+        return None
+    first_coin = coins_list[0]
+    return CoinEntry(
+        id=first_coin.get("id") or first_coin.get("api_symbol"),
+        symbol=(first_coin.get("symbol") or "").lower(),
+        name=first_coin.get("name"),
+        market_cap_rank=first_coin.get("market_cap_rank"),
+    )
@@ -0,0 +1,231 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+# Outbound Telegram delivery. Every Bot API call that posts into a chat
+# waits here for a token from the bot-wide bucket and from that chat's
+# bucket, so replies and broadcasts stay under Telegram's flood limits
+# instead of failing with RetryAfter. Interactive replies go ahead of
+# broadcasts: wrap job sends in ``with broadcast():``. A 429 from Telegram
+# pauses all sending for its retry_after and the message is retried.
+
+import asyncio
+import contextvars
+import heapq
+import itertools
+import json
+import os
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from telegram.request import BaseRequest
+
+from metrics import Counter, Gauge, Histogram, register_collector
+from rate_limit import SQLiteBucketStore
+from rate_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, SharedTokenBucket, TokenBucket, WaitStats
+from shared_state import SHARED_STATE, SHARED_STATE_DB
+
+
+# Telegram allows about 30 messages a second per bot, one a second per
+# private chat (short bursts are tolerated) and 20 a minute per group.
+SEND_GLOBAL_PER_SECOND = float(os.getenv("SEND_GLOBAL_PER_SECOND", "30"))
+SEND_CHAT_PER_SECOND = float(os.getenv("SEND_CHAT_PER_SECOND", "1"))
+SEND_GROUP_PER_MINUTE = float(os.getenv("SEND_GROUP_PER_MINUTE", "20"))
+SEND_CHAT_BURST = int(os.getenv("SEND_CHAT_BURST", "3"))
+# Per-chat buckets kept; the least recently used (by then full) are dropped.
+SEND_CHAT_BUCKETS = int(os.getenv("SEND_CHAT_BUCKETS", "10000"))
+SEND_MAX_RETRIES = int(os.getenv("SEND_MAX_RETRIES", "3"))
+
+# Bot API methods that post into a chat and count against its limits.
+_QUEUED_METHOD_PREFIXES = ("send", "forward", "copy", "edit")
+_PRIORITY_LABELS = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_BACKGROUND: "broadcast"}
+
+_priority = contextvars.ContextVar("send_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def broadcast():
+    token = _priority.set(PRIORITY_BACKGROUND)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+class SendQueue:
+    def __init__(self, global_bucket):
+        self.global_bucket = global_bucket
+        self.wait_stats = WaitStats()
+        self.paused_until = 0.0
+        self._chat_buckets = OrderedDict()
+        # (priority, seq, chat_id, future), and the same prefixed with the
+        # time a chat's bucket has a token again.
+        self._ready = []
+        self._deferred = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+
+    def depth(self):
+        counts = dict.fromkeys(_PRIORITY_LABELS.values(), 0)
+        for entry in self._ready + [entry[1:] for entry in self._deferred]:
+            if not entry[3].done():
+                label = _PRIORITY_LABELS.get(entry[0], "broadcast")
+                counts[label] += 1
+        return counts
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            is_group = isinstance(chat_id, str) or chat_id < 0
+            rate = SEND_GROUP_PER_MINUTE / 60 if is_group else SEND_CHAT_PER_SECOND
+            bucket = self._chat_buckets[chat_id] = TokenBucket(rate, SEND_CHAT_BURST)
+            if len(self._chat_buckets) > SEND_CHAT_BUCKETS:
+                self._chat_buckets.popitem(last=False)
+        else:
+            self._chat_buckets.move_to_end(chat_id)
+        return bucket
+
+    async def acquire(self, chat_id, priority=PRIORITY_INTERACTIVE):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        future = loop.create_future()
+        heapq.heappush(self._ready, (priority, next(self._seq), chat_id, future))
+        self._wakeup.set()
+
+        started = time.monotonic()
+        await future
+        wait = time.monotonic() - started
+        self.wait_stats.record(wait)
+        send_wait.observe(wait, _PRIORITY_LABELS.get(priority, "broadcast"))
+        return wait
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    async def _sleep(self, timeout):
+        # Returns early when a new message is queued, so an interactive reply
+        # is considered before the sleep would have ended.
+        self._wakeup.clear()
+        try:
+            await asyncio.wait_for(self._wakeup.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _dispatch(self):
+        while True:
+            now = time.monotonic()
+            while self._deferred and self._deferred[0][0] <= now:
+                heapq.heappush(self._ready, heapq.heappop(self._deferred)[1:])
+
+            if not self._ready:
+                await self._sleep(self._deferred[0][0] - now if self._deferred else None)
+                continue
+            if now < self.paused_until:
+                await asyncio.sleep(self.paused_until - now)
+                continue
+
+            priority, seq, chat_id, future = self._ready[0]
+            if future.done():
+                heapq.heappop(self._ready)
+                continue
+
+            chat_bucket = self._chat_bucket(chat_id)
+            delay = chat_bucket.try_acquire()
+            if delay:
+                # Only this chat is over its limit; let other chats through.
+                heapq.heappop(self._ready)
+                heapq.heappush(self._deferred, (now + delay, priority, seq, chat_id, future))
+                continue
+
+            delay = self.global_bucket.try_acquire()
+            if delay:
+                chat_bucket.refund()
+                await self._sleep(delay)
+                continue
+
+            heapq.heappop(self._ready)
+            future.set_result(None)
+
+
+def _retry_after(payload):
+    try:
+        return float(json.loads(payload)["parameters"]["retry_after"])
+    except (ValueError, KeyError, TypeError):
+        return None
+
+
+class QueuedRequest(BaseRequest):
+    # Wraps the Bot API transport; calls that don't post into a chat (getMe,
+    # answerInlineQuery, ...) pass straight through.
+    def __init__(self, request, queue):
+        self.request = request
+        self.queue = queue
+
+    async def initialize(self):
+        await self.request.initialize()
+
+    async def shutdown(self):
+        self.queue.close()
+        await self.request.shutdown()
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        endpoint = url.rsplit("/", 1)[-1]
+        chat_id = request_data.parameters.get("chat_id") if request_data is not None else None
+        if chat_id is None or not endpoint.startswith(_QUEUED_METHOD_PREFIXES):
+            return await self.request.do_request(url, method, request_data, *args, **kwargs)
+
+        priority = _priority.get()
+        for attempt in range(SEND_MAX_RETRIES + 1):
+            await self.queue.acquire(chat_id, priority)
+            status, payload = await self.request.do_request(url, method, request_data, *args, **kwargs)
+            retry_after = _retry_after(payload) if status == 429 else None
+            if retry_after is None or attempt == SEND_MAX_RETRIES:
+                return status, payload
+            send_retries.inc(_PRIORITY_LABELS.get(priority, "broadcast"))
+            self.queue.pause(retry_after)
+
+
+def _global_bucket():
+    if SHARED_STATE:
+        # The limit is per bot, so every worker draws from one bucket.
+        store = SQLiteBucketStore(SHARED_STATE_DB)
+        return SharedTokenBucket(store, "telegram:send", SEND_GLOBAL_PER_SECOND, SEND_GLOBAL_PER_SECOND)
+    return TokenBucket(SEND_GLOBAL_PER_SECOND, SEND_GLOBAL_PER_SECOND)
+
+
+send_queue = SendQueue(_global_bucket())
+
+send_queued = Gauge("pumpies_send_queue_depth", "Outbound Telegram messages waiting to be sent.", ["priority"])
+send_wait = Histogram("pumpies_send_queue_wait_seconds", "Time outbound messages waited for a send slot.", ["priority"])
+send_retries = Counter("pumpies_send_retry_after_total", "Sends Telegram answered with RetryAfter.", ["priority"])
+send_paused = Gauge("pumpies_send_paused_seconds", "Seconds left before sending resumes after a RetryAfter.")
+
+
+def _collect_metrics():
+    for label, count in send_queue.depth().items():
+        send_queued.set(count, label)
+    send_paused.set(max(0.0, send_queue.paused_until - time.monotonic()))
+
+
+register_collector(_collect_metrics)
@@ -0,0 +1,436 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import hashlib
+import os
+import time
+
+import httpx
+import orjson
+
+from cache import ResponseCache, SQLiteCacheTier
+from circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    is_upstream_failure,
+    mark_stale,
+    retry_after,
+)
+from metrics import Gauge, register_collector, upstream_latency, upstream_responses
+from rate_limit import SQLiteBucketStore
+from rate_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, SharedTokenBucket, TokenBucket, UpstreamScheduler
+from shared_state import SHARED_STATE, SHARED_STATE_DB
+from tracing import span
+
+
+COINGECKO = "coingecko"
+DEXSCREENER = "dexscreener"
+
+PROVIDER_BASE_URLS = {
+    COINGECKO: os.getenv("COINGECKO_API_URL", "https://api.coingecko.com/api/v3"),
+    DEXSCREENER: os.getenv("DEXSCREENER_API_URL", "https://api.dexscreener.com"),
+}
+
+HTTP_TIMEOUT = httpx.Timeout(float(os.getenv("HTTP_TIMEOUT_SECONDS", "10")), connect=5.0)
+HTTP_LIMITS = httpx.Limits(
+    max_connections=int(os.getenv("HTTP_MAX_CONNECTIONS", "50")),
+    max_keepalive_connections=int(os.getenv("HTTP_MAX_KEEPALIVE", "20")),
+    keepalive_expiry=30.0,
+)
+
+# Upstream quotas shared by every handler and background job. CoinGecko's
+# public/demo tier allows roughly 30 calls a minute, DexScreener 300.
+COINGECKO_RATE_PER_MINUTE = float(os.getenv("COINGECKO_RATE_PER_MINUTE", "30"))
+COINGECKO_BURST = int(os.getenv("COINGECKO_BURST", "5"))
+DEXSCREENER_RATE_PER_MINUTE = float(os.getenv("DEXSCREENER_RATE_PER_MINUTE", "300"))
+DEXSCREENER_BURST = int(os.getenv("DEXSCREENER_BURST", "10"))
+# A 429 pauses the provider's queue for its Retry-After (or
+# THROTTLE_PAUSE_SECONDS without one) and the request is retried, up to
+# THROTTLE_RETRIES times. A Retry-After longer than THROTTLE_MAX_PAUSE_SECONDS
+# is too long to keep users waiting, so the provider breaker opens instead.
+THROTTLE_PAUSE_SECONDS = float(os.getenv("THROTTLE_PAUSE_SECONDS", "5"))
+THROTTLE_MAX_PAUSE_SECONDS = float(os.getenv("THROTTLE_MAX_PAUSE_SECONDS", "10"))
+THROTTLE_RETRIES = int(os.getenv("THROTTLE_RETRIES", "2"))
+
+# Seconds a cached response stays fresh, as (min, max) per endpoint (see
+# _endpoint). Market-wide payloads are the same for every user, so a burst of
+# /trending commands only costs one upstream call. Freshness adapts between
+# the bounds: it doubles whenever a revalidation finds the data unchanged and
+# halves when it changed, so slow-moving data is refetched rarely. It never
+# drops below the max-age the upstream sent. Override with e.g.
+# CACHE_TTLS="/global=120,/coins/categories=300:7200".
+CACHE_TTLS = {
+    "/search/trending": (60, 300),
+    "/global": (60, 300),
+    "/coins/categories": (300, 3600),
+    "/companies/public_treasury/{}": (900, 21600),
+    "/token-boosts/top/v1": (60, 300),
+    "/token-boosts/latest/v1": (30, 120),
+}
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", "512"))
+
+# The last good response per request is kept this long to answer with while
+# the upstream is failing or its circuit breaker is open.
+STALE_MAX_AGE_SECONDS = float(os.getenv("STALE_MAX_AGE_SECONDS", "21600"))
+LAST_GOOD_MAX_ENTRIES = int(os.getenv("LAST_GOOD_MAX_ENTRIES", "256"))
+# Coins and token addresses with a remembered price or pair (LastGoodItems).
+LAST_GOOD_ITEMS_MAX_ENTRIES = int(os.getenv("LAST_GOOD_ITEMS_MAX_ENTRIES", "4096"))
+# Cached responses, last good responses and the coin index snapshot are also
+# written to SHARED_STATE_DB, so a restarted bot starts warm instead of
+# sending its first users straight to the upstreams. Always on with several
+# workers, where the same database is what they share.
+PERSISTENT_CACHE = SHARED_STATE or os.getenv("PERSISTENT_CACHE", "1") == "1"
+# Last good responses to persist are queued and written in one batch this
+# often, off the event loop.
+LAST_GOOD_FLUSH_SECONDS = float(os.getenv("LAST_GOOD_FLUSH_SECONDS", "30"))
+
+# Literal path segments; anything else (coin ids, addresses, chains) is a
+# parameter, so e.g. every /coins/{id} request shares one breaker.
+_ENDPOINT_SEGMENTS = {
+    "search", "trending", "global", "coins", "categories", "list", "markets", "market_chart", "ohlc",
+    "contract", "simple", "price", "companies", "public_treasury", "token-boosts", "top", "latest",
+    "v1", "orders", "dex", "tokens",
+}
+
+_clients = {}
+_breakers = {}
+_freshness = {}
+# Endpoints whose last good response is persisted (see persist_last_good).
+_persisted_endpoints = set()
+_pending_last_good = {}
+
+
+class Freshness:
+    def __init__(self, low, high):
+        self.low = low
+        self.high = high
+        self.ttl = low
+
+    def observe(self, changed):
+        self.ttl = max(self.low, self.ttl / 2) if changed else min(self.high, self.ttl * 2)
+
+
+def _load_ttl_overrides():
+    for item in os.getenv("CACHE_TTLS", "").split(","):
+        path, _, ttl = item.strip().partition("=")
+        if path and ttl:
+            low, _, high = ttl.partition(":")
+            CACHE_TTLS[path] = (float(low), float(high or low))
+
+
+_load_ttl_overrides()
+
+
+def _upstream_bucket(provider, per_minute, burst):
+    if SHARED_STATE:
+        return SharedTokenBucket(_shared_buckets, f"upstream:{provider}", per_minute / 60, burst)
+    return TokenBucket(per_minute / 60, burst)
+
+
+_shared_buckets = SQLiteBucketStore(SHARED_STATE_DB) if SHARED_STATE else None
+# Opened by enable_persistent_cache().
+cache_tier = None
+response_cache = ResponseCache(CACHE_MAX_ENTRIES)
+last_good = ResponseCache(LAST_GOOD_MAX_ENTRIES, name="last_good")
+upstream_scheduler = UpstreamScheduler({
+    COINGECKO: _upstream_bucket(COINGECKO, COINGECKO_RATE_PER_MINUTE, COINGECKO_BURST),
+    DEXSCREENER: _upstream_bucket(DEXSCREENER, DEXSCREENER_RATE_PER_MINUTE, DEXSCREENER_BURST),
+})
+
+
+def enable_persistent_cache():
+    # Called when the application is built, so importing this module never
+    # opens the database.
+    global cache_tier
+    if PERSISTENT_CACHE and cache_tier is None:
+        cache_tier = SQLiteCacheTier(SHARED_STATE_DB, leases=SHARED_STATE)
+        response_cache.shared = cache_tier
+    return cache_tier
+
+
+def persist_last_good(path):
+    # Only data needed right after a restart (prefetched datasets, the coin
+    # index) is worth a disk write per response.
+    _persisted_endpoints.add(_endpoint(path))
+
+
+async def flush_last_good(context=None) -> None:
+    if cache_tier is None or not _pending_last_good:
+        return
+    entries = list(_pending_last_good.items())
+    _pending_last_good.clear()
+    try:
+        await cache_tier.set_many(entries, STALE_MAX_AGE_SECONDS)
+    except Exception as e:
+        print(f"Error persisting last good responses: {e}")
+
+
+class LastGoodItems:
+    # Last good value per item of a batched endpoint (one coin of a
+    # /simple/price call, one address of /latest/dex/tokens). Batches mix
+    # different users' lookups, so the per-request last good response
+    # almost never matches the batch that fails.
+    def __init__(self, name, max_entries=LAST_GOOD_ITEMS_MAX_ENTRIES):
+        self._entries = ResponseCache(max_entries, name=name)
+
+    def remember(self, items):
+        now = time.time()
+        for key, value in items.items():
+            self._entries.set(key, (now, value), STALE_MAX_AGE_SECONDS)
+
+    def recall(self, keys):
+        # The remembered values for ``keys``, marked stale.
+        now = time.time()
+        items = {}
+        for key in keys:
+            entry = self._entries.get(key)
+            if entry is not None:
+                items[key] = mark_stale(entry[1], now - entry[0])
+        return items
+
+
+def _default_headers(provider):
+    headers = {"accept": "application/json"}
+    if provider == COINGECKO:
+        cg_api_key = os.getenv("CG_API_KEY")
+        if cg_api_key:
+            headers["x-cg-demo-api-key"] = cg_api_key
+    return headers
+
+
+def get_client(provider):
+    client = _clients.get(provider)
+    if client is None or client.is_closed:
+        client = httpx.AsyncClient(
+            base_url=PROVIDER_BASE_URLS[provider],
+            headers=_default_headers(provider),
+            timeout=HTTP_TIMEOUT,
+            limits=HTTP_LIMITS,
+        )
+        _clients[provider] = client
+    return client
+
+
+def _endpoint(path):
+    return "/".join(segment if not segment or segment in _ENDPOINT_SEGMENTS else "{}" for segment in path.split("/"))
+
+
+def get_breaker(provider, path=None):
+    # One breaker per provider (tripped by 429s, since the quota is shared)
+    # and one per endpoint (tripped by errors and slow calls on that route).
+    name = provider if path is None else f"{provider}{_endpoint(path)}"
+    breaker = _breakers.get(name)
+    if breaker is None:
+        breaker = _breakers[name] = CircuitBreaker(name)
+    return breaker
+
+
+def get_freshness(path):
+    endpoint = _endpoint(path)
+    freshness = _freshness.get(endpoint)
+    if freshness is None and endpoint in CACHE_TTLS:
+        freshness = _freshness[endpoint] = Freshness(*CACHE_TTLS[endpoint])
+    return freshness
+
+
+def _request_key(provider, path, params, extract=None):
+    key = (provider, path, tuple(sorted((params or {}).items())))
+    return key if extract is None else key + (extract.__name__,)
+
+
+async def _last_good(key):
+    # (fetched_at, data, validators) of the last good response, or None.
+    entry = last_good.peek(key)
+    if entry is None and cache_tier is not None and _endpoint(key[1]) in _persisted_endpoints:
+        # Responses from before a restart.
+        stored = await cache_tier.get(("last_good",) + key)
+        entry = stored[0] if stored is not None else None
+    return entry
+
+
+async def last_fetched_at(provider, path, params=None, extract=None):
+    # Wall-clock time the last good response for a request was fetched (a
+    # cached copy may be older than the call that returned it), or None.
+    entry = await _last_good(_request_key(provider, path, params, extract))
+    return entry[0] if entry is not None else None
+
+
+def _max_age(response):
+    # Seconds the upstream says the response stays fresh, minus what it has
+    # already spent in the upstream's own caches.
+    for directive in response.headers.get("cache-control", "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.isdigit():
+            age = response.headers.get("age", "0")
+            return max(0, int(value) - (int(age) if age.isdigit() else 0))
+    return 0
+
+
+async def _request(provider, path, params, priority, extract=None):
+    endpoint = _endpoint(path)
+    key = _request_key(provider, path, params, extract)
+    # Revalidate against the last good response: an unchanged resource
+    # comes back as an empty 304 instead of the full body.
+    previous = await _last_good(key)
+    validators = previous[2] if previous is not None and len(previous) > 2 else {}
+    headers = {}
+    if validators.get("etag"):
+        headers["if-none-match"] = validators["etag"]
+    if validators.get("last_modified"):
+        headers["if-modified-since"] = validators["last_modified"]
+
+    with span(f"quota_wait {provider}"):
+        await upstream_scheduler.acquire(provider, priority)
+    started = time.monotonic()
+    try:
+        with span(f"GET {provider}{endpoint}"):
+            response = await get_client(provider).get(path, params=params, headers=headers)
+    except httpx.HTTPError as e:
+        upstream_responses.inc(provider, endpoint, type(e).__name__)
+        raise
+    finally:
+        elapsed = time.monotonic() - started
+        upstream_latency.observe(elapsed, provider, endpoint)
+    upstream_responses.inc(provider, endpoint, str(response.status_code))
+
+    if response.status_code == 304 and headers:
+        data, digest = previous[1], validators.get("digest")
+    else:
+        response.raise_for_status()
+        digest = hashlib.blake2b(response.content, digest_size=16).hexdigest()
+        with span("json_decode"):
+            data = orjson.loads(response.content)
+            if extract is not None:
+                # Drop the full document here so only the slim one is cached.
+                data = extract(data)
+
+    freshness = get_freshness(path)
+    if freshness is not None and validators.get("digest"):
+        freshness.observe(digest != validators["digest"])
+    validators = {
+        "etag": response.headers.get("etag") or validators.get("etag"),
+        "last_modified": response.headers.get("last-modified") or validators.get("last_modified"),
+        "digest": digest,
+        "max_age": _max_age(response),
+    }
+    entry = (time.time(), data, validators)
+    last_good.set(key, entry, STALE_MAX_AGE_SECONDS)
+    if cache_tier is not None and endpoint in _persisted_endpoints:
+        _pending_last_good[("last_good",) + key] = entry
+    return data, elapsed
+
+
+async def _stale_or_raise(key, error):
+    entry = await _last_good(key)
+    if entry is None:
+        raise error
+    fetched_at, data = entry[:2]
+    return mark_stale(data, time.time() - fetched_at)
+
+
+async def fetch_json(provider, path, params=None, priority=PRIORITY_INTERACTIVE, extract=None):
+    # While a breaker is open, or when the upstream answers with 429/5xx,
+    # the last good response is returned marked stale (see
+    # circuit_breaker.stale_age) instead of failing the command.
+    # ``extract`` (see payloads.py) trims the decoded document.
+    key = _request_key(provider, path, params, extract)
+    breakers = (get_breaker(provider), get_breaker(provider, path))
+    for breaker in breakers:
+        if not breaker.allow():
+            return await _stale_or_raise(key, CircuitOpenError(breaker.name, breaker.retry_in))
+
+    retries = 0
+    while True:
+        try:
+            data, elapsed = await _request(provider, path, params, priority, extract)
+            break
+        except httpx.HTTPError as e:
+            if not is_upstream_failure(e):
+                raise
+            probe = lambda: _request(provider, path, params, PRIORITY_BACKGROUND, extract)
+            hold = retry_after(e)
+            if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429:
+                # The quota is shared, so 429s count against the provider
+                # breaker; it only opens once they pass the failure ratio.
+                breakers[0].record_failure(probe)
+                pause = THROTTLE_PAUSE_SECONDS if hold is None else hold
+                if pause > THROTTLE_MAX_PAUSE_SECONDS:
+                    breakers[0].trip(probe, hold)
+                else:
+                    upstream_scheduler.pause(provider, pause)
+                    if retries < THROTTLE_RETRIES and breakers[0].allow():
+                        retries += 1
+                        continue
+            elif hold is not None:
+                # E.g. a 503 during maintenance: back off this endpoint for as
+                # long as the upstream asked.
+                breakers[1].trip(probe, hold)
+            else:
+                for breaker in breakers:
+                    breaker.record_failure(probe)
+            return await _stale_or_raise(key, e)
+
+    for breaker in breakers:
+        breaker.record_success(elapsed)
+    return data
+
+
+async def fetch_cached_json(provider, path, params=None, ttl=None, priority=PRIORITY_INTERACTIVE, extract=None):
+    key = _request_key(provider, path, params, extract)
+    if ttl is None:
+        freshness = get_freshness(path)
+        if freshness is not None:
+            ttl = lambda: max(freshness.ttl, _response_max_age(key))
+    if not ttl:
+        return await fetch_json(provider, path, params, priority, extract)
+    return await response_cache.get_or_fetch(key, ttl, lambda: fetch_json(provider, path, params, priority, extract))
+
+
+def _response_max_age(key):
+    entry = last_good.peek(key)
+    return entry[2]["max_age"] if entry is not None and len(entry) > 2 else 0
+
+
+def breaker_stats():
+    return {name: breaker.stats() for name, breaker in _breakers.items()}
+
+
+upstream_queued = Gauge("pumpies_upstream_queued_requests", "Requests waiting for upstream quota.", ["provider"])
+upstream_wait = Gauge("pumpies_upstream_quota_wait_seconds_max", "Longest wait for upstream quota so far.", ["provider"])
+breaker_open = Gauge("pumpies_circuit_breaker_open", "1 while a circuit breaker is open or probing.", ["breaker"])
+
+
+def _collect_metrics():
+    for provider, stats in upstream_scheduler.stats().items():
+        upstream_queued.set(stats["queued"], provider)
+        upstream_wait.set(stats["max_wait"], provider)
+    for name, breaker in _breakers.items():
+        breaker_open.set(0 if breaker.allow() else 1, name)
+
+
+register_collector(_collect_metrics)
+
+
+async def close_clients():
+    await flush_last_good()
+    if cache_tier is not None:
+        cache_tier.close()
+    upstream_scheduler.close()
+    for breaker in _breakers.values():
+        breaker.cancel()
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        await client.aclose()
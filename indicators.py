@@ -0,0 +1,180 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Every function works along the last axis, so a 1-D array is one coin's
+# series and a 2-D array (coins x samples) computes the whole batch at once.
+
+from functools import lru_cache
+
+import numpy as np
+
+
+MS_PER_DAY = 86_400_000
+
+# Recursive smoothing is evaluated as a matrix product over blocks of this
+# many samples, carrying the last value between blocks. One block covers
+# every series the bot currently fetches.
+_BLOCK = 256
+
+
+@lru_cache(maxsize=64)
+def _decay_weights(alpha, size):
+    lag = np.subtract.outer(np.arange(size), np.arange(size))
+    weights = alpha * (1.0 - alpha) ** np.clip(lag, 0, None)
+    weights[lag < 0] = 0.0
+    weights.setflags(write=False)
+    powers = (1.0 - alpha) ** np.arange(1, size + 1)
+    powers.setflags(write=False)
+    return weights.T, powers
+
+
+def _smooth(values, alpha, initial):
+    # y[t] = alpha * x[t] + (1 - alpha) * y[t - 1], with y[-1] = initial
+    out = np.empty_like(values)
+    previous = initial
+    for start in range(0, values.shape[-1], _BLOCK):
+        block = values[..., start:start + _BLOCK]
+        weights, powers = _decay_weights(alpha, block.shape[-1])
+        out[..., start:start + block.shape[-1]] = block @ weights + previous[..., None] * powers
+        previous = out[..., start + block.shape[-1] - 1]
+    return out
+
+
+def _as_series(values, period):
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[-1] < period:
+        raise ValueError(f"need at least {period} samples, got {values.shape[-1]}")
+    return values
+
+
+def sma(values, period):
+    values = _as_series(values, period)
+    totals = np.cumsum(values, axis=-1)
+    totals[..., period:] = totals[..., period:] - totals[..., :-period]
+    return totals[..., period - 1:] / period
+
+
+def _seeded_smoothing(values, period, alpha):
+    seed = values[..., :period].mean(axis=-1)
+    rest = _smooth(values[..., period:], alpha, seed)
+    return np.concatenate([seed[..., None], rest], axis=-1)
+
+
+def ema(values, period):
+    values = _as_series(values, period)
+    return _seeded_smoothing(values, period, 2.0 / (period + 1))
+
+
+def wilder_average(values, period):
+    values = _as_series(values, period)
+    return _seeded_smoothing(values, period, 1.0 / period)
+
+
+def rsi(closes, period=14):
+    closes = _as_series(closes, period + 1)
+    deltas = np.diff(closes, axis=-1)
+    avg_gain = wilder_average(np.clip(deltas, 0.0, None), period)
+    avg_loss = wilder_average(np.clip(-deltas, 0.0, None), period)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
+    return np.where(avg_loss == 0, 100.0, values)
+
+
+def macd(closes, fast=12, slow=26, signal=9):
+    closes = _as_series(closes, slow + signal - 1)
+    line = ema(closes, fast)[..., slow - fast:] - ema(closes, slow)
+    signal_line = ema(line, signal)
+    line = line[..., signal - 1:]
+    return line, signal_line, line - signal_line
+
+
+def balance_of_power(ohlc):
+    ohlc = np.asarray(ohlc, dtype=np.float64)
+    open_, high, low, close = (ohlc[..., i] for i in range(1, 5))
+    spread = high - low
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(spread != 0, (close - open_) / spread, np.nan)
+
+
+def daily_bop(ohlc):
+    # ohlc rows are [timestamp_ms, open, high, low, close], either (n, 5) for
+    # one coin or (coins, n, 5) for a batch. Returns the UTC day numbers and
+    # the mean BOP per day (NaN where a coin has no usable candle that day).
+    ohlc = np.asarray(ohlc, dtype=np.float64)
+    batch = ohlc.reshape(-1, ohlc.shape[-2], 5)
+    values = balance_of_power(batch)
+    days = batch[..., 0].astype(np.int64) // MS_PER_DAY
+
+    unique_days, day_index = np.unique(days, return_inverse=True)
+    day_index = day_index.reshape(days.shape)
+    coin_index = np.broadcast_to(np.arange(batch.shape[0])[:, None], days.shape)
+    bucket = (coin_index * len(unique_days) + day_index).ravel()
+
+    valid = ~np.isnan(values).ravel()
+    size = batch.shape[0] * len(unique_days)
+    totals = np.bincount(bucket[valid], weights=values.ravel()[valid], minlength=size)
+    counts = np.bincount(bucket[valid], minlength=size)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = (totals / counts).reshape(batch.shape[0], len(unique_days))
+    return unique_days, means.reshape(ohlc.shape[:-2] + (len(unique_days),))
+
+
+def format_day(day):
+    return str(np.datetime64(int(day), "D"))
+
+
+class RsiState:
+    # Wilder RSI carried forward one close at a time, so a series that has
+    # already been seeded only needs the new candles to stay current.
+    __slots__ = ("period", "avg_gain", "avg_loss", "last_close", "last_timestamp")
+
+    def __init__(self, period, avg_gain, avg_loss, last_close, last_timestamp=None):
+        self.period = period
+        self.avg_gain = avg_gain
+        self.avg_loss = avg_loss
+        self.last_close = last_close
+        self.last_timestamp = last_timestamp
+
+    @classmethod
+    def from_closes(cls, closes, period=14, last_timestamp=None):
+        closes = _as_series(closes, period + 1)
+        deltas = np.diff(closes)
+        avg_gain = wilder_average(np.clip(deltas, 0.0, None), period)[-1]
+        avg_loss = wilder_average(np.clip(-deltas, 0.0, None), period)[-1]
+        return cls(period, float(avg_gain), float(avg_loss), float(closes[-1]), last_timestamp)
+
+    def _step(self, close):
+        change = close - self.last_close
+        keep = self.period - 1
+        avg_gain = (self.avg_gain * keep + max(change, 0.0)) / self.period
+        avg_loss = (self.avg_loss * keep + max(-change, 0.0)) / self.period
+        return avg_gain, avg_loss
+
+    def update(self, close, timestamp=None):
+        self.avg_gain, self.avg_loss = self._step(close)
+        self.last_close = float(close)
+        self.last_timestamp = timestamp
+
+    def peek(self, close):
+        return _rsi_value(*self._step(close))
+
+    @property
+    def value(self):
+        return _rsi_value(self.avg_gain, self.avg_loss)
+
+
+def _rsi_value(avg_gain, avg_loss):
+    if avg_loss == 0:
+        return 100.0
+    return 100.0 - 100.0 / (1.0 + avg_gain / avg_loss)
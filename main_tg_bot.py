@@ -13,41 +13,111 @@
 # limitations under the License.
 
 
-import requests
-from telegram import Update
-from telegram.ext import ApplicationBuilder, CommandHandler, ContextTypes
-from datetime import datetime
-from collections import defaultdict
+import asyncio
+import httpx
+import numpy as np
+from telegram import InlineQueryResultArticle, InputTextMessageContent, Update
+from telegram.ext import Application, ApplicationBuilder, ContextTypes, InlineQueryHandler
 from dotenv import load_dotenv
 import os
-import asyncio
-import urllib.parse
+import time
 
 
+# The helper modules read their settings at import time, so the env file has
+# to be loaded first.
 load_dotenv("tg.env")
 
-user_last_command_time = {}
-RATE_LIMIT_SECONDS = 1.5
-
-async def check_rate_limit(update: Update) -> bool:
-    user_id = update.message.from_user.id
-    current_time = datetime.now()
-
-    if user_id in user_last_command_time:
-        last_command_time = user_last_command_time[user_id]
-        time_difference = (current_time - last_command_time).total_seconds()
-
-        if time_difference < RATE_LIMIT_SECONDS:
-            return False
-
-    user_last_command_time[user_id] = current_time
-    return True
+import indicators
+import metrics
+from alerts import (
+    ABOVE,
+    ALERT_CHECK_SECONDS,
+    BELOW,
+    MAX_ALERTS_PER_CHAT,
+    PRICE,
+    RSI,
+    alert_book,
+    check_alerts,
+)
+from boosts import BOOST_POLL_SECONDS, boost_feed, poll_boosts
+from circuit_breaker import stale_age
+from delivery import QueuedRequest, send_queue
+from coin_index import (
+    COIN_INDEX_REFRESH_SECONDS,
+    COIN_QUOTES_REFRESH_SECONDS,
+    coin_index,
+    refresh_coin_index,
+    refresh_coin_quotes,
+    resolve_coin,
+)
+from http_client import (
+    COINGECKO,
+    DEXSCREENER,
+    LAST_GOOD_FLUSH_SECONDS,
+    close_clients,
+    enable_persistent_cache,
+    fetch_cached_json,
+    fetch_json,
+    flush_last_good,
+)
+from payloads import CATEGORIES_SHOWN, COIN_DETAILS_PARAMS, coin_details
+from prefetch import PREFETCH_INTERVAL_SECONDS, format_age, prefetcher
+from prices import get_price
+from rate_limit import rate_limiter
+from rendering import (
+    BOOSTED_TOKENS,
+    COIN_DETAILS,
+    SEARCH_RESULT,
+    TOKEN_ORDERS,
+    TRENDING,
+    boosted_token_items,
+    coin_details_fields,
+    format_usd_price,
+    render,
+    reply_markdown,
+    search_result_fields,
+    token_order_items,
+    trending_items,
+)
+from rsi_tracker import rsi_tracker
+from serving import CONCURRENT_UPDATES, TracedRequest, command_handler, instrumented, run
+from timeseries import timeseries_store
+from tokens import get_token_pair
+from tracing import span
+
+
+# Wilder's period. Shorter periods degenerate (RSI(1) is always 0 or 100),
+# so the /rsi argument only picks how far back to compare.
+RSI_DEFAULT_PERIOD = 14
+RSI_MAX_LOOKBACK_DAYS = 14
+# Candle size used for each /bop window, matching what CoinGecko's /ohlc
+# returns for that many days.
+BOP_GRANULARITY = {"1": "30m", "7": "4h", "14": "4h", "30": "4h"}
+INLINE_RESULTS_LIMIT = int(os.getenv("INLINE_RESULTS_LIMIT", "10"))
+# How long Telegram may reuse an inline answer for the same query.
+INLINE_CACHE_SECONDS = int(os.getenv("INLINE_CACHE_SECONDS", "30"))
+TRADE_INFO_MAX_ADDRESSES = int(os.getenv("TRADE_INFO_MAX_ADDRESSES", "30"))
+
+
+async def check_rate_limit(update: Update, command: str) -> bool:
+    with span("rate_limit"):
+        return rate_limiter.allow(update.message.from_user.id, command)
+
+
+def stale_note(data) -> str:
+    return stale_age_note(stale_age(data))
+
+
+def stale_age_note(age) -> str:
+    if age is None:
+        return ""
+    return f"\n⚠️ _Upstream unavailable, showing data from {format_age(age)} ago_"
 
 
 
 async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "start"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
@@ -65,11 +135,14 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         "   `/coin_details_name btc`\n"
         "   `/coin_details_address solana/ethereum ca`\n"
         "   `/rsi btc 1d, 2d.. to 14d`\n"
-        "   `/bop btc 1 or 7 or 14 (days)`\n"
+        "   `/bop btc 1, 7, 14 or 30 (days)`\n"
         "   `/top_boosted_tokens`\n"
         "   `/latest_boosted_tokens `\n"
-        "   `/trade_info ca `\n"
-        "   `/token_orders ethereum/solana ca`\n\n"
+        "   `/trade_info ca [ca ...]`\n"
+        "   `/token_orders ethereum/solana ca`\n"
+        "   `/alert btc > 70000` or `/alert eth rsi < 30`\n"
+        "   `/alerts`, `/unalert id`\n"
+        "   `/subscribe_boosts`, `/unsubscribe_boosts`\n\n"
 
         "If you have any questions or need further assistance, feel free to reach out! ☺️"
     )
@@ -79,139 +152,89 @@ async def start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "search"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
     if context.args:
         query = " ".join(context.args)
-        search_url = f"https://api.coingecko.com/api/v3/search?query={query}"
-        headers = {
-            "accept": "application/json",
-        }
 
         try:
-            search_response = requests.get(search_url, headers=headers)
-            search_response.raise_for_status()
-            search_data = search_response.json()
-
-            if search_data.get("coins"):
-                first_coin = search_data["coins"][0]
-                coin_id = first_coin["api_symbol"]
-                name = first_coin["name"]
-                market_cap_rank = first_coin.get("market_cap_rank", "N/A")
-                symbol = first_coin["symbol"]
-                await asyncio.sleep(1.2)
-                price_url = f"https://api.coingecko.com/api/v3/simple/price?ids={coin_id}&vs_currencies=usd&include_market_cap=true&include_24hr_vol=true&include_24hr_change=true&precision=10"
-                price_response = requests.get(price_url, headers=headers)
-                price_response.raise_for_status()
-                price_data = price_response.json()
-
-                price_info = price_data.get(coin_id, {})
-                usd_price = price_info.get("usd", "N/A")
-                usd_market_cap = price_info.get("usd_market_cap", "N/A")
-                usd_24h_vol = price_info.get("usd_24h_vol", "N/A")
-                usd_24h_change = price_info.get("usd_24h_change", "N/A")
+            coin = await resolve_coin(query)
 
+            if coin:
+                price_info = await get_price(coin.id)
                 await update.message.reply_text(
-                    f"🔎 **Search Results**\n\n"
-                    f"🆔 **ID**: `{coin_id}`\n"
-                    f"🏷️ **Name**: *{name}*\n"
-                    f"📊 **Market Cap Rank**: #{market_cap_rank}\n"
-                    f"💠 **Symbol**: `{symbol.upper()}`\n\n"
-                    f"💵 **Price Details (USD):**\n"
-                    f"💲 **Current Price**: `${usd_price:,.10f}`\n"
-                    f"💰 **Market Cap**: `${usd_market_cap:,.2f}`\n"
-                    f"📈 **24h Volume**: `${usd_24h_vol:,.2f}`\n"
-                    f"📉 **24h Change**: `{usd_24h_change:.2f}%`\n",
+                    render(SEARCH_RESULT, search_result_fields(coin, price_info)) + stale_note(price_info),
                     parse_mode="Markdown"
                 )
 
             else:
                 await update.message.reply_text("No results found for your query. Please try again.")
 
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             await update.message.reply_text(f"An error occurred while fetching data: {e}")
     else:
         await update.message.reply_text("Please provide a query. Usage: /search <your query>")
 
 
+async def inline_search(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    # Answered entirely from the local coin index and its cached quotes, so
+    # a keystroke never costs an upstream call.
+    query = update.inline_query.query.strip()
+    if not query or not coin_index.ready:
+        await update.inline_query.answer([], cache_time=INLINE_CACHE_SECONDS)
+        return
+
+    results = []
+    for coin in coin_index.search(query, limit=INLINE_RESULTS_LIMIT):
+        quote = coin_index.quote(coin.id) or {}
+        fields = search_result_fields(coin, quote)
+        description = f"${format_usd_price(quote.get('usd'))}"
+        if fields["usd_24h_change"] != "N/A":
+            description += f" · 24h {fields['usd_24h_change']}%"
+        if coin.market_cap_rank:
+            description += f" · #{coin.market_cap_rank}"
+        results.append(InlineQueryResultArticle(
+            id=coin.id[:64],
+            title=f"{coin.name} ({coin.symbol.upper()})",
+            description=description,
+            input_message_content=InputTextMessageContent(render(SEARCH_RESULT, fields), parse_mode="Markdown"),
+        ))
+    await update.inline_query.answer(results, cache_time=INLINE_CACHE_SECONDS)
+
+
 async def trending(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "trending"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
-    url = "https://api.coingecko.com/api/v3/search/trending"
-
-    headers = {
-        "accept": "application/json",
-    }
-
     try:
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-        data = response.json()
+        data, age = await prefetcher.get("trending")
 
         coins = data.get("coins", [])[:5]
         if not coins:
             await update.message.reply_text("No trending coins found at the moment.")
             return
 
-        message = "Trending Coins:\n\n"
-        for coin_data in coins:
-            item = coin_data.get("item", {})
-            name = item.get("name", "N/A")
-            symbol = item.get("symbol", "N/A")
-            rank = item.get("market_cap_rank", "N/A")
-            usd_price = item.get("data", {}).get("price", "N/A")
-            if isinstance(usd_price, (float, int)):
-                if usd_price > 1:
-                    usd_price = f"{usd_price:.2f}"
-                elif 0.0001 < usd_price <= 1:
-                    usd_price = f"{usd_price:.6f}"
-                elif usd_price <= 0.0001:
-                    usd_price = f"{usd_price:.10f}"
-            else:
-                usd_price = "N/A"
-            market_cap = item.get("data", {}).get("market_cap", "N/A")
-            market_cap_btc = item.get("data", {}).get("market_cap_btc", "N/A")
-            total_volume = item.get("data", {}).get("total_volume", "N/A")
-            total_volume_btc = item.get("data", {}).get("total_volume_btc", "N/A")
-
-
-            message += (
-                f"🔥 **Trending Coins** 🔥\n\n"
-                f"🏷️ **Name**: *{name}*\n"
-                f"💠 **Symbol**: `{symbol.upper()}`\n"
-                f"📊 **Rank**: #{rank}\n\n"
-                f"💵 **Price Details (USD):**\n"
-                f"💲 **Current Price**: `${usd_price}`\n"
-                f"💰 **Market Cap**: `${market_cap}`\n"
-                f"🪙 **Market Cap (BTC)**: `{market_cap_btc} BTC`\n"
-                f"📈 **Total Volume (USD)**: `${total_volume}`\n"
-                f"🪙 **Total Volume (BTC)**: `{total_volume_btc:} BTC`\n"
-                "---------------------------\n"
-            )
+        message = render(TRENDING, items=trending_items(coins))
+        message += f"\n🕒 _Data age: {format_age(age)}_"
+        await reply_markdown(update, message)
 
-        await update.message.reply_text(message, parse_mode="Markdown")
-
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 
 async def dominance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "dominance"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
-    url = "https://api.coingecko.com/api/v3/global"
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json().get("data", {})
+        global_data, age = await prefetcher.get("dominance")
+        data = global_data.get("data", {})
 
         active_cryptocurrencies = data.get("active_cryptocurrencies", "N/A")
         market_cap_percentage = data.get("market_cap_percentage", {})
@@ -229,15 +252,16 @@ async def dominance(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             f"📈 **24h Market Cap Change**: `{market_cap_change_24h:.2f}%`\n"
         )
 
+        message += f"\n🕒 _Data age: {format_age(age)}_"
         await update.message.reply_text(message, parse_mode="Markdown")
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 
 async def companies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "companies"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
@@ -248,12 +272,9 @@ async def companies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         return
 
     coin_id = context.args[0]
-    url = f"https://api.coingecko.com/api/v3/companies/public_treasury/{coin_id}"
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data = await fetch_cached_json(COINGECKO, f"/companies/public_treasury/{coin_id}")
 
         total_holdings = data.get("total_holdings", "N/A")
         total_value_usd = data.get("total_value_usd", "N/A")
@@ -285,29 +306,25 @@ async def companies(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
                 "---------------------------\n"
             )
 
+        message += stale_note(data)
         await update.message.reply_text(message, parse_mode="Markdown")
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 
 async def categories(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "categories"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
-    url = "https://api.coingecko.com/api/v3/coins/categories?order=market_cap_change_24h_desc"
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data, age = await prefetcher.get("categories")
 
-        top_categories = data[:3]  # Get the first 3 categories
-        message = "🏅 **Top 3 Coin Categories (by 24h Market Cap Change)** 🏅\n\n"
+        message = f"🏅 **Top {CATEGORIES_SHOWN} Coin Categories (by 24h Market Cap Change)** 🏅\n\n"
 
-        for category in top_categories:
+        for category in data[:CATEGORIES_SHOWN]:
             name = category.get("name", "N/A")
             market_cap = category.get("market_cap", 0)
             market_cap_change = category.get("market_cap_change_24h", 0)
@@ -321,15 +338,16 @@ async def categories(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
                 "------------------------------------\n"
             )
 
+        message += f"\n🕒 _Data age: {format_age(age)}_"
         await update.message.reply_text(message, parse_mode="Markdown")
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 
 async def coin_details_name(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "coin_details_name"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
@@ -338,95 +356,28 @@ async def coin_details_name(update: Update, context: ContextTypes.DEFAULT_TYPE)
         await update.message.reply_text("Please provide a coin name or symbol. Example: `/coin_details_name btc`", parse_mode="Markdown")
         return
 
-    search_url = f"https://api.coingecko.com/api/v3/search?query={user_query}"
     try:
-        search_response = requests.get(search_url)
-        search_response.raise_for_status()
-        search_data = search_response.json()
-
-        coins_list = search_data.get("coins", [])
-        if not coins_list:
+        coin = await resolve_coin(user_query)
+        if not coin:
             await update.message.reply_text(f"No results found for '{user_query}'. Please try a different query.")
             return
 
-        first_coin = coins_list[0]
-        coin_id = first_coin.get("api_symbol", None)
+        coin_id = coin.id
         if not coin_id:
             await update.message.reply_text("Unable to find a valid coin ID. Please try again.")
             return
 
-        await asyncio.sleep(1.5)
-
-        details_url = f"https://api.coingecko.com/api/v3/coins/{coin_id}"
-        details_response = requests.get(details_url)
-        details_response.raise_for_status()
-        details_data = details_response.json()
-
-        name = details_data.get("name")
-        symbol = details_data.get("symbol")
-        asset_platform_id = details_data.get("asset_platform_id")
-        sentiment_votes_up_percentage = details_data.get("sentiment_votes_up_percentage")
-        sentiment_votes_down_percentage = details_data.get("sentiment_votes_down_percentage")
-        watchlist_portfolio_users = details_data.get("watchlist_portfolio_users")
-        total_supply = details_data.get("market_data", {}).get("total_supply", {})
-        max_supply = details_data.get("market_data", {}).get("max_supply", {})
-        circulating_supply = details_data.get("market_data", {}).get("circulating_supply", {})
-        description = details_data.get("description", {}).get("en")
-        current_price = details_data.get("market_data", {}).get("current_price", {}).get("usd")
-        market_cap = details_data.get("market_data", {}).get("market_cap", {}).get("usd")
-        ath = details_data.get("market_data", {}).get("ath", {}).get("usd")
-        atl = details_data.get("market_data", {}).get("atl", {}).get("usd")
-        price_change_24h = details_data.get("market_data", {}).get("price_change_percentage_24h")
-
-
-        tickers = details_data.get("tickers", [])
-        if tickers:
-            first_ticker = tickers[0]
-            base = first_ticker.get("base")
-            target = first_ticker.get("target")
-            market_name = first_ticker.get("market", {}).get("name")
-            converted_last_usd = first_ticker.get("converted_last", {}).get("usd")
-            converted_volume_usd = first_ticker.get("converted_volume", {}).get("usd")
-            trust_score = first_ticker.get("trust_score")
-            trade_url = first_ticker.get("trade_url")
-        else:
-            base = target = market_name = converted_last_usd = converted_volume_usd = trust_score = trade_url = None
-
-        message = (
-            f"🪙 **Coin Details** 🪙\n\n"
-            f"**Name**: `{name} ({symbol.upper()})`\n"
-            f"**Platform**: `{asset_platform_id}`\n\n"
-            f"👍 **Sentiment Up-vote**: `{sentiment_votes_up_percentage}%`\n"
-            f"👎 **Sentiment Down-vote**: `{sentiment_votes_down_percentage}%`\n"
-            f"💬 **Watch List Users**: `{watchlist_portfolio_users}`\n\n"
-            f"📝 **Description**: {description[:200]}...\n\n"
-            f"📊 **Market Data** 📊\n\n"
-            f"💵 **Current Price (USD)**: `${current_price:,.4f}`\n"
-            f"ℹ️ **Total Supply (#)**: `{total_supply}`\n"
-            f"ℹ️ **Max Supply (#)**: `{max_supply}`\n"
-            f"ℹ️ **Circulating Supply (#)**: `{circulating_supply}`\n"
-            f"💰 **Market Cap (USD)**: `${market_cap:,.2f}`\n"
-            f"🚀 **All-Time High (USD)**: `${ath:,.8f}`\n"
-            f"🏚️ **All-Time Low (USD)**: `${atl:,.8f}`\n"
-            f"📉 **24h Price Change**: `{price_change_24h:.4f}%`\n\n"
-            f"🏛️ **Top Exchange Information** 🏛️\n\n"
-            f"🏦 **Exchange Name**: `{market_name}`\n"
-            f"🌐 **Base - Token Address**: `{base}`\n"
-            f"🎯 **Target**: `{target}`\n"
-            f"💲 **Last Price (USD)**: `${converted_last_usd:,.8f}`\n"
-            f"📈 **Volume (USD)**: `${converted_volume_usd:,.2f}`\n"
-            f"⭐ **Trust Score (Exchange)**: `{trust_score}`\n\n"
-            f"🔗 [Swapp Here]({trade_url})\n"
-        )
+        details_data = await fetch_json(COINGECKO, f"/coins/{coin_id}", COIN_DETAILS_PARAMS, extract=coin_details)
 
-        await update.message.reply_text(message, parse_mode="Markdown", disable_web_page_preview=False)
+        message = render(COIN_DETAILS, coin_details_fields(details_data)) + stale_note(details_data)
+        await reply_markdown(update, message, disable_web_page_preview=False)
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 
 async def coin_details_address(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "coin_details_address"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
@@ -458,80 +409,22 @@ async def coin_details_address(update: Update, context: ContextTypes.DEFAULT_TYP
         )
         return
 
-    details_url = f"https://api.coingecko.com/api/v3/coins/{platform}/contract/{contract_address}"
-
     try:
-        details_response = requests.get(details_url)
-        details_response.raise_for_status()
-        details_data = details_response.json()
-
-
-        name = details_data.get("name")
-        symbol = details_data.get("symbol")
-        asset_platform_id = details_data.get("asset_platform_id")
-        sentiment_votes_up_percentage = details_data.get("sentiment_votes_up_percentage")
-        sentiment_votes_down_percentage = details_data.get("sentiment_votes_down_percentage")
-        watchlist_portfolio_users = details_data.get("watchlist_portfolio_users")
-        total_supply = details_data.get("market_data", {}).get("total_supply", {})
-        max_supply = details_data.get("market_data", {}).get("max_supply", {})
-        circulating_supply = details_data.get("market_data", {}).get("circulating_supply", {})
-        description = details_data.get("description", {}).get("en")
-        current_price = details_data.get("market_data", {}).get("current_price", {}).get("usd")
-        market_cap = details_data.get("market_data", {}).get("market_cap", {}).get("usd")
-        ath = details_data.get("market_data", {}).get("ath", {}).get("usd")
-        atl = details_data.get("market_data", {}).get("atl", {}).get("usd")
-        price_change_24h = details_data.get("market_data", {}).get("price_change_percentage_24h")
-
-        tickers = details_data.get("tickers", [])
-        if tickers:
-            first_ticker = tickers[0]
-            base = first_ticker.get("base")
-            target = first_ticker.get("target")
-            market_name = first_ticker.get("market", {}).get("name")
-            converted_last_usd = first_ticker.get("converted_last", {}).get("usd")
-            converted_volume_usd = first_ticker.get("converted_volume", {}).get("usd")
-            trust_score = first_ticker.get("trust_score")
-            trade_url = first_ticker.get("trade_url")
-        else:
-            base = target = market_name = converted_last_usd = converted_volume_usd = trust_score = trade_url = None
-
-        message = (
-            f"🪙 **Coin Details** 🪙\n\n"
-            f"**Name**: `{name} ({symbol.upper()})`\n"
-            f"**Platform**: `{asset_platform_id}`\n\n"
-            f"👍 **Sentiment Up-vote**: `{sentiment_votes_up_percentage}%`\n"
-            f"👎 **Sentiment Down-vote**: `{sentiment_votes_down_percentage}%`\n"
-            f"💬 **Watch List Users**: `{watchlist_portfolio_users}`\n\n"
-            f"📝 **Description**: {description[:200]}...\n\n"
-            f"📊 **Market Data** 📊\n\n"
-            f"💵 **Current Price (USD)**: `${current_price:,.4f}`\n"
-            f"ℹ️ **Total Supply (#)**: `{total_supply}`\n"
-            f"ℹ️ **Max Supply (#)**: `{max_supply}`\n"
-            f"ℹ️ **Circulating Supply (#)**: `{circulating_supply}`\n"
-            f"💰 **Market Cap (USD)**: `${market_cap:,.2f}`\n"
-            f"🚀 **All-Time High (USD)**: `${ath:,.8f}`\n"
-            f"🏚️ **All-Time Low (USD)**: `${atl:,.8f}`\n"
-            f"📉 **24h Price Change**: `{price_change_24h:.4f}%`\n\n"
-            f"🏛️ **Top Exchange Information** 🏛️\n\n"
-            f"🏦 **Exchange Name**: `{market_name}`\n"
-            f"🌐 **Base - Token Address**: `{base}`\n"
-            f"🎯 **Target**: `{target}`\n"
-            f"💲 **Last Price (USD)**: `${converted_last_usd:,.8f}`\n"
-            f"📈 **Volume (USD)**: `${converted_volume_usd:,.2f}`\n"
-            f"⭐ **Trust Score (Exchange)**: `{trust_score}`\n\n"
-            f"🔗 [Swapp Here]({trade_url})\n"
+        details_data = await fetch_json(
+            COINGECKO, f"/coins/{platform}/contract/{contract_address}", COIN_DETAILS_PARAMS, extract=coin_details
         )
 
-        await update.message.reply_text(message, parse_mode="Markdown", disable_web_page_preview=False)
+        message = render(COIN_DETAILS, coin_details_fields(details_data)) + stale_note(details_data)
+        await reply_markdown(update, message, disable_web_page_preview=False)
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 
 
 async def bop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "bop"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
@@ -542,27 +435,16 @@ async def bop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     query = context.args[0]
     days = context.args[1]
 
-    if days not in ["1", "7", "14"]:
-        await update.message.reply_text("Invalid number of days! Please use 1, 7, or 14.")
+    if days not in BOP_GRANULARITY:
+        await update.message.reply_text("Invalid number of days! Please use 1, 7, 14 or 30.")
         return
 
-    headers = {
-        "accept": "application/json",
-    }
-
-    encoded_query = urllib.parse.quote(query)
-
     try:
-        search_url = f"https://api.coingecko.com/api/v3/search?query={encoded_query}"
-        search_response = requests.get(search_url, headers=headers)
-        search_response.raise_for_status()
-        search_data = search_response.json()
-
+        coin = await resolve_coin(query)
 
-        if search_data.get("coins") and len(search_data["coins"]) > 0:
-            first_coin = search_data["coins"][0]
-            coin_id = first_coin.get("id")
-            name = first_coin.get("name")
+        if coin:
+            coin_id = coin.id
+            name = coin.name
 
             if not coin_id:
                 await update.message.reply_text(f"Error: No valid coin ID found for query `{query}`.")
@@ -570,40 +452,29 @@ async def bop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         else:
             await update.message.reply_text(f"No coin found matching the query: {query}")
             return
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         print(f"Error fetching coin information: {e}")
         await update.message.reply_text(f"Error fetching coin information: {e}")
         return
 
-    await asyncio.sleep(2)
-
     try:
-        ohlc_url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/ohlc?vs_currency=usd&days={days}"
-
-        ohlc_response = requests.get(ohlc_url, headers=headers)
-        ohlc_response.raise_for_status()
-        ohlc_data = ohlc_response.json()
+        since_ms = time.time() * 1000 - int(days) * indicators.MS_PER_DAY
+        ohlc_data = await timeseries_store.ensure(coin_id, BOP_GRANULARITY[days], since_ms)
 
-
-        if not ohlc_data:
+        if not len(ohlc_data):
             await update.message.reply_text(f"No OHLC data found for {name} in the last {days} days.")
             return
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"Error fetching OHLC data: {e}")
         return
 
     try:
-        daily_bop = defaultdict(list)
-
-        for entry in ohlc_data:
-            timestamp, open_price, high_price, low_price, close_price = entry
-            date = datetime.utcfromtimestamp(timestamp / 1000).strftime('%Y-%m-%d')
-
-            if high_price != low_price:
-                bop = (close_price - open_price) / (high_price - low_price)
-                daily_bop[date].append(bop)
-
-        aggregated_bop = {date: sum(values) / len(values) for date, values in daily_bop.items()}
+        bop_days, bop_means = indicators.daily_bop(ohlc_data)
+        aggregated_bop = {
+            indicators.format_day(day): float(avg_bop)
+            for day, avg_bop in zip(bop_days, bop_means)
+            if not np.isnan(avg_bop)
+        }
 
         if not aggregated_bop:
             await update.message.reply_text(f"No valid BOP data found for {name}.")
@@ -614,6 +485,7 @@ async def bop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
             pressure = "🔼 Buy Pressure" if avg_bop > 0 else "🔽 Sell Pressure"
             message += f"📅 **{date}**: `{avg_bop:.4f}` ({pressure})\n"
 
+        message += stale_age_note(timeseries_store.stale_age(coin_id, BOP_GRANULARITY[days]))
         await update.message.reply_text(message, parse_mode="Markdown")
     except Exception as e:
         print(f"Unexpected error during BOP calculation: {e}")
@@ -621,112 +493,68 @@ async def bop(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 
 async def rsi(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "rsi"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
     user_query = " ".join(context.args).strip()
     if not user_query:
-        await update.message.reply_text("Please provide a coin name or symbol. Example: `/rsi btc 1h`", parse_mode="Markdown")
+        await update.message.reply_text("Please provide a coin name or symbol. Example: `/rsi btc 7d`", parse_mode="Markdown")
         return
 
     query_parts = user_query.split()
     coin_symbol = query_parts[0]
-    time_period = query_parts[1] if len(query_parts) > 1 else "1d"
-    interval_choice = query_parts[2] if len(query_parts) > 2 else None
+    lookback = query_parts[1] if len(query_parts) > 1 else "1d"
 
-    if time_period.endswith('d'):
-        days = int(time_period[:-1])
-        if days < 1 or days > 14:
-            await update.message.reply_text("The allowed range for days is between 1 and 14. Please adjust your input.")
-            return
-        interval = 'daily'
-    else:
-        days = 1
-        interval = 'daily'
+    if not lookback.endswith("d") or not lookback[:-1].isdigit():
+        await update.message.reply_text("Please give the lookback in days, e.g. `/rsi btc 7d`.", parse_mode="Markdown")
+        return
+    days = int(lookback[:-1])
+    if days < 1 or days > RSI_MAX_LOOKBACK_DAYS:
+        await update.message.reply_text(
+            f"The allowed range for days is between 1 and {RSI_MAX_LOOKBACK_DAYS}. Please adjust your input."
+        )
+        return
+    interval = "1d"
 
-    search_url = f"https://api.coingecko.com/api/v3/search?query={coin_symbol}"
     try:
-        search_response = requests.get(search_url)
-        search_response.raise_for_status()
-        search_data = search_response.json()
-
-        coins_list = search_data.get("coins", [])
-        if not coins_list:
+        coin = await resolve_coin(coin_symbol)
+        if not coin:
             await update.message.reply_text(f"No results found for '{coin_symbol}'. Please try a different query.")
             return
 
-        first_coin = coins_list[0]
-        coin_id = first_coin.get("id", None)
+        coin_id = coin.id
 
         if not coin_id:
             await update.message.reply_text("Unable to find a valid coin ID. Please try again.")
             return
 
-        await asyncio.sleep(1.5)
-        cg_api_key = os.getenv("CG_API_KEY")
-        url = f"https://api.coingecko.com/api/v3/coins/{coin_id}/market_chart?vs_currency=usd&days={days}&interval={interval}"
-
-        headers = {
-            "accept": "application/json",
-            "x-cg-demo-api-key": cg_api_key
-        }
-
-        chart_response = requests.get(url, headers=headers)
-        chart_response.raise_for_status()
-        chart_data = chart_response.json()
-
-        prices = chart_data.get('prices', [])
-        if not prices:
+        total_rsi = await rsi_tracker.current(coin_id, period=RSI_DEFAULT_PERIOD, interval=interval)
+        if total_rsi is None:
             await update.message.reply_text(f"No price data available for {coin_symbol}. Please try again later.")
             return
 
-        closing_prices = [price[1] for price in prices]
-
-        total_rsi = calculate_rsi(closing_prices, period=len(closing_prices))
-
         total_rsi_interpretation = interpret_rsi(total_rsi)
+        past_rsi = rsi_tracker.closed_value(coin_id, RSI_DEFAULT_PERIOD, days, interval)
+        past_line = ""
+        if past_rsi is not None:
+            change = total_rsi - past_rsi
+            direction = "▲" if change >= 0 else "▼"
+            past_line = f"📆 **{days}d ago**: *{past_rsi:.2f}* ({direction} {abs(change):.2f})\n\n"
 
         await update.message.reply_text(
-            f"📉 **Relative Strength Index (RSI)** for *{coin_symbol.upper()}* (Last {days} days):\n\n"
+            f"📉 **Relative Strength Index (RSI)** for *{coin_symbol.upper()}* ({RSI_DEFAULT_PERIOD}-day, daily closes):\n\n"
             f"🔸 **RSI**: *{total_rsi:.2f}* - {total_rsi_interpretation}\n\n"
+            f"{past_line}"
             f"*Note: RSI is a momentum indicator used to assess whether an asset is overbought (>70) or oversold (<30).*\n\n"
             f"🔄 *RSI between 30 and 70 suggests neutral market conditions.*"
+            + stale_age_note(timeseries_store.stale_age(coin_id, interval)),
+            parse_mode="Markdown",
         )
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
-def calculate_rsi(prices, period=14):
-    gains = []
-    losses = []
-
-    for i in range(1, len(prices)):
-        change = prices[i] - prices[i - 1]
-        if change > 0:
-            gains.append(change)
-            losses.append(0)
-        else:
-            gains.append(0)
-            losses.append(abs(change))
-
-    avg_gain = sum(gains[:period]) / period
-    avg_loss = sum(losses[:period]) / period
-
-    for i in range(period, len(prices)):
-        gain = gains[i]
-        loss = losses[i]
-
-        avg_gain = (avg_gain * (period - 1) + gain) / period
-        avg_loss = (avg_loss * (period - 1) + loss) / period
-
-    if avg_loss == 0:
-        return 100
-    rs = avg_gain / avg_loss
-
-    rsi = 100 - (100 / (1 + rs))
-    return rsi
-
 def interpret_rsi(rsi):
     if rsi > 70:
         return "Overbought - The asset might be overvalued and could be due for a correction."
@@ -738,97 +566,42 @@ def interpret_rsi(rsi):
 
 async def top_boosted_tokens(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "top_boosted_tokens"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
-    url = "https://api.dexscreener.com/token-boosts/top/v1"
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        top_tokens = data[:5]  # Get the first 5 tokens
-        message = "🔥 **Top 5 Boosted Tokens** 🔥\n\n"
-
-        for token in top_tokens:
-            token_address = token.get("tokenAddress", "N/A")
-            platform = token.get("chainId", "N/A")
-            description = token.get("description", "No description available")
-            url = token.get("url", "N/A")
-            links = token.get("links", [])
-
-            # Build the links section
-            links_message = ""
-            for link in links:
-                link_type = link.get("type", link.get("label", "Unknown"))
-                link_url = link.get("url", "N/A")
-                links_message += f"  - **{link_type.capitalize()}**: [Link]({link_url})\n"
+        data, age = await prefetcher.get("boosted_tokens")
 
-            message += (
-                f"🔗 **DexScreener URL**: [Link]({url})\n"
-                f"🌐 **Platform**: `{platform}`\n\n"
-                f"🏷️ **Token Address**: `{token_address}`\n\n"
-                f"📝 **Description**: {description}\n\n"
-                f"🔗 **Links**:\n{links_message}\n"
-                "------------------------------------\n"
-            )
+        message = render(BOOSTED_TOKENS, {"title": "Top 5 Boosted Tokens"}, boosted_token_items(data[:5]))
+        message += f"\n🕒 _Data age: {format_age(age)}_"
+        await reply_markdown(update, message)
 
-        await update.message.reply_text(message, parse_mode="Markdown")
-
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 async def latest_boosted_tokens(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "latest_boosted_tokens"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
-    url = "https://api.dexscreener.com/token-boosts/top/v1"
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-
-        top_tokens = data[:5]
-        message = "🔥 **Latest Boosted Tokens** 🔥\n\n"
-
-        for token in top_tokens:
-            token_address = token.get("tokenAddress", "N/A")
-            platform = token.get("chainId", "N/A")
-            description = token.get("description", "No description available")
-            url = token.get("url", "N/A")
-            links = token.get("links", [])
-
-            # Build the links section
-            links_message = ""
-            for link in links:
-                link_type = link.get("type", link.get("label", "Unknown"))
-                link_url = link.get("url", "N/A")
-                links_message += f"  - **{link_type.capitalize()}**: [Link]({link_url})\n"
-
-            message += (
-                f"🔗 **DexScreener URL**: [Link]({url})\n"
-                f"🌐 **Platform**: `{platform}`\n\n"
-                f"🏷️ **Token Address**: `{token_address}`\n\n"
-                f"📝 **Description**: {description}\n\n"
-                f"🔗 **Links**:\n{links_message}\n"
-                "------------------------------------\n"
-            )
+        # Kept fresh by the boost feed poller.
+        data, age = await prefetcher.get("latest_boosts")
 
-        await update.message.reply_text(message, parse_mode="Markdown")
+        message = render(BOOSTED_TOKENS, {"title": "Latest Boosted Tokens"}, boosted_token_items(data[:5]))
+        message += f"\n🕒 _Data age: {format_age(age)}_"
+        await reply_markdown(update, message)
 
-    except requests.exceptions.RequestException as e:
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
 
 
 async def token_orders(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "token_orders"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
@@ -846,149 +619,276 @@ async def token_orders(update: Update, context: ContextTypes.DEFAULT_TYPE) -> No
         await update.message.reply_text("Invalid chain ID. Please use either `ethereum` or `solana`.", parse_mode="Markdown")
         return
 
-    url = f"https://api.dexscreener.com/orders/v1/{chain_id}/{token_address}"
-
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
+        data = await fetch_json(DEXSCREENER, f"/orders/v1/{chain_id}/{token_address}")
 
         if not data:
             await update.message.reply_text("No orders found for the specified token.")
             return
 
-        message = f"📋 **Orders for Token**\n🌐 **Chain**: `{chain_id}`\n🏷️ **Token Address**: `{token_address}`\n\n"
+        message = render(
+            TOKEN_ORDERS, {"chain_id": chain_id, "token_address": token_address}, token_order_items(data)
+        )
+        message += stale_note(data)
+        await reply_markdown(update, message)
 
-        type_mapping = {
-            "tokenProfile": "Profile added to Dex Screener",
-            "communityTakeover": "Takeover by the Community",
-            "tokenAd": "Ads in Dex Screener",
-            "trendingBarAd": "Ads in Trending Bar in Dex Screener"
-        }
+    except httpx.HTTPError as e:
+        await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
-        for order in data:
-            order_type = order.get("type", "Unknown")
-            status = order.get("status", "Unknown")
-            timestamp = order.get("paymentTimestamp", 0)
-            datetime_str = datetime.fromtimestamp(timestamp / 1000).strftime("%Y-%m-%d %H:%M:%S")
 
-            message += (
-                f"🔹 **Type**: `{type_mapping.get(order_type, order_type)}`\n"
-                f"🔹 **Status**: `{status.capitalize()}`\n"
-                f"🔹 **Date/Time**: `{datetime_str}`\n"
-                "------------------------------------\n"
-            )
 
-        await update.message.reply_text(message, parse_mode="Markdown")
 
-    except requests.exceptions.RequestException as e:
-        await update.message.reply_text(f"An error occurred while fetching data: {e}")
+def trade_info_message(token_address, pair) -> str:
+    dex_id = pair.get("dexId", "N/A")
+    dex_url = pair.get("url", "N/A")
+    pair_address = pair.get("pairAddress", "N/A")
+    base_symbol = pair.get("baseToken", {}).get("symbol", "N/A")
+    quote_symbol = pair.get("quoteToken", {}).get("symbol", "N/A")
+    price_native = pair.get("priceNative", "N/A")
+    price_usd = pair.get("priceUsd", "N/A")
+    transactions = pair.get("txns", {})
+    volume = pair.get("volume", {})
+    price_change = pair.get("priceChange", {})
+    liquidity = pair.get("liquidity", {}).get("usd", 0)
+    market_cap = pair.get("marketCap", "N/A")
+    fdv = pair.get("fdv", "N/A")
+    active_boosts = pair.get("boosts", {}).get("active", "N/A")
+
+    txns_message = "\n".join(
+        [
+            f"🕒 `{key}`: Buys: `{value.get('buys', 0)}`, Sells: `{value.get('sells', 0)}`"
+            for key, value in transactions.items()
+        ]
+    )
 
+    volume_message = "\n".join(
+        [f"🕒 `{key}`: `${value:,.2f}`" for key, value in volume.items()]
+    )
 
+    price_change_message = "\n".join(
+        [f"🕒 `{key}`: `{value:.2f}%`" for key, value in price_change.items()]
+    )
+
+    return (
+        f"📊 **Token Info for {token_address}** 📊\n\n"
+        f"🌐 **DEX**: `{dex_id}`\n"
+        f"🔗 [DEX Screener URL]({dex_url})\n"
+        f"🏷️ **Pair Address**: `{pair_address}`\n"
+        f"🔄 **Base - Quote**: `{base_symbol} / {quote_symbol}`\n"
+        f"💵 **Price (Native)**: `{price_native}`\n"
+        f"💲 **Price (USD)**: `{price_usd}`\n\n"
+        f"📈 **Transactions:**\n{txns_message}\n\n"
+        f"📊 **Volume (USD):**\n{volume_message}\n\n"
+        f"📉 **Price Change (%):**\n{price_change_message}\n\n"
+        f"💧 **Liquidity (USD)**: `${liquidity:,.2f}`\n"
+        f"🏦 **Market Cap**: `${market_cap}`\n"
+        f"🔮 **FDV**: `${fdv}`\n"
+        f"🔥 **Active Boosts**: `{active_boosts}`\n"
+        "------------------------------------\n"
+    ) + stale_note(pair)
 
 
 async def trade_info(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
-    if not await check_rate_limit(update):
+    if not await check_rate_limit(update, "trade_info"):
         await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
         return
 
-    if not context.args or len(context.args) < 1:
+    # Addresses may be pasted separated by spaces, commas or new lines.
+    token_addresses = list(dict.fromkeys(
+        address for arg in context.args for address in arg.split(",") if address
+    ))
+    if not token_addresses:
         await update.message.reply_text(
-            "Usage: `/trade_info tokenAddress`",
+            "Usage: `/trade_info tokenAddress [tokenAddress ...]`",
             parse_mode="Markdown"
         )
         return
-
-    token_address = context.args[0]
-    url = f"https://api.dexscreener.com/latest/dex/tokens/{token_address}"
+    if len(token_addresses) > TRADE_INFO_MAX_ADDRESSES:
+        await update.message.reply_text(f"Please send at most {TRADE_INFO_MAX_ADDRESSES} addresses at once.")
+        return
 
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        pairs = data.get("pairs", [])
+        # Every lookup goes through the token batcher, so these share
+        # /latest/dex/tokens calls with each other and with other users'.
+        pairs = await asyncio.gather(*(get_token_pair(address) for address in token_addresses))
 
-        if not pairs:
+        if not any(pairs):
             await update.message.reply_text("No data found for the given token address. Please try again.")
             return
 
-        pair = pairs[0]
-
-        dex_id = pair.get("dexId", "N/A")
-        dex_url = pair.get("url", "N/A")
-        pair_address = pair.get("pairAddress", "N/A")
-        base_symbol = pair.get("baseToken", {}).get("symbol", "N/A")
-        quote_symbol = pair.get("quoteToken", {}).get("symbol", "N/A")
-        price_native = pair.get("priceNative", "N/A")
-        price_usd = pair.get("priceUsd", "N/A")
-        transactions = pair.get("txns", {})
-        volume = pair.get("volume", {})
-        price_change = pair.get("priceChange", {})
-        liquidity = pair.get("liquidity", {}).get("usd", 0)
-        market_cap = pair.get("marketCap", "N/A")
-        fdv = pair.get("fdv", "N/A")
-        active_boosts = pair.get("boosts", {}).get("active", "N/A")
-
-        txns_message = "\n".join(
-            [
-                f"🕒 `{key}`: Buys: `{value.get('buys', 0)}`, Sells: `{value.get('sells', 0)}`"
-                for key, value in transactions.items()
-            ]
+        message = "\n".join(
+            trade_info_message(address, pair) if pair else f"❔ No data found for `{address}`.\n"
+            for address, pair in zip(token_addresses, pairs)
         )
+        await reply_markdown(update, message, disable_web_page_preview=True)
 
-        volume_message = "\n".join(
-            [f"🕒 `{key}`: `${value:,.2f}`" for key, value in volume.items()]
-        )
+    except httpx.HTTPError as e:
+        await update.message.reply_text(f"An error occurred while fetching data: {e}")
 
-        price_change_message = "\n".join(
-            [f"🕒 `{key}`: `{value:.2f}%`" for key, value in price_change.items()]
-        )
 
-        message = (
-            f"📊 **Token Info for {token_address}** 📊\n\n"
-            f"🌐 **DEX**: `{dex_id}`\n"
-            f"🔗 [DEX Screener URL]({dex_url})\n"
-            f"🏷️ **Pair Address**: `{pair_address}`\n"
-            f"🔄 **Base - Quote**: `{base_symbol} / {quote_symbol}`\n"
-            f"💵 **Price (Native)**: `{price_native}`\n"
-            f"💲 **Price (USD)**: `{price_usd}`\n\n"
-            f"📈 **Transactions:**\n{txns_message}\n\n"
-            f"📊 **Volume (USD):**\n{volume_message}\n\n"
-            f"📉 **Price Change (%):**\n{price_change_message}\n\n"
-            f"💧 **Liquidity (USD)**: `${liquidity:,.2f}`\n"
-            f"🏦 **Market Cap**: `${market_cap}`\n"
-            f"🔮 **FDV**: `${fdv}`\n"
-            f"🔥 **Active Boosts**: `{active_boosts}`\n"
-            "------------------------------------\n"
+async def alert(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not await check_rate_limit(update, "alert"):
+        await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
+        return
+
+    args = list(context.args)
+    metric = PRICE
+    if len(args) == 4 and args[1].lower() == "rsi":
+        metric = RSI
+        del args[1]
+
+    if len(args) != 3 or args[1] not in (ABOVE, BELOW):
+        await update.message.reply_text(
+            "Usage: `/alert btc > 70000` or `/alert eth rsi < 30`",
+            parse_mode="Markdown"
         )
+        return
 
-        await update.message.reply_text(message, parse_mode="Markdown", disable_web_page_preview=True)
+    query, op, threshold = args
+    try:
+        threshold = float(threshold.replace(",", ""))
+    except ValueError:
+        await update.message.reply_text("The threshold must be a number.")
+        return
+    if metric == RSI and not 0 < threshold < 100:
+        await update.message.reply_text("RSI thresholds must be between 0 and 100.")
+        return
 
-    except requests.exceptions.RequestException as e:
+    try:
+        coin = await resolve_coin(query)
+    except httpx.HTTPError as e:
         await update.message.reply_text(f"An error occurred while fetching data: {e}")
+        return
+    if not coin:
+        await update.message.reply_text(f"No results found for '{query}'. Please try a different query.")
+        return
+
+    new_alert = alert_book.add(update.effective_chat.id, coin.id, coin.symbol or query, metric, op, threshold)
+    if new_alert is None:
+        await update.message.reply_text(f"This chat already has {MAX_ALERTS_PER_CHAT} alerts. Remove one with /unalert <id>.")
+        return
+
+    await update.message.reply_text(
+        f"🔔 **Alert set**: `{new_alert.describe()}`\n"
+        f"I'll check every {ALERT_CHECK_SECONDS} seconds and notify this chat once it triggers.",
+        parse_mode="Markdown"
+    )
+
+
+async def alerts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not await check_rate_limit(update, "alerts"):
+        await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
+        return
+
+    chat_alerts = alert_book.for_chat(update.effective_chat.id)
+    if not chat_alerts:
+        await update.message.reply_text("No active alerts. Create one with `/alert btc > 70000`.", parse_mode="Markdown")
+        return
+
+    message = "🔔 **Active Alerts** 🔔\n\n"
+    for chat_alert in chat_alerts:
+        message += f"`{chat_alert.describe()}`\n"
+    await update.message.reply_text(message, parse_mode="Markdown")
+
+
+async def unalert(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not await check_rate_limit(update, "unalert"):
+        await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
+        return
+
+    if not context.args or not context.args[0].lstrip("#").isdigit():
+        await update.message.reply_text("Usage: `/unalert <id>` (see /alerts for ids)", parse_mode="Markdown")
+        return
+
+    removed = alert_book.remove(update.effective_chat.id, int(context.args[0].lstrip("#")))
+    if removed is None:
+        await update.message.reply_text("No alert with that id in this chat.")
+        return
+    await update.message.reply_text(f"🗑️ Removed alert `{removed.describe()}`", parse_mode="Markdown")
+
+
+async def subscribe_boosts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not await check_rate_limit(update, "subscribe_boosts"):
+        await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
+        return
+
+    if boost_feed.subscribe(update.effective_chat.id):
+        await update.message.reply_text("🔔 New boosted tokens will be posted in this chat. Stop with /unsubscribe_boosts.")
+    else:
+        await update.message.reply_text("This chat is already subscribed to new boosted tokens.")
+
+
+async def unsubscribe_boosts(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+    if not await check_rate_limit(update, "unsubscribe_boosts"):
+        await update.message.reply_text("You're sending commands too quickly. Please wait a second and try again.")
+        return
+
+    if boost_feed.unsubscribe(update.effective_chat.id):
+        await update.message.reply_text("🔕 This chat will no longer receive new boosted tokens.")
+    else:
+        await update.message.reply_text("This chat isn't subscribed to new boosted tokens.")
+
+
+async def startup(application: Application) -> None:
+    alert_book.load()
+    boost_feed.load()
+    await metrics.start()
+
+
+async def shutdown(application: Application) -> None:
+    await metrics.stop()
+    await close_clients()
+
+
+def build_application(with_updater=True, request=None):
+    enable_persistent_cache()
+    builder = (
+        ApplicationBuilder()
+        .token(os.getenv("TELEGRAM_API_KEY"))
+        .concurrent_updates(CONCURRENT_UPDATES)
+        .post_init(startup)
+        .post_shutdown(shutdown)
+    )
+    # ``request`` replaces the Bot API transport (the benchmark uses a fake one).
+    # Either way messages go out through the flood-limit aware send queue.
+    transport = request or TracedRequest(connection_pool_size=CONCURRENT_UPDATES)
+    builder = builder.request(QueuedRequest(transport, send_queue))
+    if not with_updater:
+        builder = builder.updater(None)
+    application = builder.build()
+
+    application.add_handler(command_handler("start", start))
+    application.add_handler(command_handler("search", search))
+    application.add_handler(command_handler("trending", trending))
+    application.add_handler(command_handler("dominance", dominance))
+    application.add_handler(command_handler("companies", companies))
+    application.add_handler(command_handler("categories", categories))
+    application.add_handler(command_handler("coin_details_name", coin_details_name))
+    application.add_handler(command_handler("bop", bop))
+    application.add_handler(command_handler("rsi", rsi))
+    application.add_handler(command_handler("coin_details_address", coin_details_address))
+    application.add_handler(command_handler("top_boosted_tokens", top_boosted_tokens))
+    application.add_handler(command_handler("latest_boosted_tokens", latest_boosted_tokens))
+    application.add_handler(command_handler("token_orders", token_orders))
+    application.add_handler(command_handler("trade_info", trade_info))
+    application.add_handler(command_handler("alert", alert))
+    application.add_handler(command_handler("alerts", alerts))
+    application.add_handler(command_handler("unalert", unalert))
+    application.add_handler(command_handler("subscribe_boosts", subscribe_boosts))
+    application.add_handler(command_handler("unsubscribe_boosts", unsubscribe_boosts))
+    application.add_handler(InlineQueryHandler(instrumented("inline_query", inline_search)))
+
+    application.job_queue.run_repeating(refresh_coin_index, interval=COIN_INDEX_REFRESH_SECONDS, first=0)
+    application.job_queue.run_repeating(refresh_coin_quotes, interval=COIN_QUOTES_REFRESH_SECONDS)
+    application.job_queue.run_repeating(prefetcher.refresh_active, interval=PREFETCH_INTERVAL_SECONDS)
+    application.job_queue.run_repeating(check_alerts, interval=ALERT_CHECK_SECONDS)
+    application.job_queue.run_repeating(poll_boosts, interval=BOOST_POLL_SECONDS, first=0)
+    application.job_queue.run_repeating(flush_last_good, interval=LAST_GOOD_FLUSH_SECONDS)
+    return application
 
 
 def main():
-    TELEGRAM_API_KEY = os.getenv("TELEGRAM_API_KEY")
-    application = ApplicationBuilder().token(TELEGRAM_API_KEY).build()
-
-    application.add_handler(CommandHandler("start", start))
-    application.add_handler(CommandHandler("search", search))
-    application.add_handler(CommandHandler("trending", trending))
-    application.add_handler(CommandHandler("dominance", dominance))
-    application.add_handler(CommandHandler("companies", companies))
-    application.add_handler(CommandHandler("categories", categories))
-    application.add_handler(CommandHandler("coin_details_name", coin_details_name))
-    application.add_handler(CommandHandler("bop", bop))
-    application.add_handler(CommandHandler("rsi", rsi))
-    application.add_handler(CommandHandler("coin_details_address", coin_details_address))
-    application.add_handler(CommandHandler("top_boosted_tokens", top_boosted_tokens))
-    application.add_handler(CommandHandler("latest_boosted_tokens", latest_boosted_tokens))
-    application.add_handler(CommandHandler("token_orders", token_orders))
-    application.add_handler(CommandHandler("trade_info", trade_info))
-
-
-    application.run_polling()
+    run(build_application, os.getenv("TELEGRAM_API_KEY"))
 
 
 if __name__ == "__main__":
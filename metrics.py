@@ -0,0 +1,230 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# In-process metrics served in the Prometheus text format on
+# http://METRICS_HOST:METRICS_PORT/metrics, next to the slow-request traces
+# at /debug/traces (see tracing.py). With several workers each one listens on
+# METRICS_PORT + its worker index.
+
+import asyncio
+import bisect
+import json
+import os
+import time
+
+import shared_state
+import tracing
+
+
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+# 0 disables the endpoint; metrics are still collected.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+LOOP_LAG_INTERVAL_SECONDS = float(os.getenv("LOOP_LAG_INTERVAL_SECONDS", "0.5"))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+_collectors = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    pairs += [f'{name}="{value}"' for name, value in extra]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        _registry.append(self)
+
+    def _header(self):
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def collect(self):
+        lines = self._header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, *labels):
+        self._values[labels] = value
+
+    def inc(self, *labels, amount=1):
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def collect(self):
+        lines = self._header()
+        for labels, value in self._values.items():
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {value}")
+        return lines
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        series = self._values.get(labels)
+        if series is None:
+            # Per-bucket counts (not cumulative) plus sum and count.
+            series = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def collect(self):
+        lines = self._header()
+        for labels, (counts, total, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, [('le', le)])} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {count}")
+        return lines
+
+
+command_latency = Histogram(
+    "pumpies_command_duration_seconds", "Time spent handling a command, including upstream waits.", ["command"]
+)
+command_errors = Counter("pumpies_command_errors_total", "Commands that raised an unhandled exception.", ["command"])
+handlers_in_flight = Gauge("pumpies_handlers_in_flight", "Handlers currently running.", ["command"])
+upstream_latency = Histogram(
+    "pumpies_upstream_request_duration_seconds",
+    "Upstream HTTP request time, excluding time queued for quota.",
+    ["provider", "endpoint"],
+)
+upstream_responses = Counter(
+    "pumpies_upstream_responses_total",
+    "Upstream responses by status code (or exception name for transport errors).",
+    ["provider", "endpoint", "status"],
+)
+rate_limit_rejections = Counter(
+    "pumpies_rate_limit_rejections_total", "Commands refused by the per-user rate limiter.", ["command"]
+)
+busy_rejections = Counter(
+    "pumpies_command_busy_rejections_total", "Commands refused because their concurrency limit was reached.", ["command"]
+)
+cache_requests = Counter("pumpies_cache_requests_total", "Cache lookups by cache and result.", ["cache", "result"])
+event_loop_lag = Gauge("pumpies_event_loop_lag_seconds", "How late the last event-loop lag probe woke up.")
+event_loop_lag_histogram = Histogram(
+    "pumpies_event_loop_lag_probe_seconds", "Event-loop lag probe delays.", buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0)
+)
+
+
+def register_collector(callback):
+    # ``callback`` runs at every scrape, for gauges whose values live
+    # elsewhere (queue depths, breaker states).
+    _collectors.append(callback)
+
+
+def render():
+    for callback in _collectors:
+        try:
+            callback()
+        except Exception as e:
+            print(f"Error collecting metrics: {e}")
+    lines = []
+    for metric in _registry:
+        lines += metric.collect()
+    return "\n".join(lines) + "\n"
+
+
+async def _handle(reader, writer):
+    try:
+        request_line = await reader.readline()
+        while (await reader.readline()).strip():
+            pass
+        parts = request_line.decode("latin-1").split()
+        path = parts[1].split("?")[0] if len(parts) >= 2 and parts[0] == "GET" else None
+        content_type = "text/plain; version=0.0.4; charset=utf-8"
+        if path == "/metrics":
+            status, body = "200 OK", render().encode()
+        elif path == "/debug/traces":
+            status, body = "200 OK", json.dumps(tracing.export_chrome_trace()).encode()
+            content_type = "application/json"
+        else:
+            status, body = "404 Not Found", b"not found\n"
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: close\r\n\r\n".encode() + body
+        )
+        await writer.drain()
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def _monitor_loop_lag():
+    while True:
+        started = time.monotonic()
+        await asyncio.sleep(LOOP_LAG_INTERVAL_SECONDS)
+        lag = max(0.0, time.monotonic() - started - LOOP_LAG_INTERVAL_SECONDS)
+        event_loop_lag.set(lag)
+        event_loop_lag_histogram.observe(lag)
+
+
+_server = None
+_lag_monitor = None
+
+
+async def start():
+    global _server, _lag_monitor
+    _lag_monitor = asyncio.ensure_future(_monitor_loop_lag())
+    if METRICS_PORT:
+        port = METRICS_PORT + shared_state.WORKER_INDEX
+        _server = await asyncio.start_server(_handle, METRICS_HOST, port)
+        print(f"Serving metrics on http://{METRICS_HOST}:{port}/metrics")
+
+
+async def stop():
+    global _server, _lag_monitor
+    if _lag_monitor is not None:
+        _lag_monitor.cancel()
+        _lag_monitor = None
+    if _server is not None:
+        _server.close()
+        await _server.wait_closed()
+        _server = None
@@ -0,0 +1,81 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Slim request profiles for the large upstream documents. ``params`` asks
+# the upstream to leave out sections we never render; ``extract`` runs right
+# after decoding and keeps only the fields the templates read, so caches and
+# the stale fallback hold a few hundred bytes instead of the full document.
+
+
+CATEGORIES_SHOWN = 3
+
+# /coins/{id} and /coins/{platform}/contract/{address}: no localizations,
+# community or developer data. Tickers have no exclusion switch narrower
+# than all-or-nothing, and the details page shows the first one.
+COIN_DETAILS_PARAMS = {
+    "localization": "false",
+    "tickers": "true",
+    "market_data": "true",
+    "community_data": "false",
+    "developer_data": "false",
+    "sparkline": "false",
+}
+
+_COIN_DETAILS_KEYS = (
+    "id",
+    "name",
+    "symbol",
+    "asset_platform_id",
+    "sentiment_votes_up_percentage",
+    "sentiment_votes_down_percentage",
+    "watchlist_portfolio_users",
+)
+_MARKET_DATA_KEYS = (
+    "current_price",
+    "total_supply",
+    "max_supply",
+    "circulating_supply",
+    "market_cap",
+    "ath",
+    "atl",
+    "price_change_percentage_24h",
+)
+_TICKER_KEYS = ("market", "base", "target", "converted_last", "converted_volume", "trust_score", "trade_url")
+_CATEGORY_KEYS = ("id", "name", "market_cap", "market_cap_change_24h", "top_3_coins_id")
+
+
+def _usd_only(value):
+    # Per-currency maps (current_price, market_cap, ...) shrink to USD.
+    return {"usd": value.get("usd")} if isinstance(value, dict) else value
+
+
+def coin_details(doc):
+    if not isinstance(doc, dict):
+        return doc
+    market_data = doc.get("market_data") or {}
+    tickers = doc.get("tickers") or []
+    slim = {key: doc.get(key) for key in _COIN_DETAILS_KEYS}
+    slim["description"] = {"en": ((doc.get("description") or {}).get("en") or "")[:200]}
+    slim["market_data"] = {key: _usd_only(market_data[key]) for key in _MARKET_DATA_KEYS if key in market_data}
+    slim["tickers"] = [
+        {key: _usd_only(ticker[key]) if key.startswith("converted_") else ticker[key] for key in _TICKER_KEYS if key in ticker}
+        for ticker in tickers[:1]
+    ]
+    return slim
+
+
+def top_categories(doc):
+    if not isinstance(doc, list):
+        return doc
+    return [{key: category[key] for key in _CATEGORY_KEYS if key in category} for category in doc[:CATEGORIES_SHOWN]]
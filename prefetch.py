@@ -0,0 +1,123 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Optional
+
+from circuit_breaker import stale_age
+from http_client import COINGECKO, DEXSCREENER, fetch_cached_json, fetch_json, last_fetched_at, persist_last_good
+from payloads import top_categories
+from rate_scheduler import PRIORITY_BACKGROUND
+
+
+PREFETCH_INTERVAL_SECONDS = int(os.getenv("PREFETCH_INTERVAL_SECONDS", "60"))
+# A dataset nobody asked for in this long stops being refreshed until the
+# next command wakes it up again.
+PREFETCH_IDLE_SECONDS = int(os.getenv("PREFETCH_IDLE_SECONDS", "900"))
+# Data older than this is refetched on demand instead of served from memory.
+PREFETCH_MAX_AGE_SECONDS = int(os.getenv("PREFETCH_MAX_AGE_SECONDS", str(PREFETCH_INTERVAL_SECONDS * 3)))
+
+
+@dataclass
+class Dataset:
+    provider: str
+    path: str
+    params: Optional[dict] = None
+    extract: Optional[Callable] = None
+    # Refreshed by its own poller (see boosts.py) rather than refresh_active.
+    polled: bool = False
+    data: Any = None
+    fetched_at: float = 0.0
+    last_access: Optional[float] = None
+
+    @property
+    def age(self):
+        return time.time() - self.fetched_at
+
+    def is_idle(self, now):
+        return self.last_access is None or now - self.last_access > PREFETCH_IDLE_SECONDS
+
+
+class Prefetcher:
+    def __init__(self, datasets):
+        self.datasets = datasets
+        # A restarted bot can answer from these while the upstream is down.
+        for dataset in datasets.values():
+            persist_last_good(dataset.path)
+
+    async def get(self, name):
+        dataset = self.datasets[name]
+        dataset.last_access = time.monotonic()
+        if dataset.data is None or dataset.age > PREFETCH_MAX_AGE_SECONDS:
+            data = await fetch_cached_json(dataset.provider, dataset.path, dataset.params, extract=dataset.extract)
+            await self._store(dataset, data)
+        return dataset.data, dataset.age
+
+    async def refresh(self, name):
+        # Bypasses the response cache, whose adaptive TTL can hold an entry
+        # for up to an hour; revalidation keeps an unchanged refresh cheap.
+        dataset = self.datasets[name]
+        data = await fetch_json(
+            dataset.provider,
+            dataset.path,
+            dataset.params,
+            priority=PRIORITY_BACKGROUND,
+            extract=dataset.extract,
+        )
+        await self._store(dataset, data)
+
+    async def refresh_active(self, context=None) -> None:
+        now = time.monotonic()
+        for name, dataset in self.datasets.items():
+            if dataset.polled or dataset.is_idle(now):
+                continue
+            try:
+                await self.refresh(name)
+            except Exception as e:
+                print(f"Error prefetching {name}: {e}")
+
+    async def put(self, name, data):
+        await self._store(self.datasets[name], data)
+
+    async def _store(self, dataset, data):
+        # A stale fallback only replaces what we hold if it is newer.
+        age = stale_age(data)
+        if age is None:
+            fetched_at = await last_fetched_at(dataset.provider, dataset.path, dataset.params, dataset.extract) or time.time()
+        else:
+            fetched_at = time.time() - age
+        if dataset.data is None or fetched_at > dataset.fetched_at:
+            dataset.data = data
+            dataset.fetched_at = fetched_at
+
+
+prefetcher = Prefetcher({
+    "trending": Dataset(COINGECKO, "/search/trending"),
+    "dominance": Dataset(COINGECKO, "/global"),
+    "categories": Dataset(COINGECKO, "/coins/categories", {"order": "market_cap_change_24h_desc"}, top_categories),
+    "boosted_tokens": Dataset(DEXSCREENER, "/token-boosts/top/v1"),
+    "latest_boosts": Dataset(DEXSCREENER, "/token-boosts/latest/v1", polled=True),
+})
+
+
+def format_age(seconds):
+    seconds = max(0, int(seconds))
+    if seconds < 60:
+        return f"{seconds}s"
+    if seconds < 3600:
+        return f"{seconds // 60}m {seconds % 60}s"
+    return f"{seconds // 3600}h {seconds % 3600 // 60}m"
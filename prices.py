@@ -0,0 +1,82 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import httpx
+
+from batching import MicroBatcher
+from circuit_breaker import is_unavailable, mark_stale, stale_age
+from http_client import COINGECKO, LastGoodItems, fetch_json
+from rate_scheduler import PRIORITY_INTERACTIVE
+from tracing import span
+
+
+# Lookups arriving within this window share one /simple/price call.
+PRICE_BATCH_WINDOW_MS = int(os.getenv("PRICE_BATCH_WINDOW_MS", "50"))
+# Ids per /simple/price request; keeps the query string well under URL limits.
+PRICE_BATCH_MAX_IDS = int(os.getenv("PRICE_BATCH_MAX_IDS", "100"))
+
+PRICE_PARAMS = {
+    "vs_currencies": "usd",
+    "include_market_cap": "true",
+    "include_24hr_vol": "true",
+    "include_24hr_change": "true",
+    "precision": "10",
+}
+
+
+last_good_prices = LastGoodItems("last_good_prices")
+
+
+async def fetch_prices(coin_ids, priority=PRIORITY_INTERACTIVE):
+    coin_ids = sorted(set(coin_ids))
+    prices = {}
+    for start in range(0, len(coin_ids), PRICE_BATCH_MAX_IDS):
+        chunk = coin_ids[start:start + PRICE_BATCH_MAX_IDS]
+        try:
+            data = await fetch_json(COINGECKO, "/simple/price", params={
+                "ids": ",".join(chunk),
+                **PRICE_PARAMS,
+            }, priority=priority)
+        except httpx.HTTPError as e:
+            # No last good response for this exact batch: fall back to each
+            # coin's own last good price.
+            recalled = last_good_prices.recall(chunk) if is_unavailable(e) else None
+            if not recalled:
+                raise
+            prices.update(recalled)
+            continue
+
+        age = stale_age(data)
+        if age is None:
+            last_good_prices.remember(data)
+            prices.update(data)
+            continue
+        # Each coin's entry carries the chunk's stale marker, since callers
+        # only ever see their own coin; a coin's own last good price is at
+        # least as recent.
+        for coin_id, entry in data.items():
+            prices[coin_id] = mark_stale(entry, age)
+        prices.update(last_good_prices.recall(chunk))
+    return prices
+
+
+price_batcher = MicroBatcher(fetch_prices, PRICE_BATCH_WINDOW_MS / 1000, PRICE_BATCH_MAX_IDS)
+
+
+async def get_price(coin_id):
+    with span("price_batch"):
+        return await price_batcher.get(coin_id) or {}
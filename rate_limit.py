@@ -0,0 +1,171 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+import time
+from collections import OrderedDict
+
+from metrics import rate_limit_rejections
+from shared_state import SHARED_STATE, SHARED_STATE_DB, connect
+
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite" if SHARED_STATE else "memory")
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", SHARED_STATE_DB)
+RATE_LIMIT_SECONDS = float(os.getenv("RATE_LIMIT_SECONDS", "1.5"))
+RATE_LIMIT_BURST = float(os.getenv("RATE_LIMIT_BURST", "3"))
+RATE_LIMIT_MAX_USERS = int(os.getenv("RATE_LIMIT_MAX_USERS", "100000"))
+
+# Tokens each command takes from a user's bucket. The bucket refills one
+# token every RATE_LIMIT_SECONDS, so commands that fan out to several
+# upstream calls can't be fired as often as /start.
+COMMAND_COSTS = {
+    "start": 0.5,
+    "search": 1,
+    "trending": 1,
+    "dominance": 1,
+    "companies": 1,
+    "categories": 1,
+    "coin_details_name": 2,
+    "coin_details_address": 2,
+    "rsi": 2,
+    "bop": 2,
+    "top_boosted_tokens": 1,
+    "latest_boosted_tokens": 1,
+    "trade_info": 1,
+    "token_orders": 1,
+    "alert": 1,
+    "alerts": 0.5,
+    "unalert": 0.5,
+    "subscribe_boosts": 0.5,
+    "unsubscribe_boosts": 0.5,
+}
+DEFAULT_COMMAND_COST = 1
+
+
+def _refill(tokens, updated_at, now, capacity, rate):
+    # A clock that stepped backwards must not drive the bucket negative.
+    return min(capacity, tokens + max(0.0, now - updated_at) * rate)
+
+
+def _take(tokens, cost, rate):
+    # Returns the remaining tokens and how long the caller would have to wait
+    # (0 when the cost was taken).
+    if tokens >= cost:
+        return tokens - cost, 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MemoryBucketStore:
+    # Buckets are kept in least-recently-used order, so idle users sit at the
+    # front and eviction never has to scan the whole table.
+    def __init__(self, max_entries=RATE_LIMIT_MAX_USERS):
+        self.max_entries = max_entries
+        self._buckets = OrderedDict()
+
+    def __len__(self):
+        return len(self._buckets)
+
+    def consume(self, key, cost, capacity, rate, idle_ttl):
+        return self.try_take(key, cost, capacity, rate, idle_ttl) == 0
+
+    def try_take(self, key, cost, capacity, rate, idle_ttl):
+        now = time.monotonic()
+        bucket = self._buckets.pop(key, None)
+        tokens = capacity if bucket is None else _refill(bucket[0], bucket[1], now, capacity, rate)
+        tokens, wait = _take(tokens, cost, rate)
+        self._buckets[key] = (tokens, now)
+
+        while self._buckets:
+            oldest_key, (_, updated_at) = next(iter(self._buckets.items()))
+            if len(self._buckets) <= self.max_entries and now - updated_at < idle_ttl:
+                break
+            del self._buckets[oldest_key]
+        return wait
+
+
+class SQLiteBucketStore:
+    # Shared by every bot process on the host, and the table outlives them:
+    # timestamps are wall-clock so rows written before a reboot still read as
+    # the past. time.monotonic() restarts near zero on boot.
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path=RATE_LIMIT_DB):
+        self._db = connect(path)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._calls = 0
+
+    def consume(self, key, cost, capacity, rate, idle_ttl):
+        return self.try_take(key, cost, capacity, rate, idle_ttl) == 0
+
+    def try_take(self, key, cost, capacity, rate, idle_ttl):
+        key = str(key)
+        now = time.time()
+        self._db.execute("BEGIN IMMEDIATE")
+        try:
+            row = self._db.execute("SELECT tokens, updated_at FROM buckets WHERE key = ?", (key,)).fetchone()
+            # A row stamped in the future was written against another clock
+            # (or before the clock was stepped back); start it over full.
+            fresh = row is None or row[1] > now
+            tokens = capacity if fresh else _refill(row[0], row[1], now, capacity, rate)
+            tokens, wait = _take(tokens, cost, rate)
+            self._db.execute(
+                "INSERT INTO buckets (key, tokens, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at",
+                (key, tokens, now),
+            )
+            self._calls += 1
+            if self._calls % self.PRUNE_EVERY == 0:
+                # Only prune buckets from this key's namespace ("user:",
+                # "upstream:", ...), which all share the same idle_ttl.
+                namespace = key.partition(":")[0]
+                self._db.execute(
+                    "DELETE FROM buckets WHERE (updated_at < ? OR updated_at > ?) AND key LIKE ?",
+                    (now - idle_ttl, now, f"{namespace}:%"),
+                )
+            self._db.execute("COMMIT")
+        except BaseException:
+            self._db.execute("ROLLBACK")
+            raise
+        return wait
+
+
+class RateLimiter:
+    def __init__(self, store, seconds_per_token=RATE_LIMIT_SECONDS, burst=RATE_LIMIT_BURST):
+        self.store = store
+        self.rate = 1.0 / seconds_per_token
+        self.capacity = burst
+        # A bucket left alone this long is full again, so forgetting it
+        # changes nothing.
+        self.idle_ttl = burst * seconds_per_token
+
+    def allow(self, user_id, command):
+        cost = COMMAND_COSTS.get(command, DEFAULT_COMMAND_COST)
+        allowed = self.store.consume(f"user:{user_id}", cost, self.capacity, self.rate, self.idle_ttl)
+        if not allowed:
+            rate_limit_rejections.inc(command)
+        return allowed
+
+
+def create_bucket_store(backend=RATE_LIMIT_BACKEND, path=RATE_LIMIT_DB):
+    if backend == "sqlite":
+        return SQLiteBucketStore(path)
+    if backend == "memory":
+        return MemoryBucketStore()
+    raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend}")
+
+
+rate_limiter = RateLimiter(create_bucket_store())
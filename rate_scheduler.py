@@ -0,0 +1,170 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import heapq
+import itertools
+import time
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 10
+
+
+class TokenBucket:
+    def __init__(self, rate_per_second, capacity):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def try_acquire(self, cost=1):
+        self._refill(time.monotonic())
+        if self.tokens >= cost:
+            self.tokens -= cost
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def refund(self, cost=1):
+        self.tokens = min(self.capacity, self.tokens + cost)
+
+
+class SharedTokenBucket:
+    # Same interface as TokenBucket, but the tokens live in a bucket store
+    # shared by every worker process, so the quota is enforced in aggregate.
+    def __init__(self, store, key, rate_per_second, capacity):
+        self.store = store
+        self.key = key
+        self.rate = rate_per_second
+        self.capacity = capacity
+
+    def try_acquire(self, cost=1):
+        return self.store.try_take(self.key, cost, self.capacity, self.rate, self.capacity / self.rate)
+
+
+class WaitStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, wait):
+        self.count += 1
+        self.total += wait
+        self.max = max(self.max, wait)
+        self.last = wait
+
+    @property
+    def average(self):
+        return self.total / self.count if self.count else 0.0
+
+
+class ProviderQueue:
+    def __init__(self, bucket):
+        self.bucket = bucket
+        self.wait_stats = WaitStats()
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._dispatcher = None
+        self.paused_until = 0.0
+
+    def __len__(self):
+        return sum(1 for _, _, future in self._heap if not future.done())
+
+    async def acquire(self, priority=PRIORITY_INTERACTIVE):
+        loop = asyncio.get_running_loop()
+        if self._dispatcher is None or self._dispatcher.done():
+            self._wakeup = asyncio.Event()
+            self._dispatcher = loop.create_task(self._dispatch())
+
+        future = loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), future))
+        self._wakeup.set()
+
+        started = time.monotonic()
+        await future
+        wait = time.monotonic() - started
+        self.wait_stats.record(wait)
+        return wait
+
+    def pause(self, seconds):
+        # The upstream asked us to back off (429): hold every queued request
+        # instead of letting each one fail.
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    def close(self):
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    async def _dispatch(self):
+        while True:
+            while not self._heap:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+
+            future = self._heap[0][2]
+            if future.done():
+                heapq.heappop(self._heap)
+                continue
+
+            paused = self.paused_until - time.monotonic()
+            if paused > 0:
+                await asyncio.sleep(paused)
+                continue
+
+            delay = self.bucket.try_acquire()
+            if delay:
+                # Re-check the head after sleeping: an interactive request may
+                # have arrived and should jump ahead of queued background work.
+                await asyncio.sleep(delay)
+                continue
+
+            heapq.heappop(self._heap)
+            future.set_result(None)
+
+
+class UpstreamScheduler:
+    def __init__(self, buckets):
+        self.queues = {provider: ProviderQueue(bucket) for provider, bucket in buckets.items()}
+
+    async def acquire(self, provider, priority=PRIORITY_INTERACTIVE):
+        return await self.queues[provider].acquire(priority)
+
+    def pause(self, provider, seconds):
+        self.queues[provider].pause(seconds)
+
+    def close(self):
+        for queue in self.queues.values():
+            queue.close()
+
+    def stats(self):
+        return {
+            provider: {
+                "queued": len(queue),
+                "requests": queue.wait_stats.count,
+                "avg_wait": queue.wait_stats.average,
+                "max_wait": queue.wait_stats.max,
+                "last_wait": queue.wait_stats.last,
+                "paused": max(0.0, queue.paused_until - time.monotonic()),
+            }
+            for provider, queue in self.queues.items()
+        }
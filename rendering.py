@@ -0,0 +1,265 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+from datetime import datetime
+
+from tracing import span
+
+
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+class Template:
+    # A message layout: ``header`` and ``footer`` are formatted with the
+    # page fields, ``item`` once per entry of a list. The format strings are
+    # bound once here instead of being rebuilt by every handler call.
+    def __init__(self, name, header="", item="", footer=""):
+        self.name = name
+        self._header = header.format_map
+        self._item = item.format_map
+        self._footer = footer.format_map
+
+    def render(self, fields=None, items=()):
+        fields = fields or {}
+        return self._header(fields) + "".join(map(self._item, items)) + self._footer(fields)
+
+
+def render(template, fields=None, items=()):
+    # Formatting is a handful of format_map calls; hashing the fields to
+    # cache the result would cost about as much.
+    with span(f"render {template.name}"):
+        return template.render(fields, items)
+
+
+def split_message(text, limit=TELEGRAM_MESSAGE_LIMIT):
+    # Cut at the last blank line (or line break) before the limit so a
+    # Markdown entity is never split across two messages.
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n\n", 0, limit)
+        if cut <= 0:
+            cut = text.rfind("\n", 0, limit)
+        if cut <= 0:
+            cut = limit
+        chunks.append(text[:cut])
+        text = text[cut:].lstrip("\n")
+    if text:
+        chunks.append(text)
+    return chunks
+
+
+async def reply_markdown(update, text, **kwargs):
+    for chunk in split_message(text):
+        await update.message.reply_text(chunk, parse_mode="Markdown", **kwargs)
+
+
+COIN_DETAILS = Template(
+    "coin_details",
+    header=(
+        "🪙 **Coin Details** 🪙\n\n"
+        "**Name**: `{name} ({symbol})`\n"
+        "**Platform**: `{asset_platform_id}`\n\n"
+        "👍 **Sentiment Up-vote**: `{sentiment_votes_up_percentage}%`\n"
+        "👎 **Sentiment Down-vote**: `{sentiment_votes_down_percentage}%`\n"
+        "💬 **Watch List Users**: `{watchlist_portfolio_users}`\n\n"
+        "📝 **Description**: {description}...\n\n"
+        "📊 **Market Data** 📊\n\n"
+        "💵 **Current Price (USD)**: `${current_price:,.4f}`\n"
+        "ℹ️ **Total Supply (#)**: `{total_supply}`\n"
+        "ℹ️ **Max Supply (#)**: `{max_supply}`\n"
+        "ℹ️ **Circulating Supply (#)**: `{circulating_supply}`\n"
+        "💰 **Market Cap (USD)**: `${market_cap:,.2f}`\n"
+        "🚀 **All-Time High (USD)**: `${ath:,.8f}`\n"
+        "🏚️ **All-Time Low (USD)**: `${atl:,.8f}`\n"
+        "📉 **24h Price Change**: `{price_change_24h:.4f}%`\n\n"
+        "🏛️ **Top Exchange Information** 🏛️\n\n"
+        "🏦 **Exchange Name**: `{market_name}`\n"
+        "🌐 **Base - Token Address**: `{base}`\n"
+        "🎯 **Target**: `{target}`\n"
+        "💲 **Last Price (USD)**: `${converted_last_usd:,.8f}`\n"
+        "📈 **Volume (USD)**: `${converted_volume_usd:,.2f}`\n"
+        "⭐ **Trust Score (Exchange)**: `{trust_score}`\n\n"
+        "🔗 [Swapp Here]({trade_url})\n"
+    ),
+)
+
+SEARCH_RESULT = Template(
+    "search_result",
+    header=(
+        "🔎 **Search Results**\n\n"
+        "🆔 **ID**: `{coin_id}`\n"
+        "🏷️ **Name**: *{name}*\n"
+        "📊 **Market Cap Rank**: #{market_cap_rank}\n"
+        "💠 **Symbol**: `{symbol}`\n\n"
+        "💵 **Price Details (USD):**\n"
+        "💲 **Current Price**: `${usd_price}`\n"
+        "💰 **Market Cap**: `${usd_market_cap}`\n"
+        "📈 **24h Volume**: `${usd_24h_vol}`\n"
+        "📉 **24h Change**: `{usd_24h_change}%`\n"
+    ),
+)
+
+TRENDING = Template(
+    "trending",
+    header="🔥 **Trending Coins** 🔥\n\n",
+    item=(
+        "🏷️ **Name**: *{name}*\n"
+        "💠 **Symbol**: `{symbol}`\n"
+        "📊 **Rank**: #{rank}\n\n"
+        "💵 **Price Details (USD):**\n"
+        "💲 **Current Price**: `${usd_price}`\n"
+        "💰 **Market Cap**: `${market_cap}`\n"
+        "🪙 **Market Cap (BTC)**: `{market_cap_btc} BTC`\n"
+        "📈 **Total Volume (USD)**: `${total_volume}`\n"
+        "🪙 **Total Volume (BTC)**: `{total_volume_btc} BTC`\n"
+        "---------------------------\n"
+    ),
+)
+
+BOOSTED_TOKENS = Template(
+    "boosted_tokens",
+    header="🔥 **{title}** 🔥\n\n",
+    item=(
+        "🔗 **DexScreener URL**: [Link]({url})\n"
+        "🌐 **Platform**: `{platform}`\n\n"
+        "🏷️ **Token Address**: `{token_address}`\n\n"
+        "📝 **Description**: {description}\n\n"
+        "🔗 **Links**:\n{links}\n"
+        "------------------------------------\n"
+    ),
+)
+
+TOKEN_ORDERS = Template(
+    "token_orders",
+    header="📋 **Orders for Token**\n🌐 **Chain**: `{chain_id}`\n🏷️ **Token Address**: `{token_address}`\n\n",
+    item=(
+        "🔹 **Type**: `{type}`\n"
+        "🔹 **Status**: `{status}`\n"
+        "🔹 **Date/Time**: `{datetime}`\n"
+        "------------------------------------\n"
+    ),
+)
+
+ORDER_TYPES = {
+    "tokenProfile": "Profile added to Dex Screener",
+    "communityTakeover": "Takeover by the Community",
+    "tokenAd": "Ads in Dex Screener",
+    "trendingBarAd": "Ads in Trending Bar in Dex Screener",
+}
+
+
+def _format_number(value, spec):
+    return format(value, spec) if isinstance(value, (float, int)) else "N/A"
+
+
+def search_result_fields(coin, price_info):
+    # ``price_info`` is a /simple/price entry or a cached coin index quote.
+    price_info = price_info or {}
+    return {
+        "coin_id": coin.id,
+        "name": coin.name,
+        "market_cap_rank": coin.market_cap_rank or "N/A",
+        "symbol": coin.symbol.upper(),
+        "usd_price": _format_number(price_info.get("usd"), ",.10f"),
+        "usd_market_cap": _format_number(price_info.get("usd_market_cap"), ",.2f"),
+        "usd_24h_vol": _format_number(price_info.get("usd_24h_vol"), ",.2f"),
+        "usd_24h_change": _format_number(price_info.get("usd_24h_change"), ".2f"),
+    }
+
+
+def coin_details_fields(details_data):
+    market_data = details_data.get("market_data", {})
+    tickers = details_data.get("tickers", [])
+    first_ticker = tickers[0] if tickers else {}
+    return {
+        "name": details_data.get("name"),
+        "symbol": (details_data.get("symbol") or "").upper(),
+        "asset_platform_id": details_data.get("asset_platform_id"),
+        "sentiment_votes_up_percentage": details_data.get("sentiment_votes_up_percentage"),
+        "sentiment_votes_down_percentage": details_data.get("sentiment_votes_down_percentage"),
+        "watchlist_portfolio_users": details_data.get("watchlist_portfolio_users"),
+        "description": (details_data.get("description", {}).get("en") or "")[:200],
+        "current_price": market_data.get("current_price", {}).get("usd"),
+        "total_supply": market_data.get("total_supply", {}),
+        "max_supply": market_data.get("max_supply", {}),
+        "circulating_supply": market_data.get("circulating_supply", {}),
+        "market_cap": market_data.get("market_cap", {}).get("usd"),
+        "ath": market_data.get("ath", {}).get("usd"),
+        "atl": market_data.get("atl", {}).get("usd"),
+        "price_change_24h": market_data.get("price_change_percentage_24h"),
+        "market_name": first_ticker.get("market", {}).get("name"),
+        "base": first_ticker.get("base"),
+        "target": first_ticker.get("target"),
+        "converted_last_usd": first_ticker.get("converted_last", {}).get("usd"),
+        "converted_volume_usd": first_ticker.get("converted_volume", {}).get("usd"),
+        "trust_score": first_ticker.get("trust_score"),
+        "trade_url": first_ticker.get("trade_url"),
+    }
+
+
+def format_usd_price(usd_price):
+    if not isinstance(usd_price, (float, int)):
+        return "N/A"
+    if usd_price > 1:
+        return f"{usd_price:.2f}"
+    if usd_price > 0.0001:
+        return f"{usd_price:.6f}"
+    return f"{usd_price:.10f}"
+
+
+def trending_items(coins):
+    items = []
+    for coin_data in coins:
+        item = coin_data.get("item", {})
+        data = item.get("data", {})
+        items.append({
+            "name": item.get("name", "N/A"),
+            "symbol": item.get("symbol", "N/A").upper(),
+            "rank": item.get("market_cap_rank", "N/A"),
+            "usd_price": format_usd_price(data.get("price", "N/A")),
+            "market_cap": data.get("market_cap", "N/A"),
+            "market_cap_btc": data.get("market_cap_btc", "N/A"),
+            "total_volume": data.get("total_volume", "N/A"),
+            "total_volume_btc": data.get("total_volume_btc", "N/A"),
+        })
+    return items
+
+
+def boosted_token_items(tokens):
+    items = []
+    for token in tokens:
+        links = "".join(
+            f"  - **{link.get('type', link.get('label', 'Unknown')).capitalize()}**: [Link]({link.get('url', 'N/A')})\n"
+            for link in token.get("links", [])
+        )
+        items.append({
+            "url": token.get("url", "N/A"),
+            "platform": token.get("chainId", "N/A"),
+            "token_address": token.get("tokenAddress", "N/A"),
+            "description": token.get("description", "No description available"),
+            "links": links,
+        })
+    return items
+
+
+def token_order_items(orders):
+    return [
+        {
+            "type": ORDER_TYPES.get(order.get("type", "Unknown"), order.get("type", "Unknown")),
+            "status": order.get("status", "Unknown").capitalize(),
+            "datetime": datetime.fromtimestamp(order.get("paymentTimestamp", 0) / 1000).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        for order in orders
+    ]
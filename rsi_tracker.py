@@ -0,0 +1,101 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+from indicators import MS_PER_DAY, RsiState, rsi
+from timeseries import CLOSE, TIMESTAMP, timeseries_store
+from tracing import span
+
+
+RSI_STATE_CACHE_SIZE = int(os.getenv("RSI_STATE_CACHE_SIZE", "1024"))
+# Daily closes used to seed a new state; Wilder smoothing needs several
+# periods of history before the averages settle.
+RSI_SEED_DAYS = int(os.getenv("RSI_SEED_DAYS", "90"))
+
+
+class RsiTracker:
+    def __init__(self, max_states=RSI_STATE_CACHE_SIZE):
+        self.max_states = max_states
+        self._states = OrderedDict()
+        self._locks = {}
+
+    async def current(self, coin_id, period, interval="1d"):
+        with span("rsi.advance"):
+            state, current_price = await self._advance(coin_id, period, interval)
+        if state is None:
+            return None
+        # The last point is today's still-open candle: fold it in without
+        # committing it, so tomorrow's update starts from the real close.
+        return state.peek(current_price)
+
+    async def value_at(self, coin_id, period, price, interval="1d"):
+        # RSI for a price obtained elsewhere (e.g. a batched /simple/price
+        # call). Only touches the series when a new daily candle has closed
+        # since the state was last advanced.
+        state = self._states.get((coin_id, interval, period))
+        if state is None or time.time() * 1000 - state.last_timestamp >= MS_PER_DAY:
+            state, _ = await self._advance(coin_id, period, interval)
+            if state is None:
+                return None
+        return state.peek(price)
+
+    def closed_value(self, coin_id, period, candles_ago, interval="1d"):
+        # RSI at the close ``candles_ago`` candles back, computed from the
+        # stored series (current() brings it up to date), or None without
+        # enough history.
+        closes = timeseries_store.get((coin_id, interval))[:-1, CLOSE]
+        end = len(closes) - candles_ago + 1
+        if end <= period:
+            return None
+        return float(rsi(closes[:end], period)[-1])
+
+    async def _advance(self, coin_id, period, interval):
+        key = (coin_id, interval, period)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            state = self._states.get(key)
+            if state is None:
+                since_ms = time.time() * 1000 - max(RSI_SEED_DAYS, period * 5) * MS_PER_DAY
+            else:
+                self._states.move_to_end(key)
+                since_ms = state.last_timestamp
+
+            series = await timeseries_store.ensure(coin_id, interval, since_ms)
+            if not len(series):
+                return None, None
+            closed, current_price = series[:-1], series[-1, CLOSE]
+
+            if state is None:
+                if len(closed) <= period:
+                    return None, None
+                state = RsiState.from_closes(closed[:, CLOSE], period, closed[-1, TIMESTAMP])
+                self._remember(key, state)
+            else:
+                for timestamp, close in closed[closed[:, TIMESTAMP] > state.last_timestamp][:, [TIMESTAMP, CLOSE]]:
+                    state.update(close, timestamp)
+        self._locks.pop(key, None)
+        return state, current_price
+
+    def _remember(self, key, state):
+        self._states[key] = state
+        while len(self._states) > self.max_states:
+            self._states.popitem(last=False)
+
+
+rsi_tracker = RsiTracker()
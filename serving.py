@@ -0,0 +1,199 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import asyncio
+import multiprocessing
+import os
+import queue
+import signal
+
+from telegram import Update
+from telegram.ext import ApplicationBuilder, ApplicationHandlerStop, CommandHandler, TypeHandler
+from telegram.request import HTTPXRequest
+
+import metrics
+import shared_state
+import tracing
+from shared_state import BOT_WORKERS, shard_for
+
+
+BOT_MODE = os.getenv("BOT_MODE", "polling")
+CONCURRENT_UPDATES = int(os.getenv("CONCURRENT_UPDATES", "64"))
+
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_LISTEN = os.getenv("WEBHOOK_LISTEN", "0.0.0.0")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8443"))
+WEBHOOK_PATH = os.getenv("WEBHOOK_PATH", "telegram")
+WEBHOOK_SECRET = os.getenv("WEBHOOK_SECRET")
+
+# Handlers allowed to run at once per command. Commands that can trigger
+# several upstream calls get less room so they can't crowd out the cheap
+# ones when CONCURRENT_UPDATES is high. A command over its limit is turned
+# away at once: waiting would keep holding one of PTB's CONCURRENT_UPDATES
+# slots, which are taken before the handler runs.
+DEFAULT_COMMAND_CONCURRENCY = int(os.getenv("DEFAULT_COMMAND_CONCURRENCY", "32"))
+COMMAND_CONCURRENCY = {
+    "coin_details_name": 8,
+    "coin_details_address": 8,
+    "rsi": 8,
+    "bop": 8,
+    "companies": 8,
+}
+
+
+def instrumented(name, callback):
+    async def timed(update, context):
+        metrics.handlers_in_flight.inc(name)
+        trace = tracing.start(name)
+        try:
+            await callback(update, context)
+        except Exception:
+            metrics.command_errors.inc(name)
+            raise
+        finally:
+            tracing.finish(trace)
+            metrics.command_latency.observe(trace.duration, name)
+            metrics.handlers_in_flight.dec(name)
+
+    return timed
+
+
+class TracedRequest(HTTPXRequest):
+    # Bot API calls (reply_text and friends) show up as spans of the
+    # handler that made them.
+    async def do_request(self, url, method, *args, **kwargs):
+        with tracing.span(f"telegram.{url.rsplit('/', 1)[-1]}"):
+            return await super().do_request(url, method, *args, **kwargs)
+
+
+BUSY_REPLY = "The bot is busy with other /{command} requests right now. Please try again in a few seconds."
+
+
+def command_handler(command, callback):
+    semaphore = asyncio.Semaphore(COMMAND_CONCURRENCY.get(command, DEFAULT_COMMAND_CONCURRENCY))
+
+    async def limited(update, context):
+        if semaphore.locked():
+            metrics.busy_rejections.inc(command)
+            if update.effective_message is not None:
+                await update.effective_message.reply_text(BUSY_REPLY.format(command=command))
+            return
+        async with semaphore:
+            await callback(update, context)
+
+    return CommandHandler(command, instrumented(command, limited))
+
+
+def run(build_application, token):
+    if BOT_WORKERS > 1:
+        run_sharded(build_application, token)
+        return
+
+    application = build_application()
+    if BOT_MODE == "webhook":
+        _run_webhook(application)
+    elif BOT_MODE == "polling":
+        application.run_polling()
+    else:
+        raise ValueError(f"Unknown BOT_MODE: {BOT_MODE}")
+
+
+def _run_webhook(application):
+    if not WEBHOOK_URL:
+        raise ValueError("WEBHOOK_URL must be set when BOT_MODE=webhook")
+    application.run_webhook(
+        listen=WEBHOOK_LISTEN,
+        port=WEBHOOK_PORT,
+        url_path=WEBHOOK_PATH,
+        webhook_url=f"{WEBHOOK_URL.rstrip('/')}/{WEBHOOK_PATH}",
+        secret_token=WEBHOOK_SECRET,
+        max_connections=min(CONCURRENT_UPDATES * BOT_WORKERS, 100),
+    )
+
+
+# Multi-worker mode: this process only receives updates (webhook or
+# polling) and hands each one to a worker process chosen by chat id, so a
+# chat's updates are always handled in order by the same worker. Workers
+# run the full bot without an updater and share cache, rate limits and
+# upstream quota through shared_state.
+
+def _shard(update, workers):
+    chat = update.effective_chat
+    user = update.effective_user
+    return shard_for(chat.id if chat else (user.id if user else update.update_id), workers)
+
+
+def run_sharded(build_application, token):
+    context = multiprocessing.get_context("spawn")
+    queues = [context.Queue() for _ in range(BOT_WORKERS)]
+    workers = [
+        context.Process(
+            target=_worker_main, args=(build_application, index, worker_queue), name=f"pumpies-worker-{index}"
+        )
+        for index, worker_queue in enumerate(queues)
+    ]
+    for worker in workers:
+        worker.start()
+
+    async def forward(update, context):
+        queues[_shard(update, len(queues))].put(update.to_dict())
+        raise ApplicationHandlerStop
+
+    front = ApplicationBuilder().token(token).concurrent_updates(True).build()
+    front.add_handler(TypeHandler(Update, forward), group=-1)
+    try:
+        if BOT_MODE == "webhook":
+            _run_webhook(front)
+        else:
+            front.run_polling()
+    finally:
+        for worker_queue in queues:
+            worker_queue.put(None)
+        for worker in workers:
+            worker.join(timeout=30)
+
+
+def _worker_main(build_application, index, worker_queue):
+    # The front process handles Ctrl-C and tells the workers to stop.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    shared_state.WORKER_INDEX = index
+    asyncio.run(_serve_worker(build_application(with_updater=False), worker_queue))
+
+
+async def _serve_worker(application, worker_queue):
+    loop = asyncio.get_running_loop()
+
+    def next_update():
+        while True:
+            try:
+                return worker_queue.get(timeout=1.0)
+            except queue.Empty:
+                continue
+
+    async with application:
+        # initialize()/shutdown() don't run these hooks by themselves.
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            while True:
+                data = await loop.run_in_executor(None, next_update)
+                if data is None:
+                    break
+                await application.update_queue.put(Update.de_json(data, application.bot))
+        finally:
+            await application.stop()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
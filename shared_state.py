@@ -0,0 +1,46 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# State shared by every bot worker on the host: response cache, rate-limit
+# buckets and upstream quota. SQLite in WAL mode lets several processes read
+# concurrently while writes are serialized by the database lock.
+
+import os
+import sqlite3
+
+
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", os.path.join("data", "shared.sqlite3"))
+SHARED_STATE = os.getenv("SHARED_STATE", "1" if BOT_WORKERS > 1 else "0") == "1"
+
+# Set by serving in each worker process; 0 in single-process mode.
+WORKER_INDEX = 0
+
+
+def shard_for(chat_id, workers=BOT_WORKERS):
+    return abs(chat_id) % workers
+
+
+def owns_chat(chat_id):
+    return shard_for(chat_id) == WORKER_INDEX
+
+
+def connect(path=SHARED_STATE_DB):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    db = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+    db.execute("PRAGMA journal_mode=WAL")
+    db.execute("PRAGMA synchronous=NORMAL")
+    return db
@@ -0,0 +1,77 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+import sys
+
+import httpx
+import pytest
+
+# The bot's modules live at the repository root.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import http_client  # noqa: E402
+from cache import ResponseCache  # noqa: E402
+from rate_scheduler import TokenBucket, UpstreamScheduler  # noqa: E402
+
+
+class FakeClock:
+    # Stands in for the ``time`` module of the code under test, so both
+    # clocks only move when a test advances them.
+    def __init__(self, now=1_700_000_000.0, monotonic=1000.0):
+        self.now = now
+        self.monotonic_now = monotonic
+
+    def time(self):
+        return self.now
+
+    def monotonic(self):
+        return self.monotonic_now
+
+    def advance(self, seconds):
+        self.now += seconds
+        self.monotonic_now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+class Upstream:
+    # Serves queued responses and records the requests it got.
+    def __init__(self):
+        self.responses = []
+        self.requests = []
+
+    def __call__(self, request):
+        self.requests.append(request)
+        return self.responses.pop(0)
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    # CoinGecko served from a MockTransport, with http_client's caches,
+    # breakers and quota reset for the test.
+    upstream = Upstream()
+    client = httpx.AsyncClient(base_url="https://upstream.test", transport=httpx.MockTransport(upstream))
+    monkeypatch.setattr(http_client, "_clients", {http_client.COINGECKO: client})
+    monkeypatch.setattr(http_client, "_breakers", {})
+    monkeypatch.setattr(http_client, "_freshness", {})
+    monkeypatch.setattr(http_client, "cache_tier", None)
+    monkeypatch.setattr(http_client, "response_cache", ResponseCache())
+    monkeypatch.setattr(http_client, "last_good", ResponseCache(name="last_good"))
+    monkeypatch.setattr(http_client, "_pending_last_good", {})
+    monkeypatch.setattr(http_client, "upstream_scheduler", UpstreamScheduler({http_client.COINGECKO: TokenBucket(1000, 1000)}))
+    return upstream
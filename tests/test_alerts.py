@@ -0,0 +1,103 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import pytest
+
+import alerts
+from alerts import ABOVE, BELOW, PRICE, Alert, AlertBook, ThresholdBook
+from circuit_breaker import mark_stale
+
+
+def _alert(alert_id, op, threshold):
+    return Alert(alert_id, 1, "bitcoin", "btc", PRICE, op, threshold)
+
+
+@pytest.fixture
+def book():
+    book = ThresholdBook()
+    for alert in [
+        _alert(1, ABOVE, 100),
+        _alert(2, ABOVE, 120),
+        _alert(3, ABOVE, 100),
+        _alert(4, BELOW, 50),
+        _alert(5, BELOW, 80),
+    ]:
+        book.add(alert)
+    return book
+
+
+def _ids(alerts):
+    return sorted(alert.id for alert in alerts)
+
+
+def test_value_between_thresholds_triggers_nothing(book):
+    assert book.pop_triggered(90) == []
+    assert len(book) == 5
+
+
+def test_crossing_is_strict(book):
+    assert book.pop_triggered(100) == []
+    assert book.pop_triggered(80) == []
+
+
+def test_rising_price_triggers_every_crossed_above_alert(book):
+    assert _ids(book.pop_triggered(110)) == [1, 3]
+    assert _ids(book.pop_triggered(130)) == [2]
+
+
+def test_falling_price_triggers_every_crossed_below_alert(book):
+    assert _ids(book.pop_triggered(40)) == [4, 5]
+    assert len(book) == 3
+
+
+def test_triggered_alerts_fire_once(book):
+    book.pop_triggered(200)
+    assert book.pop_triggered(200) == []
+
+
+def test_remove_picks_the_right_alert_among_equal_thresholds(book):
+    book.remove(_alert(3, ABOVE, 100))
+    assert _ids(book.pop_triggered(110)) == [1]
+
+
+def test_alert_book_forgets_triggered_alerts(tmp_path):
+    alert_book = AlertBook(str(tmp_path / "alerts.sqlite3"))
+    alert_book.load()
+    first = alert_book.add(1, "bitcoin", "btc", PRICE, ABOVE, 100)
+    second = alert_book.add(1, "bitcoin", "btc", PRICE, BELOW, 50)
+
+    assert alert_book.pop_triggered("bitcoin", PRICE, 150) == [first]
+    assert alert_book.for_chat(1) == [second]
+
+    reloaded = AlertBook(alert_book.path)
+    reloaded.load()
+    assert reloaded.for_chat(1) == [second]
+
+
+def test_stale_prices_do_not_trigger_alerts(tmp_path, monkeypatch):
+    alert_book = AlertBook(str(tmp_path / "alerts.sqlite3"))
+    alert_book.load()
+    alert_book.add(1, "bitcoin", "btc", PRICE, ABOVE, 100)
+    alert_book.add(1, "ethereum", "eth", PRICE, ABOVE, 100)
+
+    async def fetch_prices(coin_ids, priority):
+        return {"bitcoin": mark_stale({"usd": 150.0}, 600), "ethereum": {"usd": 150.0}}
+
+    monkeypatch.setattr(alerts, "alert_book", alert_book)
+    monkeypatch.setattr(alerts, "fetch_prices", fetch_prices)
+    fired = asyncio.run(alerts.evaluate_alerts())
+    assert [alert.coin_id for alert, _ in fired] == ["ethereum"]
+    assert [alert.coin_id for alert in alert_book.for_chat(1)] == ["bitcoin"]
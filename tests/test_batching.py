@@ -0,0 +1,76 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+from batching import MicroBatcher
+
+
+class FakeUpstream:
+    def __init__(self, error=None):
+        self.calls = []
+        self.error = error
+
+    async def fetch_batch(self, keys):
+        self.calls.append(sorted(keys))
+        if self.error is not None:
+            raise self.error
+        return {key: key.upper() for key in keys if key != "unknown"}
+
+
+def test_concurrent_lookups_share_one_call():
+    upstream = FakeUpstream()
+
+    async def scenario():
+        batcher = MicroBatcher(upstream.fetch_batch, window=0.01, max_batch=100)
+        return await asyncio.gather(*(batcher.get(key) for key in ["btc", "eth", "btc", "unknown"]))
+
+    assert asyncio.run(scenario()) == ["BTC", "ETH", "BTC", None]
+    assert upstream.calls == [["btc", "eth", "unknown"]]
+
+
+def test_full_batch_is_sent_without_waiting_for_the_window():
+    upstream = FakeUpstream()
+
+    async def scenario():
+        batcher = MicroBatcher(upstream.fetch_batch, window=60, max_batch=2)
+        return await asyncio.wait_for(asyncio.gather(batcher.get("a"), batcher.get("b")), timeout=1)
+
+    assert asyncio.run(scenario()) == ["A", "B"]
+    assert upstream.calls == [["a", "b"]]
+
+
+def test_batch_failure_reaches_every_caller():
+    upstream = FakeUpstream(error=RuntimeError("upstream down"))
+
+    async def scenario():
+        batcher = MicroBatcher(upstream.fetch_batch, window=0.01, max_batch=100)
+        return await asyncio.gather(batcher.get("a"), batcher.get("b"), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert [str(result) for result in results] == ["upstream down", "upstream down"]
+
+
+def test_cancelled_caller_does_not_cancel_the_batch():
+    upstream = FakeUpstream()
+
+    async def scenario():
+        batcher = MicroBatcher(upstream.fetch_batch, window=0.01, max_batch=100)
+        impatient = asyncio.ensure_future(batcher.get("a"))
+        patient = asyncio.ensure_future(batcher.get("a"))
+        await asyncio.sleep(0)
+        impatient.cancel()
+        return await patient
+
+    assert asyncio.run(scenario()) == "A"
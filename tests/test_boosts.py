@@ -0,0 +1,57 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from boosts import BoostFeed, SeenKeys
+
+
+def boost(address, chain="solana"):
+    return {"chainId": chain, "tokenAddress": address}
+
+
+def addresses(boosts):
+    return [item["tokenAddress"] for item in boosts]
+
+
+def test_first_poll_only_primes_the_feed(tmp_path):
+    feed = BoostFeed(str(tmp_path / "boosts.sqlite3"))
+
+    assert feed.diff([boost("b"), boost("a")]) == []
+    assert feed.diff([boost("b"), boost("a")]) == []
+    assert len(feed.seen) == 2
+
+
+def test_new_boosts_are_returned_newest_first(tmp_path):
+    feed = BoostFeed(str(tmp_path / "boosts.sqlite3"))
+    feed.diff([boost("a")])
+
+    new = feed.diff([boost("d"), boost("C"), boost("b", chain="base"), boost("a")])
+
+    assert addresses(new) == ["d", "C", "b"]
+    # Addresses are compared case-insensitively.
+    assert feed.diff([boost("c"), boost("d")]) == []
+
+
+def test_seen_keys_forget_the_oldest_key_first():
+    seen = SeenKeys(size=2)
+
+    assert seen.add("a")
+    assert seen.add("b")
+    assert not seen.add("a")
+    assert seen.add("c")
+
+    assert len(seen) == 2
+    assert "a" not in seen
+    assert "b" in seen and "c" in seen
+    assert seen.add("a")
+    assert "b" not in seen
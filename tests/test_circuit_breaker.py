@@ -0,0 +1,146 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import httpx
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, mark_stale, retry_after, stale_age
+
+HOLD = 0.01
+
+
+@pytest.fixture(autouse=True)
+def short_holds(monkeypatch):
+    monkeypatch.setattr(circuit_breaker, "BREAKER_OPEN_SECONDS", HOLD)
+    monkeypatch.setattr(circuit_breaker, "BREAKER_MAX_OPEN_SECONDS", HOLD * 4)
+
+
+def _status_error(status, headers=None):
+    request = httpx.Request("GET", "https://upstream.test/coins/list")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, headers=headers, request=request))
+
+
+class Probe:
+    def __init__(self, *outcomes):
+        self.outcomes = list(outcomes)
+        self.calls = 0
+
+    async def __call__(self):
+        self.calls += 1
+        outcome = self.outcomes.pop(0)
+        if outcome is not None:
+            raise outcome
+
+
+def _fail(breaker, probe, times):
+    for _ in range(times):
+        breaker.record_failure(probe)
+
+
+def test_breaker_opens_once_enough_calls_fail():
+    async def scenario():
+        breaker = CircuitBreaker("test")
+        probe = Probe(None)
+        for _ in range(2):
+            breaker.record_success(0.1)
+        _fail(breaker, probe, 2)
+        assert breaker.state == CLOSED
+        _fail(breaker, probe, 1)
+        assert breaker.state == OPEN and not breaker.allow()
+        breaker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_slow_successes_count_as_failures():
+    async def scenario():
+        breaker = CircuitBreaker("test")
+        for _ in range(circuit_breaker.BREAKER_MIN_CALLS):
+            breaker.record_success(circuit_breaker.BREAKER_SLOW_CALL_SECONDS)
+        assert breaker.state == OPEN
+        breaker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_successful_probe_closes_the_breaker():
+    async def scenario():
+        breaker = CircuitBreaker("test")
+        probe = Probe(None)
+        _fail(breaker, probe, circuit_breaker.BREAKER_MIN_CALLS)
+        await asyncio.sleep(HOLD * 3)
+        assert probe.calls == 1
+        assert breaker.state == CLOSED and breaker.allow()
+        assert breaker.stats()["calls"] == 0
+
+    asyncio.run(scenario())
+
+
+def test_failed_probe_reopens_with_a_longer_hold():
+    async def scenario():
+        breaker = CircuitBreaker("test")
+        gate = asyncio.Event()
+
+        async def probe():
+            assert breaker.state == HALF_OPEN
+            gate.set()
+            raise _status_error(503)
+
+        _fail(breaker, probe, circuit_breaker.BREAKER_MIN_CALLS)
+        await gate.wait()
+        await asyncio.sleep(0)
+        assert breaker.state == OPEN
+        assert breaker.times_opened == 2
+        assert breaker._open_seconds == HOLD * 2
+        breaker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_probe_rejected_for_a_client_error_still_closes():
+    # A 404 says the upstream is answering, so the breaker has done its job.
+    async def scenario():
+        breaker = CircuitBreaker("test")
+        probe = Probe(_status_error(404))
+        _fail(breaker, probe, circuit_breaker.BREAKER_MIN_CALLS)
+        await asyncio.sleep(HOLD * 3)
+        assert breaker.state == CLOSED
+
+    asyncio.run(scenario())
+
+
+def test_trip_holds_for_retry_after():
+    async def scenario():
+        breaker = CircuitBreaker("test")
+        breaker.trip(Probe(None), hold=retry_after(_status_error(429, {"retry-after": "120"})))
+        assert breaker.state == OPEN
+        assert breaker.retry_in == pytest.approx(120, abs=1)
+        breaker.cancel()
+
+    asyncio.run(scenario())
+
+
+def test_retry_after_accepts_http_dates():
+    assert retry_after(_status_error(503, {"retry-after": "Wed, 21 Oct 2015 07:28:00 GMT"})) == 0.0
+    assert retry_after(_status_error(503)) is None
+
+
+def test_stale_markers():
+    assert stale_age({"usd": 1.0}) is None
+    assert stale_age(mark_stale({"usd": 1.0}, 30)) == 30
+    assert stale_age(mark_stale([1, 2], 30)) == 30
+    assert mark_stale({"usd": 1.0}, 30) == {"usd": 1.0}
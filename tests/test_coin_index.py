@@ -0,0 +1,71 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+from coin_index import CoinIndex
+
+
+COINS = [
+    {"id": "ethereum-wormhole", "symbol": "ETH", "name": "Ethereum (Wormhole)"},
+    {"id": "ethereum", "symbol": "eth", "name": "Ethereum"},
+    {"id": "bitcoin-cash", "symbol": "bch", "name": "Bitcoin Cash"},
+    {"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"},
+    {"id": "bitcoin-gold", "symbol": "btg", "name": "Bitcoin Gold"},
+    {"id": "bitcoinz", "symbol": "btcz", "name": "BitcoinZ"},
+]
+RANKS = {"bitcoin": 1, "ethereum": 2, "bitcoin-cash": 20, "ethereum-wormhole": 900}
+
+
+@pytest.fixture
+def index():
+    index = CoinIndex()
+    index.load(COINS, RANKS)
+    return index
+
+
+def ids(entries):
+    return [entry.id for entry in entries]
+
+
+def test_exact_symbol_ties_go_to_the_best_ranked_coin(index):
+    assert index.lookup("ETH").id == "ethereum"
+    assert index.lookup(" eth ").id == "ethereum"
+
+
+def test_lookup_falls_back_to_the_best_ranked_prefix_match(index):
+    assert index.lookup("bitc").id == "bitcoin"
+    assert index.lookup("bi").id == "bitcoin"
+    assert index.lookup("nothing-like-it") is None
+
+
+def test_unranked_coins_come_after_ranked_ones(index):
+    # bitcoin-gold and bitcoinz have no rank; the shorter name wins the tie.
+    assert ids(index.prefix("bitc")) == ["bitcoin", "bitcoin-cash", "bitcoinz", "bitcoin-gold"]
+    assert ids(index.prefix("bi")) == ["bitcoin", "bitcoin-cash", "bitcoinz", "bitcoin-gold"]
+
+
+def test_search_lists_exact_matches_before_prefix_matches(index):
+    assert ids(index.search("btc")) == ["bitcoin", "bitcoinz"]
+    assert ids(index.search("eth", limit=1)) == ["ethereum"]
+
+
+def test_load_invalidates_cached_prefixes(index):
+    assert ids(index.prefix("bitc", limit=1)) == ["bitcoin"]
+
+    index.load(COINS, {"bitcoinz": 1})
+
+    assert ids(index.prefix("bitc", limit=1)) == ["bitcoinz"]
+    assert ids(index.prefix("bi", limit=1)) == ["bitcoinz"]
+    assert index.lookup("bitc").id == "bitcoinz"
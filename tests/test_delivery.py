@@ -0,0 +1,123 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import json
+import time
+from types import SimpleNamespace
+
+import delivery
+from delivery import QueuedRequest, SendQueue
+from rate_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, TokenBucket
+
+SEND_MESSAGE_URL = "https://api.telegram.org/bot123:abc/sendMessage"
+
+
+class ClosedBucket:
+    # Grants tokens only once opened.
+    open = False
+
+    def try_acquire(self, cost=1):
+        return 0.0 if self.open else 0.01
+
+    def refund(self, cost=1):
+        pass
+
+
+def open_bucket():
+    return TokenBucket(1000, 1000)
+
+
+def test_interactive_replies_go_before_broadcasts():
+    async def scenario():
+        bucket = ClosedBucket()
+        queue = SendQueue(bucket)
+        order = []
+
+        async def send(name, chat_id, priority):
+            await queue.acquire(chat_id, priority)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(send("broadcast", 1, PRIORITY_BACKGROUND))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(send("reply", 2, PRIORITY_INTERACTIVE)))
+        await asyncio.sleep(0)
+        bucket.open = True
+        await asyncio.gather(*tasks)
+        queue.close()
+        return order
+
+    assert asyncio.run(scenario()) == ["reply", "broadcast"]
+
+
+def test_chat_over_its_limit_does_not_hold_up_other_chats(monkeypatch):
+    monkeypatch.setattr(delivery, "SEND_CHAT_BURST", 1)
+    monkeypatch.setattr(delivery, "SEND_CHAT_PER_SECOND", 20)
+
+    async def scenario():
+        queue = SendQueue(open_bucket())
+        order = []
+
+        async def send(name, chat_id):
+            await queue.acquire(chat_id)
+            order.append(name)
+
+        await asyncio.gather(send("first", 1), send("second", 1), send("other chat", 2))
+        queue.close()
+        return order
+
+    assert asyncio.run(scenario()) == ["first", "other chat", "second"]
+
+
+class FakeTransport:
+    # Answers sends with queued (status, payload) pairs and records when
+    # each one was made.
+    def __init__(self, responses):
+        self.responses = responses
+        self.sent_at = []
+
+    async def do_request(self, url, method, request_data=None, *args, **kwargs):
+        self.sent_at.append(time.monotonic())
+        return self.responses.pop(0)
+
+
+def test_retry_after_pauses_sending_and_retries():
+    throttled = json.dumps({"ok": False, "parameters": {"retry_after": 0.05}}).encode()
+    transport = FakeTransport([(429, throttled), (200, b'{"ok": true}')])
+
+    async def scenario():
+        queue = SendQueue(open_bucket())
+        request = QueuedRequest(transport, queue)
+        status, _ = await request.do_request(SEND_MESSAGE_URL, "POST", SimpleNamespace(parameters={"chat_id": 1}))
+        queue.close()
+        return status, queue.paused_until
+
+    status, paused_until = asyncio.run(scenario())
+    assert status == 200
+    assert paused_until >= transport.sent_at[0] + 0.05
+    # Allow for the event loop's clock resolution.
+    assert transport.sent_at[1] >= paused_until - 0.005
+
+
+def test_pause_holds_back_every_chat():
+    async def scenario():
+        queue = SendQueue(open_bucket())
+        queue.pause(0.05)
+        paused_until = queue.paused_until
+        await queue.acquire(2)
+        queue.close()
+        return paused_until, time.monotonic()
+
+    paused_until, sent_at = asyncio.run(scenario())
+    assert sent_at >= paused_until - 0.005
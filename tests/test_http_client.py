@@ -0,0 +1,145 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import httpx
+import pytest
+
+import http_client
+from circuit_breaker import stale_age
+from http_client import COINGECKO, fetch_json
+
+
+def test_server_error_falls_back_to_last_good_response(upstream):
+    upstream.responses = [httpx.Response(200, json={"usd": 1.0}), httpx.Response(500)]
+
+    async def scenario():
+        fresh = await fetch_json(COINGECKO, "/simple/price", {"ids": "bitcoin"})
+        stale = await fetch_json(COINGECKO, "/simple/price", {"ids": "bitcoin"})
+        return fresh, stale
+
+    fresh, stale = asyncio.run(scenario())
+    assert stale_age(fresh) is None
+    assert stale == {"usd": 1.0}
+    assert stale_age(stale) >= 0
+
+
+def test_server_error_without_last_good_response_raises(upstream):
+    upstream.responses = [httpx.Response(500)]
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(fetch_json(COINGECKO, "/simple/price", {"ids": "bitcoin"}))
+
+
+def test_client_error_is_not_served_stale(upstream):
+    upstream.responses = [httpx.Response(200, json={"id": "bitcoin"}), httpx.Response(404)]
+
+    async def scenario():
+        await fetch_json(COINGECKO, "/coins/bitcoin")
+        await fetch_json(COINGECKO, "/coins/bitcoin")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(scenario())
+
+
+def test_rate_limited_provider_answers_stale_without_calling_upstream(upstream):
+    upstream.responses = [httpx.Response(200, json=[1]), httpx.Response(429, headers={"retry-after": "60"})]
+
+    async def scenario():
+        await fetch_json(COINGECKO, "/coins/list")
+        await fetch_json(COINGECKO, "/coins/list")
+        result = await fetch_json(COINGECKO, "/coins/list")
+        for breaker in http_client._breakers.values():
+            breaker.cancel()
+        return result
+
+    assert stale_age(asyncio.run(scenario())) is not None
+    assert len(upstream.requests) == 2
+
+
+def test_revalidation_reuses_body_on_304(upstream):
+    upstream.responses = [
+        httpx.Response(200, json={"market_cap": 1}, headers={"etag": '"v1"', "last-modified": "Wed, 21 Oct 2015 07:28:00 GMT"}),
+        httpx.Response(304, headers={"etag": '"v1"'}),
+    ]
+
+    async def scenario():
+        first = await fetch_json(COINGECKO, "/global")
+        second = await fetch_json(COINGECKO, "/global")
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert second == first == {"market_cap": 1}
+    assert "if-none-match" not in upstream.requests[0].headers
+    assert upstream.requests[1].headers["if-none-match"] == '"v1"'
+    assert upstream.requests[1].headers["if-modified-since"] == "Wed, 21 Oct 2015 07:28:00 GMT"
+
+
+def test_freshness_adapts_to_how_often_data_changes(upstream):
+    low, high = http_client.CACHE_TTLS["/global"]
+    upstream.responses = [
+        httpx.Response(200, json={"market_cap": 1}, headers={"etag": '"v1"'}),
+        httpx.Response(304),
+        httpx.Response(200, json={"market_cap": 1}, headers={"etag": '"v2"'}),
+        httpx.Response(200, json={"market_cap": 2}, headers={"etag": '"v3"'}),
+    ]
+
+    async def scenario():
+        ttls = []
+        for _ in upstream.responses[:]:
+            await fetch_json(COINGECKO, "/global")
+            ttls.append(http_client.get_freshness("/global").ttl)
+        return ttls
+
+    # Unchanged (a 304, or a 200 with the same body) doubles; a change halves.
+    assert asyncio.run(scenario()) == [low, min(high, low * 2), min(high, low * 4), min(high, low * 4) / 2]
+
+
+def test_cached_responses_honour_upstream_max_age(upstream):
+    upstream.responses = [httpx.Response(200, json=[1], headers={"cache-control": "public, max-age=600", "age": "100"})]
+
+    async def scenario():
+        await http_client.fetch_cached_json(COINGECKO, "/global")
+        return await http_client.fetch_cached_json(COINGECKO, "/global")
+
+    assert asyncio.run(scenario()) == [1]
+    assert len(upstream.requests) == 1
+    assert http_client._response_max_age(http_client._request_key(COINGECKO, "/global", None)) == 500
+
+
+def test_throttled_request_waits_and_retries(upstream):
+    upstream.responses = [httpx.Response(429, headers={"retry-after": "0"}), httpx.Response(200, json=[1])]
+    data = asyncio.run(fetch_json(COINGECKO, "/coins/list"))
+    assert data == [1]
+    assert stale_age(data) is None
+    assert http_client.get_breaker(COINGECKO).allow()
+
+
+def test_repeated_throttling_opens_the_provider_breaker(upstream, monkeypatch):
+    monkeypatch.setattr(http_client, "THROTTLE_PAUSE_SECONDS", 0)
+    upstream.responses = [httpx.Response(429) for _ in range(5)]
+
+    async def scenario():
+        with pytest.raises(httpx.HTTPStatusError):
+            await fetch_json(COINGECKO, "/coins/list")
+        with pytest.raises(httpx.HTTPStatusError):
+            await fetch_json(COINGECKO, "/coins/list")
+        breaker = http_client.get_breaker(COINGECKO)
+        allowed = breaker.allow()
+        breaker.cancel()
+        return allowed
+
+    # Three attempts for the first call; the fifth 429 reaches the ratio.
+    assert not asyncio.run(scenario())
+    assert len(upstream.requests) == 5
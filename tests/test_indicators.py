@@ -0,0 +1,49 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pytest
+
+from indicators import RsiState, rsi
+
+
+@pytest.fixture
+def closes():
+    rng = np.random.default_rng(7)
+    return 100 * np.exp(np.cumsum(rng.normal(0, 0.02, 400)))
+
+
+@pytest.mark.parametrize("period", [2, 14, 30])
+def test_incremental_rsi_matches_batch_rsi(closes, period):
+    seed = period * 5
+    state = RsiState.from_closes(closes[:seed], period)
+    assert state.value == pytest.approx(rsi(closes[:seed], period)[-1])
+    for end in range(seed + 1, len(closes) + 1):
+        state.update(closes[end - 1])
+        assert state.value == pytest.approx(rsi(closes[:end], period)[-1], abs=1e-9)
+
+
+def test_peek_folds_in_a_price_without_committing_it(closes):
+    state = RsiState.from_closes(closes[:100], 14)
+    before = (state.avg_gain, state.avg_loss, state.last_close)
+    assert state.peek(closes[100]) == pytest.approx(rsi(closes[:101], 14)[-1])
+    assert (state.avg_gain, state.avg_loss, state.last_close) == before
+
+
+def test_rsi_is_100_without_losses():
+    closes = np.arange(1.0, 40.0)
+    assert rsi(closes, 14)[-1] == 100.0
+    state = RsiState.from_closes(closes, 14)
+    state.update(closes[-1] + 1)
+    assert state.value == 100.0
@@ -0,0 +1,100 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import threading
+
+import httpx
+import pytest
+
+import coin_index
+import http_client
+from cache import ResponseCache
+from circuit_breaker import stale_age
+from http_client import COINGECKO, fetch_json
+
+
+@pytest.fixture
+def tier(upstream, tmp_path, monkeypatch):
+    monkeypatch.setattr(http_client, "SHARED_STATE_DB", str(tmp_path / "shared.sqlite3"))
+    monkeypatch.setattr(http_client, "PERSISTENT_CACHE", True)
+    monkeypatch.setattr(http_client, "_persisted_endpoints", set())
+    return http_client.enable_persistent_cache()
+
+
+def test_tier_is_only_opened_on_request():
+    assert http_client.cache_tier is None
+
+
+def test_tier_queries_run_on_one_thread_off_the_event_loop(tier, monkeypatch):
+    threads = []
+    connection = tier._connection
+
+    def recording_connection():
+        threads.append(threading.current_thread())
+        return connection()
+
+    monkeypatch.setattr(tier, "_connection", recording_connection)
+
+    async def scenario():
+        await tier.set(("key",), {"value": 1}, 60)
+        return await tier.get(("key",))
+
+    assert asyncio.run(scenario())[0] == {"value": 1}
+    assert len(set(threads)) == 1
+    assert threads[0] is not threading.main_thread()
+
+
+def test_only_registered_endpoints_are_persisted(tier, upstream):
+    http_client.persist_last_good("/global")
+    upstream.responses = [httpx.Response(200, json={"market_cap": 1}), httpx.Response(200, json={"id": "bitcoin"})]
+
+    async def scenario():
+        await fetch_json(COINGECKO, "/global")
+        await fetch_json(COINGECKO, "/coins/bitcoin")
+        # Nothing is written until the flush job runs.
+        assert await tier.get(("last_good", COINGECKO, "/global", ())) is None
+        await http_client.flush_last_good()
+        assert (await tier.get(("last_good", COINGECKO, "/global", ())))[0][1] == {"market_cap": 1}
+        assert await tier.get(("last_good", COINGECKO, "/coins/bitcoin", ())) is None
+
+    asyncio.run(scenario())
+
+
+def test_restarted_bot_falls_back_to_persisted_response(tier, upstream, monkeypatch):
+    http_client.persist_last_good("/global")
+    upstream.responses = [httpx.Response(200, json={"market_cap": 1}), httpx.Response(503)]
+
+    async def scenario():
+        await fetch_json(COINGECKO, "/global")
+        await http_client.flush_last_good()
+        # A new process starts with empty in-memory caches.
+        monkeypatch.setattr(http_client, "last_good", ResponseCache(name="last_good"))
+        return await fetch_json(COINGECKO, "/global")
+
+    data = asyncio.run(scenario())
+    assert data == {"market_cap": 1}
+    assert stale_age(data) is not None
+
+
+def test_coin_index_snapshot_round_trip(tier, monkeypatch):
+    monkeypatch.setattr(coin_index, "coin_index", coin_index.CoinIndex())
+    asyncio.run(coin_index.save_snapshot(
+        [{"id": "bitcoin", "symbol": "btc", "name": "Bitcoin"}],
+        {"bitcoin": 1},
+        [{"id": "bitcoin", "current_price": 1.0}],
+    ))
+    monkeypatch.setattr(coin_index, "coin_index", coin_index.CoinIndex())
+    assert asyncio.run(coin_index.restore_snapshot()) is not None
+    assert coin_index.coin_index.ready
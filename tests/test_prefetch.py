@@ -0,0 +1,74 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import httpx
+import pytest
+
+import http_client
+import prefetch
+from http_client import COINGECKO, fetch_cached_json
+from prefetch import Dataset, Prefetcher
+
+
+@pytest.fixture
+def prefetcher(upstream, clock, monkeypatch):
+    monkeypatch.setattr(http_client, "time", clock)
+    monkeypatch.setattr(prefetch, "time", clock)
+    return Prefetcher({"dominance": Dataset(COINGECKO, "/global")})
+
+
+def test_age_is_measured_from_the_upstream_fetch(prefetcher, upstream, clock):
+    upstream.responses = [httpx.Response(200, json={"market_cap": 1})]
+
+    async def scenario():
+        # Someone else's call leaves the response in the cache...
+        await fetch_cached_json(COINGECKO, "/global")
+        clock.advance(50)
+        # ...and the prefetcher picks it up later.
+        return await prefetcher.get("dominance")
+
+    data, age = asyncio.run(scenario())
+    assert data == {"market_cap": 1}
+    assert age == 50
+
+
+def test_refresh_bypasses_the_response_cache(prefetcher, upstream, clock):
+    upstream.responses = [httpx.Response(200, json={"market_cap": 1}), httpx.Response(200, json={"market_cap": 2})]
+
+    async def scenario():
+        await prefetcher.get("dominance")
+        clock.advance(10)
+        await prefetcher.refresh("dominance")
+        return await prefetcher.get("dominance")
+
+    data, age = asyncio.run(scenario())
+    assert data == {"market_cap": 2}
+    assert age == 0
+    assert len(upstream.requests) == 2
+
+
+def test_stale_refresh_keeps_newer_data(prefetcher, upstream, clock):
+    upstream.responses = [httpx.Response(200, json={"market_cap": 1}), httpx.Response(500)]
+
+    async def scenario():
+        await prefetcher.get("dominance")
+        clock.advance(30)
+        await prefetcher.refresh("dominance")
+        return await prefetcher.get("dominance")
+
+    data, age = asyncio.run(scenario())
+    assert data == {"market_cap": 1}
+    assert age == 30
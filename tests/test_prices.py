@@ -0,0 +1,112 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import httpx
+import pytest
+
+import prices
+import tokens
+from circuit_breaker import CircuitOpenError, mark_stale, stale_age
+from http_client import LastGoodItems
+
+
+def _status_error(status):
+    request = httpx.Request("GET", "https://upstream.test/")
+    return httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+
+
+class FakeUpstream:
+    # Answers each batch from ``quotes`` until ``error`` is set.
+    def __init__(self, quotes):
+        self.quotes = quotes
+        self.error = None
+
+    async def simple_price(self, provider, path, params, priority):
+        if self.error is not None:
+            raise self.error
+        return {coin_id: self.quotes[coin_id] for coin_id in params["ids"].split(",") if coin_id in self.quotes}
+
+    async def dex_tokens(self, provider, path, priority):
+        if self.error is not None:
+            raise self.error
+        addresses = path.rsplit("/", 1)[-1].split(",")
+        return {"pairs": [self.quotes[address.lower()] for address in addresses if address.lower() in self.quotes]}
+
+
+@pytest.fixture
+def coingecko(monkeypatch):
+    upstream = FakeUpstream({"a": {"usd": 1.0}, "b": {"usd": 2.0}, "c": {"usd": 3.0}})
+    monkeypatch.setattr(prices, "fetch_json", upstream.simple_price)
+    monkeypatch.setattr(prices, "last_good_prices", LastGoodItems("test_prices"))
+    return upstream
+
+
+@pytest.fixture
+def dexscreener(monkeypatch):
+    upstream = FakeUpstream({
+        address: {"pairAddress": f"pair-{address}", "baseToken": {"address": address.upper()}} for address in ("0xa", "0xb")
+    })
+    monkeypatch.setattr(tokens, "fetch_json", upstream.dex_tokens)
+    monkeypatch.setattr(tokens, "last_good_pairs", LastGoodItems("test_pairs"))
+    return upstream
+
+
+def test_fetch_prices_keeps_stale_markers_per_coin(monkeypatch):
+    async def fetch_json(provider, path, params, priority):
+        ids = params["ids"].split(",")
+        data = {coin_id: {"usd": 1.0} for coin_id in ids}
+        # The second chunk comes from the stale fallback.
+        return mark_stale(data, 42.0) if "c" in ids else data
+
+    monkeypatch.setattr(prices, "fetch_json", fetch_json)
+    monkeypatch.setattr(prices, "last_good_prices", LastGoodItems("test_prices"))
+    monkeypatch.setattr(prices, "PRICE_BATCH_MAX_IDS", 2)
+    result = asyncio.run(prices.fetch_prices(["a", "b", "c"]))
+    assert {coin_id: stale_age(entry) for coin_id, entry in result.items()} == {"a": None, "b": None, "c": 42.0}
+
+
+def test_failed_batch_falls_back_to_each_coins_last_price(coingecko):
+    asyncio.run(prices.fetch_prices(["a", "b"]))
+    asyncio.run(prices.fetch_prices(["c"]))
+    coingecko.error = CircuitOpenError("coingecko", 30)
+
+    # A batch never seen before, mixing coins from both earlier ones.
+    result = asyncio.run(prices.fetch_prices(["a", "c", "d"]))
+    assert result == {"a": {"usd": 1.0}, "c": {"usd": 3.0}}
+    assert all(stale_age(entry) is not None for entry in result.values())
+
+
+def test_failed_batch_without_any_last_price_raises(coingecko):
+    coingecko.error = _status_error(503)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(prices.fetch_prices(["a"]))
+
+
+def test_client_errors_are_not_answered_stale(coingecko):
+    asyncio.run(prices.fetch_prices(["a"]))
+    coingecko.error = _status_error(400)
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(prices.fetch_prices(["a"]))
+
+
+def test_failed_token_batch_falls_back_to_each_address(dexscreener):
+    asyncio.run(tokens.fetch_token_pairs(["0xA"]))
+    asyncio.run(tokens.fetch_token_pairs(["0xb"]))
+    dexscreener.error = _status_error(502)
+
+    result = asyncio.run(tokens.fetch_token_pairs(["0xa", "0xB", "0xc"]))
+    assert {address: pair["pairAddress"] for address, pair in result.items()} == {"0xa": "pair-0xa", "0xB": "pair-0xb"}
+    assert all(stale_age(pair) is not None for pair in result.values())
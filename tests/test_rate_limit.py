@@ -0,0 +1,99 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+
+import rate_limit
+from rate_limit import MemoryBucketStore, RateLimiter
+
+
+@pytest.fixture(autouse=True)
+def fake_time(clock, monkeypatch):
+    monkeypatch.setattr(rate_limit, "time", clock)
+
+
+def test_limiter_allows_burst_then_refills(clock):
+    limiter = RateLimiter(MemoryBucketStore(), seconds_per_token=1.5, burst=3)
+    assert [limiter.allow(1, "search") for _ in range(4)] == [True, True, True, False]
+    clock.advance(1.5)
+    assert limiter.allow(1, "search")
+    assert not limiter.allow(1, "search")
+
+
+def test_limiter_charges_per_command_cost():
+    limiter = RateLimiter(MemoryBucketStore(), seconds_per_token=1.5, burst=3)
+    assert limiter.allow(1, "rsi")
+    assert not limiter.allow(1, "rsi")
+    assert limiter.allow(1, "search")
+
+
+def test_users_have_separate_buckets():
+    limiter = RateLimiter(MemoryBucketStore(), seconds_per_token=1.5, burst=1)
+    assert limiter.allow(1, "search")
+    assert limiter.allow(2, "search")
+    assert not limiter.allow(1, "search")
+
+
+def test_memory_store_evicts_least_recently_used(clock):
+    store = MemoryBucketStore(max_entries=2)
+    for key in ("a", "b", "c"):
+        store.try_take(key, 1, 3, 1.0, 3600)
+        clock.advance(1)
+    assert len(store) == 2
+    assert "a" not in store._buckets
+
+
+def test_memory_store_drops_idle_buckets(clock):
+    store = MemoryBucketStore()
+    store.try_take("a", 1, 3, 1.0, idle_ttl=3)
+    clock.advance(5)
+    store.try_take("b", 1, 3, 1.0, idle_ttl=3)
+    assert len(store) == 1
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "shared.sqlite3")
+
+
+def test_sqlite_store_is_shared_between_workers(db_path):
+    first, second = rate_limit.SQLiteBucketStore(db_path), rate_limit.SQLiteBucketStore(db_path)
+    assert first.try_take("user:1", 2, 3, 1.0, 3) == 0
+    assert second.try_take("user:1", 2, 3, 1.0, 3) == pytest.approx(1.0)
+
+
+def test_sqlite_store_survives_a_reboot(db_path, clock):
+    store = rate_limit.SQLiteBucketStore(db_path)
+    store.try_take("user:1", 3, 3, 1.0, 3)
+    # The monotonic clock restarts near zero on boot; the wall clock doesn't.
+    clock.monotonic_now = 5.0
+    clock.advance(60)
+    store = rate_limit.SQLiteBucketStore(db_path)
+    assert store.try_take("user:1", 3, 3, 1.0, 3) == 0
+
+
+def test_sqlite_store_resets_rows_stamped_in_the_future(db_path, clock):
+    store = rate_limit.SQLiteBucketStore(db_path)
+    store._db.execute("INSERT INTO buckets VALUES ('user:1', 0, ?)", (clock.now + 864_000,))
+    assert store.try_take("user:1", 1, 3, 1.0, 3) == 0
+
+
+def test_shared_token_bucket_enforces_quota_in_aggregate(db_path, clock):
+    from rate_scheduler import SharedTokenBucket
+
+    workers = [SharedTokenBucket(rate_limit.SQLiteBucketStore(db_path), "upstream:coingecko", 0.5, 2) for _ in range(2)]
+    assert [worker.try_acquire() for worker in workers] == [0, 0]
+    assert workers[0].try_acquire() == pytest.approx(2.0)
+    clock.advance(2)
+    assert workers[1].try_acquire() == 0
@@ -0,0 +1,97 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+
+import pytest
+
+import rate_scheduler
+from rate_scheduler import PRIORITY_BACKGROUND, PRIORITY_INTERACTIVE, ProviderQueue, TokenBucket
+
+
+@pytest.fixture
+def bucket(clock, monkeypatch):
+    monkeypatch.setattr(rate_scheduler, "time", clock)
+    return TokenBucket(rate_per_second=2.0, capacity=3)
+
+
+def test_bucket_starts_full_and_reports_wait_when_empty(bucket):
+    assert [bucket.try_acquire() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+
+def test_bucket_refills_at_rate(bucket, clock):
+    for _ in range(3):
+        bucket.try_acquire()
+    clock.advance(0.5)
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+
+def test_bucket_refill_is_capped_at_capacity(bucket, clock):
+    clock.advance(3600)
+    assert [bucket.try_acquire() for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_interactive_requests_jump_queued_background_work():
+    class EmptyBucket:
+        # Grants one token per call once opened.
+        open = False
+
+        def try_acquire(self, cost=1):
+            return 0.0 if self.open else 0.01
+
+    async def scenario():
+        bucket = EmptyBucket()
+        queue = ProviderQueue(bucket)
+        order = []
+
+        async def request(name, priority):
+            await queue.acquire(priority)
+            order.append(name)
+
+        tasks = [asyncio.ensure_future(request("background", PRIORITY_BACKGROUND))]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.ensure_future(request("interactive", PRIORITY_INTERACTIVE)))
+        await asyncio.sleep(0)
+        bucket.open = True
+        await asyncio.gather(*tasks)
+        queue.close()
+        return order
+
+    assert asyncio.run(scenario()) == ["interactive", "background"]
+
+
+def test_refund_returns_an_unused_token(bucket):
+    for _ in range(3):
+        bucket.try_acquire()
+    bucket.refund()
+    assert bucket.try_acquire() == 0.0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+
+
+def test_refund_never_exceeds_capacity(bucket):
+    bucket.refund(10)
+    assert [bucket.try_acquire() for _ in range(4)][-1] == pytest.approx(0.5)
+
+
+def test_paused_queue_holds_requests_until_the_pause_ends():
+    async def scenario():
+        queue = ProviderQueue(TokenBucket(1000, 1000))
+        queue.pause(0.05)
+        waited = await queue.acquire()
+        queue.close()
+        return waited
+
+    assert asyncio.run(scenario()) >= 0.04
@@ -0,0 +1,59 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import rsi_tracker
+from indicators import MS_PER_DAY, rsi
+from rsi_tracker import RsiTracker
+
+
+class FakeStore:
+    # Daily candles ending with today's open one.
+    def __init__(self, closes):
+        today = time.time() * 1000 // MS_PER_DAY * MS_PER_DAY
+        timestamps = today - MS_PER_DAY * np.arange(len(closes) - 1, -1, -1)
+        self.series = np.column_stack([timestamps, closes, closes, closes, closes])
+
+    async def ensure(self, coin_id, granularity_name, since_ms):
+        return self.get((coin_id, granularity_name))
+
+    def get(self, key):
+        return self.series
+
+
+@pytest.fixture
+def closes(monkeypatch):
+    closes = 100 * np.exp(np.cumsum(np.random.default_rng(3).normal(0, 0.02, 120)))
+    monkeypatch.setattr(rsi_tracker, "timeseries_store", FakeStore(closes))
+    return closes
+
+
+def test_current_includes_the_open_candle(closes):
+    value = asyncio.run(RsiTracker().current("bitcoin", 14))
+    assert value == pytest.approx(rsi(closes, 14)[-1])
+
+
+@pytest.mark.parametrize("days", [1, 7, 14])
+def test_closed_value_looks_back_whole_days(closes, days):
+    tracker = RsiTracker()
+    assert tracker.closed_value("bitcoin", 14, days) == pytest.approx(rsi(closes[:len(closes) - days], 14)[-1])
+
+
+def test_closed_value_needs_a_full_period(closes):
+    assert RsiTracker().closed_value("bitcoin", 14, len(closes) - 10) is None
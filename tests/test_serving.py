@@ -0,0 +1,55 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+from types import SimpleNamespace
+
+import serving
+from serving import command_handler
+
+
+class FakeMessage:
+    def __init__(self):
+        self.replies = []
+
+    async def reply_text(self, text, **kwargs):
+        self.replies.append(text)
+
+
+def test_command_over_its_limit_is_turned_away(monkeypatch):
+    monkeypatch.setitem(serving.COMMAND_CONCURRENCY, "rsi", 1)
+    release = asyncio.Event()
+    handled = []
+
+    async def rsi(update, context):
+        handled.append(update)
+        await release.wait()
+
+    handler = command_handler("rsi", rsi)
+
+    async def scenario():
+        first = SimpleNamespace(effective_message=FakeMessage())
+        second = SimpleNamespace(effective_message=FakeMessage())
+        running = asyncio.ensure_future(handler.callback(first, None))
+        await asyncio.sleep(0)
+        # Returns at once instead of waiting for the running handler.
+        await asyncio.wait_for(handler.callback(second, None), timeout=1)
+        release.set()
+        await running
+        return first, second
+
+    first, second = asyncio.run(scenario())
+    assert handled == [first]
+    assert first.effective_message.replies == []
+    assert "busy" in second.effective_message.replies[0]
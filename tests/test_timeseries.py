@@ -0,0 +1,89 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import time
+
+import numpy as np
+import pytest
+
+import timeseries
+from circuit_breaker import mark_stale
+from indicators import MS_PER_DAY
+from timeseries import CLOSE, TimeSeriesStore
+
+
+STALE_AGE = 600
+
+
+class FakeOhlc:
+    def __init__(self):
+        self.calls = 0
+        self.stale = False
+
+    async def __call__(self, provider, path, params=None):
+        self.calls += 1
+        now_ms = time.time() * 1000
+        if self.stale:
+            now_ms -= STALE_AGE * 1000
+        rows = [[now_ms - hours * 3_600_000, 1.0, 2.0, 0.5, float(self.calls)] for hours in range(24, -1, -1)]
+        return mark_stale(rows, STALE_AGE) if self.stale else rows
+
+
+@pytest.fixture
+def ohlc(monkeypatch):
+    ohlc = FakeOhlc()
+    monkeypatch.setattr(timeseries, "fetch_json", ohlc)
+    return ohlc
+
+
+def _ensure(store):
+    return asyncio.run(store.ensure("bitcoin", "30m", time.time() * 1000 - MS_PER_DAY / 2))
+
+
+def test_fresh_series_is_served_locally_until_due(tmp_path, ohlc):
+    store = TimeSeriesStore(str(tmp_path))
+    _ensure(store)
+    window = _ensure(store)
+    assert ohlc.calls == 1
+    assert window[-1, CLOSE] == 1.0
+
+
+def test_stale_rows_are_merged_but_refetched_next_time(tmp_path, ohlc):
+    store = TimeSeriesStore(str(tmp_path))
+    ohlc.stale = True
+    assert len(_ensure(store))
+    ohlc.stale = False
+    window = _ensure(store)
+    assert ohlc.calls == 2
+    assert window[-1, CLOSE] == 2.0
+
+
+def test_stale_rows_never_replace_newer_candles(tmp_path, ohlc):
+    store = TimeSeriesStore(str(tmp_path))
+    _ensure(store)
+    fresh = store.get(("bitcoin", "30m")).copy()
+    # Due for a refresh, but the upstream fails and answers from an older
+    # last good response.
+    store._fetched_at[("bitcoin", "30m")] = 0
+    ohlc.stale = True
+    ohlc.calls = 8
+    _ensure(store)
+    assert ohlc.calls == 9
+    np.testing.assert_array_equal(store.get(("bitcoin", "30m")), fresh)
+    assert store.stale_age("bitcoin", "30m") == pytest.approx(STALE_AGE, abs=5)
+
+    ohlc.stale = False
+    _ensure(store)
+    assert store.stale_age("bitcoin", "30m") is None
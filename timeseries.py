@@ -0,0 +1,190 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Local OHLC store keyed by (coin, granularity). Each series is an (n, 5)
+# float64 array of [timestamp_ms, open, high, low, close] rows kept sorted by
+# timestamp and saved as .npy files that are reopened memory-mapped, so
+# reads are zero-copy slices. The last row of a series is the still-open
+# candle and is replaced by the next fetch.
+
+import asyncio
+import math
+import os
+import re
+import time
+from dataclasses import dataclass
+
+import numpy as np
+
+from circuit_breaker import stale_age
+from http_client import COINGECKO, fetch_json
+from indicators import MS_PER_DAY
+from tracing import span
+
+
+TIMESERIES_DIR = os.getenv("TIMESERIES_DIR", os.path.join("data", "timeseries"))
+
+TIMESTAMP, OPEN, HIGH, LOW, CLOSE = range(5)
+_EMPTY = np.empty((0, 5), dtype=np.float64)
+# Windows are computed from the caller's clock slightly before the fetch, so
+# allow some slack before rounding a span up to the next whole day.
+_SLACK_MS = 60_000
+
+
+@dataclass(frozen=True)
+class Granularity:
+    name: str
+    # Seconds before the open candle is considered stale and refetched.
+    refresh_seconds: int
+    # ``days`` values the upstream accepts for this candle size, or None for any.
+    allowed_days: tuple = None
+
+
+# CoinGecko picks the candle size from ``days``: /ohlc returns 30-minute
+# candles for 1 day and 4-hour candles for 7-30 days; /market_chart with
+# interval=daily returns one close per day for any range.
+GRANULARITIES = {
+    "30m": Granularity("30m", 300, allowed_days=(1,)),
+    "4h": Granularity("4h", 900, allowed_days=(7, 14, 30)),
+    "1d": Granularity("1d", 300),
+}
+
+
+def _fetch_days(granularity, span_ms):
+    days = max(1, math.ceil((span_ms - _SLACK_MS) / MS_PER_DAY))
+    if granularity.allowed_days is None:
+        return days
+    return next((allowed for allowed in granularity.allowed_days if allowed >= days), granularity.allowed_days[-1])
+
+
+async def _fetch_rows(coin_id, granularity, days):
+    # Returns the rows and their stale age (None unless they came from the
+    # stale fallback).
+    if granularity.name == "1d":
+        chart_data = await fetch_json(COINGECKO, f"/coins/{coin_id}/market_chart", params={
+            "vs_currency": "usd",
+            "days": days,
+            "interval": "daily",
+        })
+        prices = np.asarray(chart_data.get("prices", []), dtype=np.float64).reshape(-1, 2)
+        return prices[:, [0, 1, 1, 1, 1]], stale_age(chart_data)
+
+    ohlc_data = await fetch_json(COINGECKO, f"/coins/{coin_id}/ohlc", params={"vs_currency": "usd", "days": days})
+    return np.asarray(ohlc_data, dtype=np.float64).reshape(-1, 5), stale_age(ohlc_data)
+
+
+class TimeSeriesStore:
+    def __init__(self, directory=TIMESERIES_DIR):
+        self.directory = directory
+        self._series = {}
+        self._fetched_at = {}
+        self._earliest_requested = {}
+        # When the last good response a series was last served from was
+        # fetched; cleared by the next fresh fetch.
+        self._stale_fetched_at = {}
+        self._locks = {}
+
+    def _path(self, key):
+        coin_id, granularity = key
+        safe_id = re.sub(r"[^A-Za-z0-9_.-]", "_", coin_id)
+        return os.path.join(self.directory, f"{safe_id}__{granularity}.npy")
+
+    def get(self, key):
+        series = self._series.get(key)
+        if series is None:
+            path = self._path(key)
+            series = np.load(path, mmap_mode="r") if os.path.exists(path) else _EMPTY
+            self._series[key] = series
+        return series
+
+    def window(self, key, since_ms):
+        series = self.get(key)
+        start = np.searchsorted(series[:, TIMESTAMP], since_ms, side="left")
+        return series[start:]
+
+    def merge(self, key, rows):
+        if not len(rows):
+            return self.get(key)
+        rows = rows[np.argsort(rows[:, TIMESTAMP], kind="stable")]
+        series = self.get(key)
+        # Everything from the first fetched timestamp onwards is replaced,
+        # which also drops the previous open candle.
+        keep = np.searchsorted(series[:, TIMESTAMP], rows[0, TIMESTAMP], side="left")
+        merged = np.concatenate([series[:keep], rows])
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = self._path(key)
+        tmp_path = f"{path}.tmp.npy"
+        np.save(tmp_path, merged)
+        os.replace(tmp_path, path)
+        self._series[key] = np.load(path, mmap_mode="r")
+        return self._series[key]
+
+    def _missing_span(self, key, granularity, since_ms, now_ms):
+        series = self.get(key)
+        if not len(series):
+            return now_ms - since_ms
+
+        if since_ms < self._earliest_requested.get(key, series[0, TIMESTAMP]):
+            return now_ms - since_ms
+
+        fetched_at = self._fetched_at.get(key)
+        if fetched_at is None:
+            # After a restart the file's modification time stands in for the
+            # last fetch, so a series fetched just before isn't fetched again.
+            path = self._path(key)
+            fetched_at = self._fetched_at[key] = os.path.getmtime(path) if os.path.exists(path) else 0
+        if time.time() - fetched_at < granularity.refresh_seconds:
+            return 0
+        # Refetch from the last closed candle so the open one is replaced.
+        last_closed = series[-2, TIMESTAMP] if len(series) > 1 else series[-1, TIMESTAMP]
+        return now_ms - last_closed
+
+    def stale_age(self, coin_id, granularity_name):
+        # Seconds since the data behind a series was fetched when the last
+        # refresh fell back to a stale response, else None.
+        fetched_at = self._stale_fetched_at.get((coin_id, granularity_name))
+        return None if fetched_at is None else time.time() - fetched_at
+
+    async def ensure(self, coin_id, granularity_name, since_ms):
+        granularity = GRANULARITIES[granularity_name]
+        key = (coin_id, granularity_name)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            now_ms = time.time() * 1000
+            span_ms = self._missing_span(key, granularity, since_ms, now_ms)
+            if span_ms > 0:
+                with span(f"timeseries.fetch {granularity_name}"):
+                    rows, age = await _fetch_rows(coin_id, granularity, _fetch_days(granularity, span_ms))
+                if age is None:
+                    self.merge(key, rows)
+                    self._fetched_at[key] = time.time()
+                    self._earliest_requested[key] = min(since_ms, self._earliest_requested.get(key, since_ms))
+                    self._stale_fetched_at.pop(key, None)
+                else:
+                    # A last good response can be older than what is on
+                    # disk, and merge() replaces everything from its first
+                    # row on; only keep rows past the stored series. The next
+                    # call tries the upstream again rather than wait out
+                    # refresh_seconds (or trust the mtime merge just set).
+                    series = self.get(key)
+                    if len(series):
+                        rows = rows[rows[:, TIMESTAMP] > series[-1, TIMESTAMP]]
+                    self.merge(key, rows)
+                    self._fetched_at.setdefault(key, 0)
+                    self._stale_fetched_at[key] = time.time() - age
+        return self.window(key, since_ms)
+
+
+timeseries_store = TimeSeriesStore()
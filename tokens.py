@@ -0,0 +1,80 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+
+import os
+
+import httpx
+
+from batching import MicroBatcher
+from circuit_breaker import is_unavailable, mark_stale, stale_age
+from http_client import DEXSCREENER, LastGoodItems, fetch_json
+from rate_scheduler import PRIORITY_INTERACTIVE
+from tracing import span
+
+
+# Lookups arriving within this window share one /latest/dex/tokens call.
+TOKEN_BATCH_WINDOW_MS = int(os.getenv("TOKEN_BATCH_WINDOW_MS", "50"))
+# DexScreener accepts at most 30 comma-separated addresses per request.
+TOKEN_BATCH_MAX_ADDRESSES = 30
+
+
+last_good_pairs = LastGoodItems("last_good_pairs")
+
+
+async def fetch_token_pairs(addresses, priority=PRIORITY_INTERACTIVE):
+    # Maps every address to its first pair (the upstream lists the most
+    # liquid first), or leaves it out when DexScreener knows no pair for it.
+    # EVM addresses are matched case-insensitively.
+    wanted = {}
+    for address in addresses:
+        wanted.setdefault(address.lower(), []).append(address)
+    addresses = sorted(set(addresses))
+    pairs = {}
+    for start in range(0, len(addresses), TOKEN_BATCH_MAX_ADDRESSES):
+        chunk = addresses[start:start + TOKEN_BATCH_MAX_ADDRESSES]
+        try:
+            data = await fetch_json(DEXSCREENER, f"/latest/dex/tokens/{','.join(chunk)}", priority=priority)
+        except httpx.HTTPError as e:
+            # No last good response for this exact batch: fall back to each
+            # address's own last good pair.
+            found = last_good_pairs.recall(address.lower() for address in chunk) if is_unavailable(e) else None
+            if not found:
+                raise
+        else:
+            age = stale_age(data)
+            found = {}
+            for pair in data.get("pairs") or []:
+                for side in ("baseToken", "quoteToken"):
+                    token_address = ((pair.get(side) or {}).get("address") or "").lower()
+                    if token_address in wanted and token_address not in found:
+                        found[token_address] = pair if age is None else mark_stale(pair, age)
+            if age is None:
+                last_good_pairs.remember(found)
+            else:
+                # An address's own last good pair is at least as recent.
+                found.update(last_good_pairs.recall(address.lower() for address in chunk))
+
+        for token_address, pair in found.items():
+            for address in wanted[token_address]:
+                pairs.setdefault(address, pair)
+    return pairs
+
+
+token_batcher = MicroBatcher(fetch_token_pairs, TOKEN_BATCH_WINDOW_MS / 1000, TOKEN_BATCH_MAX_ADDRESSES)
+
+
+async def get_token_pair(address):
+    with span("token_batch"):
+        return await token_batcher.get(address)
@@ -0,0 +1,111 @@
+# Copyright 2024 plilian
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Per-handler phase timing. Every handler runs inside a trace; code on the
+# hot path wraps its phases in ``with span("name"):``. Traces slower than
+# SLOW_TRACE_SECONDS are kept in a ring buffer and can be downloaded in the
+# Chrome trace event format (chrome://tracing, https://ui.perfetto.dev) from
+# the metrics server at /debug/traces. Outside a handler a span is a no-op.
+
+import contextvars
+import os
+import time
+from collections import deque
+
+
+SLOW_TRACE_SECONDS = float(os.getenv("SLOW_TRACE_SECONDS", "1.0"))
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+
+_current = contextvars.ContextVar("trace", default=None)
+slow_traces = deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+class Trace:
+    __slots__ = ("name", "started", "wall_started", "duration", "spans", "_token")
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.perf_counter()
+        self.wall_started = time.time()
+        self.duration = None
+        # (name, start offset, duration) in seconds, appended on span exit.
+        self.spans = []
+        self._token = None
+
+
+class _Span:
+    __slots__ = ("trace", "name", "started")
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        ended = time.perf_counter()
+        self.trace.spans.append((self.name, self.started - self.trace.started, ended - self.started))
+        return False
+
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NO_SPAN = _NoSpan()
+
+
+def span(name):
+    trace = _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name)
+
+
+def start(name):
+    trace = Trace(name)
+    trace._token = _current.set(trace)
+    return trace
+
+
+def finish(trace):
+    trace.duration = time.perf_counter() - trace.started
+    _current.reset(trace._token)
+    if trace.duration >= SLOW_TRACE_SECONDS:
+        slow_traces.append(trace)
+
+
+def export_chrome_trace(traces=None):
+    # One "thread" per trace so concurrent handlers don't overlap.
+    traces = list(slow_traces if traces is None else traces)
+    pid = os.getpid()
+    events = []
+    for tid, trace in enumerate(traces, start=1):
+        base = trace.wall_started * 1e6
+        events.append({"ph": "M", "name": "thread_name", "pid": pid, "tid": tid,
+                       "args": {"name": f"{trace.name} ({trace.duration * 1000:.0f} ms)"}})
+        events.append({"ph": "X", "name": trace.name, "cat": "handler", "pid": pid, "tid": tid,
+                       "ts": base, "dur": trace.duration * 1e6})
+        for name, offset, duration in trace.spans:
+            events.append({"ph": "X", "name": name, "cat": "phase", "pid": pid, "tid": tid,
+                           "ts": base + offset * 1e6, "dur": duration * 1e6})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}